@@ -3,6 +3,9 @@ import logging
 import os
 import shutil
 import subprocess
+import threading
+import time
+import uuid
 import zipfile
 from enum import Enum
 from functools import wraps
@@ -55,7 +58,7 @@ def download_file(url, download_dir=None):
 
     download_dir = download_dir or settings.EXPORT_STAGING_ROOT
     file_location = os.path.join(download_dir, normalize_name(os.path.basename(url)))
-    r = requests.get(url, stream=True)
+    r = get_or_update_session().get(url, stream=True)
     if r.status_code == 200:
         with open(file_location, "wb") as f:
             for chunk in r:
@@ -124,6 +127,23 @@ def load_land_vectors(db_conn=None, url=None):
     if exit_code:
         logger.error("There was an error importing the land data.")
 
+    land_data_file = getattr(settings, "LAND_DATA_FILE", None)
+    if land_data_file:
+        # The geopackage is written to a temporary file first so that running exports never see a partial file.
+        temp_file = "{0}.{1}.gpkg".format(os.path.splitext(land_data_file)[0], uuid.uuid4())
+        cmd = (
+            'ogr2ogr -s_srs EPSG:3857 -t_srs EPSG:4326 -f "GPKG" -nln land_polygons -lco SPATIAL_INDEX=YES '
+            "{temp_file} {file}".format(temp_file=temp_file, file=file_name)
+        )
+        logger.info("Loading land data into {0}...".format(land_data_file))
+        os.makedirs(os.path.dirname(land_data_file), exist_ok=True)
+        if subprocess.call(cmd, shell=True):
+            logger.error("There was an error loading the land data into {0}.".format(land_data_file))
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        else:
+            os.replace(temp_file, land_data_file)
+
     if file_dir:
         shutil.rmtree(file_dir)
     os.remove(download_filename)
@@ -150,6 +170,7 @@ def handle_auth(func):
             kwargs["cert_path"] = cert_path
             kwargs["cert_pass"] = cert_pass
             cred_var = kwargs.pop("cred_var", None) or kwargs.pop("slug", None)
+            kwargs["cred_var"] = cred_var
             url = kwargs.get("url")
             cred = auth_requests.get_cred(cred_var=cred_var, url=url, params=kwargs.get("params", None))
             if cred:
@@ -166,33 +187,132 @@ def handle_auth(func):
     return wrapper
 
 
+class PooledSession(requests.Session):
+    """
+    A session whose adapters (and so its connection pools) are shared with other sessions for the same provider.
+    Closing the session only closes the adapters which aren't pooled, so it can still be used as a context manager.
+    """
+
+    def close(self):
+        with _adapter_pool_lock:
+            pooled_adapters = {adapter for adapter, _ in _adapter_pool.values()}
+        for adapter in self.adapters.values():
+            if adapter not in pooled_adapters:
+                adapter.close()
+
+
+# The HTTP adapters for this worker, keyed on the provider and the cert used, as {key: (adapter, last_used)}.
+_adapter_pool = {}
+_adapter_pool_lock = threading.Lock()
+_adapter_pool_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_adapter_pool_stats() -> dict:
+    """
+    :return: The number of adapters in the pool, and the number of pool hits, misses and evictions for this worker.
+    """
+    with _adapter_pool_lock:
+        return dict(_adapter_pool_stats, size=len(_adapter_pool))
+
+
+def clear_adapter_pool():
+    """
+    Closes and removes all of the pooled adapters.
+    """
+    with _adapter_pool_lock:
+        for adapter, _ in _adapter_pool.values():
+            adapter.close()
+        _adapter_pool.clear()
+
+
+def _evict_idle_adapters(now: float):
+    """
+    Closes any adapters which haven't been used within HTTP_POOL_IDLE_TIMEOUT, the caller must hold the pool lock.
+    Connections which are in use when the adapter is closed are discarded once they're released.
+    """
+    idle_timeout = getattr(settings, "HTTP_POOL_IDLE_TIMEOUT", 300)
+    for key, (adapter, last_used) in list(_adapter_pool.items()):
+        if now - last_used > idle_timeout:
+            adapter.close()
+            del _adapter_pool[key]
+            _adapter_pool_stats["evictions"] += 1
+
+
+def get_pooled_adapter(key: tuple, adapter_factory, pool_size: int):
+    """
+    Gets an adapter from the pool, creating it if it doesn't exist or if its connection pool is too small.
+    :param key: A hashable key for the provider and credentials that the adapter is used for.
+    :param adapter_factory: A callable which takes the pool size and returns a new adapter.
+    :param pool_size: The number of connections to keep alive for each host.
+    :return: An HTTPAdapter.
+    """
+    now = time.monotonic()
+    with _adapter_pool_lock:
+        _evict_idle_adapters(now)
+        adapter, _ = _adapter_pool.get(key, (None, None))
+        if adapter and adapter._pool_maxsize >= pool_size:
+            _adapter_pool_stats["hits"] += 1
+        else:
+            # The replaced adapter is left open for any sessions which are still using it.
+            adapter = adapter_factory(pool_size)
+            _adapter_pool_stats["misses"] += 1
+        _adapter_pool[key] = (adapter, now)
+        return adapter
+
+
 @handle_auth
-def get_or_update_session(session=None, max_retries=3, headers=None, cookie=None, **auth_info):
+def get_or_update_session(
+    session=None, max_retries=3, headers=None, cookie=None, pool_size=None, **auth_info
+) -> requests.Session:
+    """
+    Gets a session with the provider's credentials.  The adapters are shared by all of the sessions for the same
+    provider and cert in this worker, so connections (and TLS handshakes) are reused between requests and tasks.
+    :param session: Optionally an existing session to update.
+    :param pool_size: The number of connections to keep alive for each host, defaults to HTTP_POOL_MAXSIZE.
+    """
     username = auth_info.get("username")
     password = auth_info.get("password")
     cert_path = auth_info.get("cert_path")
     cert_pass = auth_info.get("cert_pass")
+    cred_var = auth_info.get("cred_var")
     ssl_verify = getattr(settings, "SSL_VERIFICATION", True)
+    pool_size = int(pool_size or getattr(settings, "HTTP_POOL_MAXSIZE", requests.adapters.DEFAULT_POOLSIZE))
 
     if not session:
-        session = requests.Session()
+        session = PooledSession()
 
+    adapter = None
     if username and password:
         logger.debug(f"setting {username} and {password} for session")
         session.auth = (username, password)
-        adapter = requests.adapters.HTTPAdapter(max_retries=max_retries)
+        adapter = get_pooled_adapter(
+            (cred_var, None, max_retries),
+            lambda size: requests.adapters.HTTPAdapter(max_retries=max_retries, pool_maxsize=size),
+            pool_size,
+        )
         session.mount("http://", adapter)
         session.mount("https://", adapter)
 
     if cert_path and cert_pass:
         try:
-            adapter = requests_pkcs12.Pkcs12Adapter(
-                pkcs12_filename=cert_path, pkcs12_password=cert_pass, max_retries=max_retries,
+            adapter = get_pooled_adapter(
+                (cred_var, (cert_path, cert_pass), max_retries),
+                lambda size: requests_pkcs12.Pkcs12Adapter(
+                    pkcs12_filename=cert_path, pkcs12_password=cert_pass, max_retries=max_retries, pool_maxsize=size,
+                ),
+                pool_size,
             )
             session.mount("https://", adapter)
         except FileNotFoundError:
             logger.error("No cert found at path {}".format(cert_path))
 
+    if not adapter:
+        adapter = get_pooled_adapter(
+            (cred_var, None, None), lambda size: requests.adapters.HTTPAdapter(pool_maxsize=size), pool_size
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
     if cookie:
         session.cookies.set(**cookie)
 
@@ -7,7 +7,14 @@ from unittest.mock import patch, MagicMock, Mock
 
 from django.test import TestCase, override_settings
 
-from eventkit_cloud.core.helpers import get_id, get_cached_model, get_model_by_params, get_or_update_session
+from eventkit_cloud.core.helpers import (
+    get_id,
+    get_cached_model,
+    get_model_by_params,
+    get_or_update_session,
+    get_adapter_pool_stats,
+    clear_adapter_pool,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -59,3 +66,41 @@ class TestCoreHelpers(TestCase):
         self.assertEqual(len(session.adapters), 2)
         self.assertTrue(expected_headers.items() <= dict(session.headers).items())
         self.assertEqual(session.verify, 10)
+
+    @patch("eventkit_cloud.core.helpers.time")
+    @patch("eventkit_cloud.utils.auth_requests.get_cred")
+    def test_get_or_update_session_pool(self, mock_get_cred, mock_time):
+        mock_get_cred.return_value = None
+        mock_time.monotonic.return_value = 0
+        clear_adapter_pool()
+        self.addCleanup(clear_adapter_pool)
+
+        with self.settings(HTTP_POOL_MAXSIZE=4, HTTP_POOL_IDLE_TIMEOUT=300):
+            first_session = get_or_update_session(slug="abc")
+            second_session = get_or_update_session(slug="abc", cookie={"name": "test", "value": "value"})
+            other_session = get_or_update_session(slug="def")
+
+            # Each session has its own state, but they share the provider's connection pool.
+            self.assertIsNot(first_session, second_session)
+            self.assertEqual(0, len(first_session.cookies))
+            self.assertIs(first_session.get_adapter("https://"), second_session.get_adapter("https://"))
+            self.assertIsNot(first_session.get_adapter("https://"), other_session.get_adapter("https://"))
+            self.assertEqual(4, first_session.get_adapter("https://")._pool_maxsize)
+            self.assertEqual({"hits": 1, "misses": 2, "evictions": 0, "size": 2}, get_adapter_pool_stats())
+
+            # Closing a session doesn't close the shared pool.
+            adapter = first_session.get_adapter("https://")
+            with patch.object(adapter, "close") as mock_close:
+                first_session.close()
+                mock_close.assert_not_called()
+
+            # A larger pool size replaces the adapter.
+            larger_session = get_or_update_session(slug="abc", pool_size=8)
+            self.assertEqual(8, larger_session.get_adapter("https://")._pool_maxsize)
+
+            # Unused adapters are evicted.
+            mock_time.monotonic.return_value = 301
+            get_or_update_session(slug="abc")
+            stats = get_adapter_pool_stats()
+            self.assertEqual(2, stats["evictions"])
+            self.assertEqual(1, stats["size"])
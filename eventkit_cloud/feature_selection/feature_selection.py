@@ -1,12 +1,15 @@
+import copy
 import re
 import unicodedata
+from collections import namedtuple
+from functools import lru_cache
 
 import yaml
 from yaml.constructor import ConstructorError
 from yaml.parser import ParserError
 from yaml.scanner import ScannerError
 
-from .sql import SQLValidator
+from .sql import SQLValidator, NotNull, Or, combine, compile_where, quote_literal
 
 import logging
 
@@ -20,6 +23,15 @@ geom {1},
 );
 INSERT INTO {0}(geom, {3}) select geom, {3} from {4} WHERE ({5});
 """
+# Evaluates the filters of every theme for each feature in a single scan of the source table, so that the theme tables
+# can be filled by rowid instead of each scanning the whole source table.
+ROUTE_TEMPLATE = """CREATE TEMP TABLE {0} AS
+SELECT route.route_index AS route_index, src.rowid AS src_rowid
+FROM {1} AS src CROSS JOIN ({2}) AS route
+WHERE CASE route.route_index {3} END;
+CREATE INDEX {0}_route_index ON {0}(route_index, src_rowid);
+"""
+ROUTE_FILTER_TEMPLATE = "rowid IN (SELECT src_rowid FROM {0} WHERE route_index = {1})"
 INDEX_TEMPLATE = """
 INSERT INTO gpkg_contents (table_name, data_type,identifier,srs_id) VALUES ('{0}','features','{0}','4326');
 INSERT INTO gpkg_geometry_columns VALUES ('{0}', 'geom', '{1}', '4326', '0', '0');
@@ -28,6 +40,38 @@ SELECT gpkgAddSpatialIndex('{0}', 'geom');
 UPDATE '{0}' SET geom=AsGPB(geom);
 """
 
+# The z_index of a feature is the sum of the scores of its tags, and is used to order features when they're drawn.
+# The scores of a tag are either a score for each of its "values", a score if the tag is "present", or a "factor" of its
+# numeric value.  A provider's config can override them with "z_index_scores".
+DEFAULT_Z_INDEX_SCORES = {
+    "highway": {
+        "values": {
+            "path": 3,
+            "track": 3,
+            "footway": 3,
+            "minor": 3,
+            "road": 3,
+            "service": 3,
+            "unclassified": 3,
+            "residential": 3,
+            "tertiary_link": 4,
+            "tertiary": 4,
+            "secondary_link": 6,
+            "secondary": 6,
+            "primary_link": 7,
+            "primary": 7,
+            "trunk_link": 8,
+            "trunk": 8,
+            "motorway_link": 9,
+            "motorway": 9,
+        }
+    },
+    "railway": {"present": 5},
+    "layer": {"factor": 10},
+    "bridge": {"values": {"yes": 10, "true": 10, "1": 10}},
+    "tunnel": {"values": {"yes": -10, "true": -10, "1": -10}},
+}
+
 WKT_TYPE_MAP = {
     "points": "POINT",
     "lines": "MULTILINESTRING",
@@ -81,78 +125,138 @@ def slugify(s):
     return slug
 
 
+CompiledFeatureSelection = namedtuple("CompiledFeatureSelection", ["doc", "errors", "keys_from_sql", "filters"])
+
+
+@lru_cache(maxsize=128)
+def compile_feature_selection(raw_doc):
+    """
+    Parses and validates a feature selection, and compiles the filter of each theme.
+    The result is cached by the raw document, so that a preset is only compiled once per process.
+    :param raw_doc: The feature selection YAML.
+    :return: A CompiledFeatureSelection, the doc is None if the feature selection is invalid.
+    """
+    errors = []
+    keys_from_sql = {}
+    filters = {}
+
+    def validate_schema(loaded_doc):
+        if not isinstance(loaded_doc, dict):
+            errors.append("YAML must be dict, not list")
+            return False
+        for theme, theme_dict in loaded_doc.items():
+            if theme in BANNED_THEME_NAMES or theme.startswith("gpkg_") or theme.startswith("rtree_"):
+                errors.append("Theme name reserved: {0}".format(theme))
+                return False
+            if not re.match("^[a-zA-Z0-9_ ]+$", theme):
+                errors.append("Each theme must be named using only characters, numbers, underscores and spaces")
+                return False
+            if "select" not in theme_dict:
+                errors.append("Each theme must have a 'select' key")
+                return False
+            for key in theme_dict["select"]:
+                if not key:
+                    errors.append("Missing OSM key")
+                    return False
+                if not re.match("[a-zA-Z0-9 _\\:]+$", key):
+                    errors.append("Invalid OSM key: {0}".format(key))
+                    return False
+            if not isinstance(theme_dict["select"], list):
+                errors.append("'select' children must be list elements (e.g. '- amenity')")
+                return False
+
+            keys_from_sql[theme] = set()
+            if "where" in theme_dict:
+                if not isinstance(theme_dict["where"], list):
+                    clauses = [theme_dict["where"]]
+                else:
+                    clauses = theme_dict["where"]
+                for clause in clauses:
+                    s = SQLValidator(clause)
+                    if not s.valid:
+                        errors.append("SQL WHERE Invalid: " + ";".join(s.errors))
+                        return False
+
+                    # also add the keys to keys_from_sql
+                    for k in s.column_names:
+                        keys_from_sql[theme].add(k)
+                filters[theme] = combine(Or, [compile_where(clause) for clause in clauses])
+            else:
+                filters[theme] = combine(Or, [NotNull(key) for key in theme_dict["select"]])
+
+        return True
+
+    try:
+        loaded_doc = yaml.safe_load(raw_doc)
+        if validate_schema(loaded_doc):
+            return CompiledFeatureSelection(loaded_doc, (), keys_from_sql, filters)
+    except (ConstructorError, ScannerError, ParserError) as e:
+        errors.append(e.problem)
+    return CompiledFeatureSelection(None, tuple(errors), {}, {})
+
+
+def validate_z_index_scores(z_index_scores):
+    """
+    :param z_index_scores: A dict of z_index scores, see DEFAULT_Z_INDEX_SCORES.
+    :return: The z_index scores with the values as strings and the scores as integers.
+    """
+    validated_scores = {}
+    for key, key_scores in z_index_scores.items():
+        if not re.match("[a-zA-Z0-9 _\\:]+$", key):
+            raise ValueError("Invalid OSM key in z_index_scores: {0}".format(key))
+        if "values" in key_scores:
+            validated_scores[key] = {
+                "values": {str(value): int(score) for value, score in key_scores["values"].items()}
+            }
+        elif "present" in key_scores:
+            validated_scores[key] = {"present": int(key_scores["present"])}
+        elif "factor" in key_scores:
+            validated_scores[key] = {"factor": int(key_scores["factor"])}
+        else:
+            raise ValueError("The z_index scores of {0} must have values, present or factor.".format(key))
+    return validated_scores
+
+
 # FeatureSelection serializes as YAML.
 # It describes a set of tables (themes)
 # to create in a Spatialite database.
 class FeatureSelection(object):
     @staticmethod
-    def example(config):
-        f = FeatureSelection(config)
+    def example(config, z_index_scores=None):
+        f = FeatureSelection(config, z_index_scores=z_index_scores)
         assert f.valid
         return f
 
-    def __init__(self, raw_doc):
+    def __init__(self, raw_doc, z_index_scores=None):
+        """
+        :param raw_doc: The feature selection YAML.
+        :param z_index_scores: The scores used to compute the z_index, defaults to DEFAULT_Z_INDEX_SCORES.
+        """
         self._raw_doc = raw_doc
+        self.z_index_scores = validate_z_index_scores(z_index_scores or DEFAULT_Z_INDEX_SCORES)
         self._doc = None
         self._errors = []
+        self._filters = {}
+        self._key_unions = {}
         self.keys_from_sql = {}
 
     @property
     def doc(self):
-        def validate_schema(loaded_doc):
-            if not isinstance(loaded_doc, dict):
-                self._errors.append("YAML must be dict, not list")
-                return False
-            for theme, theme_dict in loaded_doc.items():
-                if theme in BANNED_THEME_NAMES or theme.startswith("gpkg_") or theme.startswith("rtree_"):
-                    self._errors.append("Theme name reserved: {0}".format(theme))
-                    return False
-                if not re.match("^[a-zA-Z0-9_ ]+$", theme):
-                    self._errors.append(
-                        "Each theme must be named using only characters, numbers, underscores and spaces"
-                    )
-                    return False
-                if "select" not in theme_dict:
-                    self._errors.append("Each theme must have a 'select' key")
-                    return False
-                for key in theme_dict["select"]:
-                    if not key:
-                        self._errors.append("Missing OSM key")
-                        return False
-                    if not re.match("[a-zA-Z0-9 _\:]+$", key):
-                        self._errors.append("Invalid OSM key: {0}".format(key))
-                        return False
-                if not isinstance(theme_dict["select"], list):
-                    self._errors.append("'select' children must be list elements (e.g. '- amenity')")
-                    return False
-
-                self.keys_from_sql[theme] = set()
-                if "where" in theme_dict:
-                    if not isinstance(theme_dict["where"], list):
-                        clauses = [theme_dict["where"]]
-                    else:
-                        clauses = theme_dict["where"]
-                    for clause in clauses:
-                        s = SQLValidator(clause)
-                        if not s.valid:
-                            self._errors.append("SQL WHERE Invalid: " + ";".join(s.errors))
-                            return False
-
-                        # also add the keys to keys_from_sql
-                        for k in s.column_names:
-                            self.keys_from_sql[theme].add(k)
-
-            return True
-
         if self._doc:
             return self._doc
-        try:
-            loaded_doc = yaml.safe_load(self._raw_doc)
-            if validate_schema(loaded_doc):
-                self._doc = loaded_doc
-                return self._doc
-        except (ConstructorError, ScannerError, ParserError) as e:
-            self._errors.append(e.problem)
+        if isinstance(self._raw_doc, str):
+            # The cached result is shared by every FeatureSelection, so each one gets its own copy to modify.
+            compiled = copy.deepcopy(compile_feature_selection(self._raw_doc))
+        else:
+            # Only documents which can be hashed are cached.
+            compiled = compile_feature_selection.__wrapped__(self._raw_doc)
+        if compiled.doc is None:
+            self._errors.extend(compiled.errors)
+            return None
+        self._doc = compiled.doc
+        self._filters = compiled.filters
+        self.keys_from_sql = compiled.keys_from_sql
+        return self._doc
 
     @property
     def valid(self):
@@ -188,6 +292,26 @@ class FeatureSelection(object):
             return theme["where"]
         return " OR ".join(['"' + x + '" IS NOT NULL' for x in theme["select"]])
 
+    def filter(self, theme):
+        """
+        :param theme: The name of a theme.
+        :return: The compiled filter of the theme, see filter_clause.
+        """
+        return self._filters[theme]
+
+    def matching_themes(self, tags, geom_type=None):
+        """
+        Evaluates the filters of the themes in python, e.g. to route features while they are streamed.
+        :param tags: A dict of the tags of a feature.
+        :param geom_type: Only the themes including this geometry type (points, lines or polygons) are evaluated.
+        :return: A list of the themes which the feature belongs to.
+        """
+        return [
+            theme
+            for theme in self.themes
+            if (geom_type is None or geom_type in self.geom_types(theme)) and self.filter(theme).evaluate(tags)
+        ]
+
     def zip_readme(self, theme):
         columns = []
         for key in self.key_selections(theme):
@@ -200,14 +324,16 @@ class FeatureSelection(object):
         return str(self.doc)
 
     def key_union(self, geom_type=None):
-        s = set()
-        for t in self.themes:
-            if geom_type is None or (geom_type in self.geom_types(t)):
-                for key in self.key_selections(t):
-                    s.add(key)
-                for key in self.keys_from_sql[t]:
-                    s.add(key)
-        return sorted(list(s))
+        if geom_type not in self._key_unions:
+            s = set()
+            for t in self.themes:
+                if geom_type is None or (geom_type in self.geom_types(t)):
+                    for key in self.key_selections(t):
+                        s.add(key)
+                    for key in self.keys_from_sql[t]:
+                        s.add(key)
+            self._key_unions[geom_type] = sorted(list(s))
+        return list(self._key_unions[geom_type])
 
     @property
     def tables(self):
@@ -217,6 +343,40 @@ class FeatureSelection(object):
                 retval.append(slugify(theme) + "_" + geom_type)
         return retval
 
+    def z_index_sql(self, table_name, geom_type):
+        """
+        :param table_name: The table of OSM features to add the z_index to.
+        :param geom_type: The geometry type of the table (points, lines or polygons).
+        :return: The sql to compute the z_index of the table in a single pass, or None if no scored keys are selected.
+        """
+        key_union = self.key_union(geom_type)
+        scores = [(key, key_scores) for key, key_scores in self.z_index_scores.items() if key in key_union]
+        if not scores:
+            return None
+        terms = []
+        for key, key_scores in scores:
+            if "values" in key_scores:
+                values_by_score = {}
+                for value, score in key_scores["values"].items():
+                    values_by_score.setdefault(score, []).append(value)
+                cases = " ".join(
+                    'WHEN "{0}" IN ({1}) THEN {2}'.format(
+                        key, ",".join(quote_literal(value) for value in values), score
+                    )
+                    for score, values in values_by_score.items()
+                )
+                terms.append("CASE {0} ELSE 0 END".format(cases))
+            elif "present" in key_scores:
+                terms.append('CASE WHEN "{0}" IS NOT NULL THEN {1} ELSE 0 END'.format(key, key_scores["present"]))
+            else:
+                terms.append('COALESCE({1} * CAST("{0}" AS SMALLINT), 0)'.format(key, key_scores["factor"]))
+        return (
+            "ALTER TABLE {0} ADD COLUMN z_index SMALLINT DEFAULT 0;\n"
+            "UPDATE {0} SET z_index = {1} WHERE {2};\n".format(
+                table_name, " + ".join(terms), " OR ".join('"{0}" IS NOT NULL'.format(key) for key, _ in scores),
+            )
+        )
+
     def col_type(self, col_name):
         if col_name == "z_index":
             return " INTEGER(4) DEFAULT 0"
@@ -249,18 +409,41 @@ class FeatureSelection(object):
         )
         return sqls
 
+    def route_sqls(self):
+        """
+        :return: A tuple of a list of sql statements which route the features of each source table with more than one
+          theme in a single scan, and a dict of the filter to use for each (theme, geom_type) instead of its clause.
+        """
+        route_sqls = []
+        route_filters = {}
+        for geom_type, src_tablename in OGR2OGR_TABLENAMES.items():
+            themes = [theme for theme in self.themes if geom_type in self.geom_types(theme)]
+            if len(themes) < 2:
+                continue
+            route_tablename = "route_" + src_tablename
+            route_indexes = " UNION ALL ".join(
+                "SELECT {0} AS route_index".format(index) for index in range(len(themes))
+            )
+            cases = " ".join(
+                "WHEN {0} THEN ({1})".format(index, self.filter(theme).sql()) for index, theme in enumerate(themes)
+            )
+            route_sqls.append(ROUTE_TEMPLATE.format(route_tablename, src_tablename, route_indexes, cases))
+            for index, theme in enumerate(themes):
+                route_filters[(theme, geom_type)] = ROUTE_FILTER_TEMPLATE.format(route_tablename, index)
+        return route_sqls, route_filters
+
     @property
     def sqls(self):
-        create_sqls = []
+        create_sqls, route_filters = self.route_sqls()
         index_sqls = []
         for theme in self.themes:
             key_selections = ['"{0}"'.format(key) for key in self.key_selections(theme)]
 
-            # if any of these 5 keys in selection, add z_index
-            if any([x in self.key_selections(theme) for x in ["highway", "railway", "bridge", "tunnel", "layer"]]):
+            # if any of the scored keys are in selection, add z_index
+            if any([x in self.key_selections(theme) for x in self.z_index_scores]):
                 key_selections.append('"z_index"')
 
-            filter_clause = self.filter_clause(theme)
+            filter_clause = self.filter(theme).sql()
             for geom_type in self.geom_types(theme):
                 dst_tablename = slugify(theme) + "_" + geom_type
                 src_tablename = OGR2OGR_TABLENAMES[geom_type]
@@ -272,7 +455,7 @@ class FeatureSelection(object):
                         ",".join([col + self.col_type(col) for col in cols]),
                         ",".join(cols),
                         src_tablename,
-                        filter_clause,
+                        route_filters.get((theme, geom_type), filter_clause),
                     )
                 )
                 index_sqls.append(INDEX_TEMPLATE.format(dst_tablename, WKT_TYPE_MAP[geom_type]))
@@ -1,3 +1,5 @@
+from abc import ABC, abstractmethod
+
 from pyparsing import (
     Word,
     delimitedList,
@@ -118,3 +120,187 @@ class OsmfilterRule(object):
 
     def rule(self):
         return self._rule(self._parse_result.asDict())
+
+
+def strip_identifier_quotes(token):
+    if token[0] == '"' and token[-1] == '"':
+        return token[1:-1]
+    return token
+
+
+def get_literal(token):
+    # The columns created by OGR are all TEXT, so SQLite compares them to numbers as text as well.
+    if token[0] in "'\"" and token[-1] == token[0]:
+        return token[1:-1]
+    return token
+
+
+def quote_literal(value):
+    return "'{0}'".format(value.replace("'", "''"))
+
+
+class Predicate(ABC):
+    """
+    A compiled where clause, which can be rendered as SQL or evaluated against the tags of a feature.
+    OGR writes every tag as TEXT, so values are compared as text like SQLite does, and missing tags are NULL.
+    """
+
+    @abstractmethod
+    def sql(self):
+        pass
+
+    @abstractmethod
+    def evaluate(self, tags):
+        """
+        :param tags: A dict of the tags of a feature.
+        :return: True if the feature matches, a NULL result (e.g. comparing a missing tag) doesn't match.
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def column_names(self):
+        pass
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.sql())
+
+
+class NotNull(Predicate):
+    def __init__(self, column):
+        self.column = column
+
+    def sql(self):
+        return '"{0}" IS NOT NULL'.format(self.column)
+
+    def evaluate(self, tags):
+        return tags.get(self.column) is not None
+
+    @property
+    def column_names(self):
+        return {self.column}
+
+
+COMPARISONS = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+class Comparison(Predicate):
+    def __init__(self, column, operator, value):
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def sql(self):
+        return '"{0}" {1} {2}'.format(self.column, self.operator, quote_literal(self.value))
+
+    def evaluate(self, tags):
+        tag = tags.get(self.column)
+        return tag is not None and COMPARISONS[self.operator](tag, self.value)
+
+    @property
+    def column_names(self):
+        return {self.column}
+
+
+class In(Predicate):
+    def __init__(self, column, values):
+        self.column = column
+        self.values = frozenset(values)
+
+    def sql(self):
+        return '"{0}" IN ({1})'.format(self.column, ",".join(quote_literal(value) for value in sorted(self.values)))
+
+    def evaluate(self, tags):
+        return tags.get(self.column) in self.values
+
+    @property
+    def column_names(self):
+        return {self.column}
+
+
+class BooleanPredicate(Predicate):
+    operator = None
+
+    def __init__(self, children):
+        self.children = children
+
+    def sql(self):
+        # Nested boolean predicates are always the other operator, so they are wrapped to keep their precedence.
+        return " {0} ".format(self.operator).join(
+            "({0})".format(child.sql()) if isinstance(child, BooleanPredicate) else child.sql()
+            for child in self.children
+        )
+
+    @property
+    def column_names(self):
+        return set().union(*[child.column_names for child in self.children])
+
+
+class And(BooleanPredicate):
+    operator = "AND"
+
+    def evaluate(self, tags):
+        return all(child.evaluate(tags) for child in self.children)
+
+
+class Or(BooleanPredicate):
+    operator = "OR"
+
+    def evaluate(self, tags):
+        return any(child.evaluate(tags) for child in self.children)
+
+
+def combine(predicate_class, children):
+    """
+    Flattens nested predicates of the same class, and doesn't wrap a single child.
+    """
+    flattened = []
+    for child in children:
+        if isinstance(child, predicate_class):
+            flattened.extend(child.children)
+        else:
+            flattened.append(child)
+    if len(flattened) == 1:
+        return flattened[0]
+    return predicate_class(flattened)
+
+
+def compile_condition(tokens):
+    if tokens[0] == "(":
+        return compile_expression(tokens[1])
+    column = strip_identifier_quotes(tokens[0])
+    operator = tokens[1].lower()
+    if operator == "is not null":
+        return NotNull(column)
+    if operator == "in":
+        return In(column, [get_literal(token) for token in tokens[3:-1]])
+    return Comparison(column, operator, get_literal(tokens[2]))
+
+
+def compile_expression(tokens):
+    # The grammar chains conditions to the right, so they are regrouped with AND taking precedence over OR like SQL.
+    or_groups = [[compile_condition(tokens[0])]]
+    while len(tokens) == 3:
+        if tokens[1].lower() == "or":
+            or_groups.append([])
+        tokens = tokens[2]
+        or_groups[-1].append(compile_condition(tokens[0]))
+    return combine(Or, [combine(And, and_group) for and_group in or_groups])
+
+
+def compile_where(s):
+    """
+    :param s: A valid where clause (see SQLValidator).
+    :return: The where clause compiled into a Predicate.
+    """
+    return compile_expression(whereExpression.parseString(s, parseAll=True)[0])
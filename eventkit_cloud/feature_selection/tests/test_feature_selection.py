@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
 
+import sqlite3
 import unittest
 
-from eventkit_cloud.feature_selection.feature_selection import FeatureSelection
+from eventkit_cloud.feature_selection.feature_selection import FeatureSelection, compile_feature_selection
 
 ZIP_README = """
 This thematic file was generated by EventKit.
@@ -145,6 +146,41 @@ class TestFeatureSelection(unittest.TestCase):
             "IS NOT NULL);\n",
         )
 
+    def test_sqls_route(self):
+        y = """
+        buildings:
+            types:
+                - points
+                - polygons
+            select:
+                - building
+        amenities:
+            types:
+                - points
+            select:
+                - amenity
+        """
+        f = FeatureSelection(y)
+        create_sqls, index_sqls = f.sqls
+        # Only the points have more than one theme, so they're the only features which are routed.
+        self.assertEqual(
+            create_sqls[0],
+            "CREATE TEMP TABLE route_points AS\n"
+            "SELECT route.route_index AS route_index, src.rowid AS src_rowid\n"
+            "FROM points AS src CROSS JOIN (SELECT 0 AS route_index UNION ALL SELECT 1 AS route_index) AS route\n"
+            'WHERE CASE route.route_index WHEN 0 THEN ("building" IS NOT NULL) '
+            'WHEN 1 THEN ("amenity" IS NOT NULL) END;\n'
+            "CREATE INDEX route_points_route_index ON route_points(route_index, src_rowid);\n",
+        )
+        self.assertIn(
+            "from points WHERE (rowid IN (SELECT src_rowid FROM route_points WHERE route_index = 0));", create_sqls[1]
+        )
+        self.assertIn('from multipolygons WHERE ("building" IS NOT NULL);', create_sqls[2])
+        self.assertIn(
+            "from points WHERE (rowid IN (SELECT src_rowid FROM route_points WHERE route_index = 1));", create_sqls[3]
+        )
+        self.assertEqual(3, len(index_sqls))
+
     def test_zindex(self):
         y = """
         roads:
@@ -164,6 +200,77 @@ class TestFeatureSelection(unittest.TestCase):
             'WHERE ("highway" IS NOT NULL);\n',
         )
 
+    def test_zindex_sql(self):
+        y = """
+        roads:
+            types:
+                - lines
+            select:
+                - highway
+                - bridge
+                - layer
+        """
+        f = FeatureSelection(y)
+        self.assertIsNone(f.z_index_sql("points", "points"))
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE lines (highway TEXT, bridge TEXT, layer TEXT)")
+        conn.executemany(
+            "INSERT INTO lines VALUES (?, ?, ?)",
+            [("motorway", "yes", "1"), ("residential", None, None), (None, None, "-1"), (None, None, None)],
+        )
+        conn.executescript(f.z_index_sql("lines", "lines"))
+        self.assertEqual([(29,), (3,), (-10,), (0,)], conn.execute("SELECT z_index FROM lines").fetchall())
+
+        f = FeatureSelection(y, z_index_scores={"highway": {"values": {"residential": 1}}, "bridge": {"present": 2}})
+        self.assertEqual(
+            f.z_index_sql("lines", "lines"),
+            "ALTER TABLE lines ADD COLUMN z_index SMALLINT DEFAULT 0;\n"
+            "UPDATE lines SET z_index = CASE WHEN \"highway\" IN ('residential') THEN 1 ELSE 0 END + "
+            'CASE WHEN "bridge" IS NOT NULL THEN 2 ELSE 0 END WHERE "highway" IS NOT NULL OR "bridge" IS NOT NULL;\n',
+        )
+        with self.assertRaises(ValueError):
+            FeatureSelection(y, z_index_scores={"highway": {"unknown": 1}})
+
+    def test_matching_themes(self):
+        y = """
+        buildings:
+            types:
+                - points
+                - polygons
+            select:
+                - name
+                - building
+            where: building IS NOT NULL and building != 'no'
+        amenities:
+            types:
+                - points
+            select:
+                - name
+                - amenity
+        """
+        f = FeatureSelection(y)
+        self.assertTrue(f.valid)
+        self.assertEqual(["buildings", "amenities"], f.matching_themes({"building": "yes", "amenity": "cafe"}))
+        self.assertEqual(["buildings"], f.matching_themes({"building": "yes", "amenity": "cafe"}, "polygons"))
+        self.assertEqual(["amenities"], f.matching_themes({"building": "no", "name": "a name"}))
+        self.assertEqual([], f.matching_themes({"highway": "primary"}))
+
+    def test_compiled_once(self):
+        y = """
+        buildings:
+            select:
+                - building
+        """
+        FeatureSelection(y).doc
+        hits = compile_feature_selection.cache_info().hits
+        f = FeatureSelection(y)
+        self.assertEqual(["building"], f.doc["buildings"]["select"])
+        self.assertEqual(hits + 1, compile_feature_selection.cache_info().hits)
+
+        # Changing the doc of one feature selection doesn't change the cached one.
+        f.doc["buildings"]["select"].append("name")
+        self.assertEqual(["building"], FeatureSelection(y).doc["buildings"]["select"])
+
     def test_unsafe_yaml(self):
         y = """
         !!python/object:feature_selection.feature_selection.FeatureSelection
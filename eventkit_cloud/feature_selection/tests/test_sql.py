@@ -3,7 +3,7 @@
 
 import unittest
 
-from eventkit_cloud.feature_selection.sql import SQLValidator, OsmfilterRule
+from eventkit_cloud.feature_selection.sql import SQLValidator, OsmfilterRule, Predicate, compile_where
 
 
 class TestSQLValidator(unittest.TestCase):
@@ -93,3 +93,39 @@ class TestOsmfilterRule(unittest.TestCase):
         self.assertEqual(s.rule(), "( name1=foo or name2=bar )")
         s = OsmfilterRule("(name1 = 'foo' and name2 = 'bar') or name3 = 'baz'")
         self.assertEqual(s.rule(), "( ( name1=foo and name2=bar ) or name3=baz )")
+
+
+class TestCompileWhere(unittest.TestCase):
+    def test_sql(self):
+        self.assertEqual(compile_where("name = 'a name'").sql(), "\"name\" = 'a name'")
+        self.assertEqual(compile_where("natural in ('water','cliff')").sql(), "\"natural\" IN ('cliff','water')")
+        self.assertEqual(compile_where('"addr:housenumber" IS NOT NULL').sql(), '"addr:housenumber" IS NOT NULL')
+        # AND takes precedence over OR like it does in SQL.
+        self.assertEqual(
+            compile_where("a IS NOT NULL or b IS NOT NULL and c = 'x'").sql(),
+            '"a" IS NOT NULL OR ("b" IS NOT NULL AND "c" = \'x\')',
+        )
+        self.assertEqual(
+            compile_where("(a = 'x' or b = 'y') and c != 'z'").sql(), "(\"a\" = 'x' OR \"b\" = 'y') AND \"c\" != 'z'"
+        )
+
+    def test_evaluate(self):
+        predicate = compile_where("a IS NOT NULL and b IS NOT NULL or c = 'x'")
+        self.assertFalse(predicate.evaluate({"a": "1"}))
+        self.assertTrue(predicate.evaluate({"a": "1", "b": "2"}))
+        self.assertTrue(predicate.evaluate({"c": "x"}))
+        self.assertTrue(compile_where("natural in ('water','cliff')").evaluate({"natural": "water"}))
+        self.assertFalse(compile_where("natural in ('water','cliff')").evaluate({"natural": "wood"}))
+        # Missing tags are NULL, so they don't match any comparison.
+        self.assertFalse(compile_where("name != 'x'").evaluate({}))
+        # Tags are text, so numbers are compared as text.
+        self.assertTrue(compile_where("level > 4").evaluate({"level": "5"}))
+        self.assertFalse(compile_where("level > 4").evaluate({"level": "10"}))
+
+    def test_column_names(self):
+        predicate = compile_where("(admin IS NOT NULL and level > 4) AND height is not null")
+        self.assertEqual({"height", "level", "admin"}, predicate.column_names)
+
+    def test_abstract_predicate(self):
+        with self.assertRaises(TypeError):
+            Predicate()
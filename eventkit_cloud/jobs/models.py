@@ -954,8 +954,10 @@ def clean_config(config: str, return_dict: bool = False) -> Union[str, dict]:
         "max_repeat",
         "overpass_query",
         "max_data_size",
+        "partition_size",
         "pbf_file",
         "tile_size",
+        "z_index_scores",
     ]
 
     conf = yaml.safe_load(config) or dict()
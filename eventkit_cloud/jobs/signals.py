@@ -80,6 +80,10 @@ def provider_pre_save(sender, instance, **kwargs):
     """
     This method is executed whenever a DataProvider is created or updated.
     """
+    # The provider's map configuration may have changed, so rebuild it on the next request.
+    cache.delete(f"base-config-{instance.slug}")
+    clear_mapproxy_config_cache()
+
     if instance.preview_url:
         try:
             # First check to see if this DataProvider should update the thumbnail
@@ -7,13 +7,77 @@ import shutil
 logger = getLogger(__name__)
 
 
+def get_cached_tiles(tile_cache_dir):
+    """
+    :param tile_cache_dir: The directory where tiles are cached.
+    :return: A list of (last_used, size, path) tuples for each file in the tile cache.
+    """
+    cached_tiles = []
+    directories = [tile_cache_dir]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    # Filesystems are often mounted with relatime, so use the modified time if it's more recent.
+                    cached_tiles.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+            except OSError:
+                continue
+    return cached_tiles
+
+
+def evict_tile_cache(tile_cache_dir, max_size, low_water_mark=0.9):
+    """
+    Removes the least recently used tiles until the tile cache is smaller than the low water mark of the max size.
+    :param tile_cache_dir: The directory where tiles are cached.
+    :param max_size: The max size of the tile cache in bytes.
+    :param low_water_mark: The fraction of the max size to reduce the cache to, so that it isn't evicted every time.
+    :return: A tuple of the number of tiles and the number of bytes that were removed.
+    """
+    cached_tiles = get_cached_tiles(tile_cache_dir)
+    cache_size = sum(size for _, size, _ in cached_tiles)
+    if cache_size <= max_size:
+        logger.info(f"The tile cache at {tile_cache_dir} is {cache_size} bytes, nothing needs to be evicted.")
+        return 0, 0
+
+    target_size = max_size * low_water_mark
+    removed_tiles = removed_size = 0
+    for _, size, path in sorted(cached_tiles):
+        if cache_size - removed_size <= target_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed_tiles += 1
+        removed_size += size
+    logger.info(f"Evicted {removed_tiles} tiles ({removed_size} bytes) from the tile cache at {tile_cache_dir}.")
+    return removed_tiles, removed_size
+
+
 class Command(BaseCommand):
-    help = "Deletes the directory where tiles are cached."
+    help = "Deletes the directory where tiles are cached, or with --max-size evicts the least recently used tiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-size", type=int, default=None, help="Only evict the least recently used tiles over this many bytes."
+        )
+        parser.add_argument(
+            "--directory", default=None, help="The tile directory to clear, defaults to the TILE_CACHE_DIR."
+        )
 
     def handle(self, *args, **options):
-        tile_cache_dir = getattr(settings, "TILE_CACHE_DIR")
-        if os.path.isdir(tile_cache_dir):
+        tile_cache_dir = options.get("directory") or getattr(settings, "TILE_CACHE_DIR")
+        if not os.path.isdir(tile_cache_dir):
+            logger.info(f"The tile cache at {tile_cache_dir} does not exist or has already been removed.")
+        elif options.get("max_size") is not None:
+            evict_tile_cache(tile_cache_dir, options["max_size"])
+        else:
             logger.info(f"Clearing tile cache directory: {tile_cache_dir}")
             shutil.rmtree(tile_cache_dir)
-        else:
-            logger.info(f"The tile cache at {tile_cache_dir} does not exist or has already been removed.")
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from eventkit_cloud.management.commands.clear_tile_cache import evict_tile_cache
+
+
+class TestClearTileCache(TestCase):
+    def setUp(self):
+        self.tile_cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tile_cache_dir, ignore_errors=True)
+        self.tiles = []
+        for index in range(10):
+            tile_dir = os.path.join(self.tile_cache_dir, "slug_default", str(index))
+            os.makedirs(tile_dir)
+            tile = os.path.join(tile_dir, "0.png")
+            with open(tile, "wb") as tile_file:
+                tile_file.write(b"x" * 100)
+            # Tiles with a higher index were used more recently.
+            os.utime(tile, (1000 + index, 1000 + index))
+            self.tiles.append(tile)
+
+    def test_evict_tile_cache(self):
+        self.assertEqual((0, 0), evict_tile_cache(self.tile_cache_dir, 1000))
+
+        # The cache is reduced to the low water mark (i.e. 450 bytes) by removing the least recently used tiles.
+        self.assertEqual((6, 600), evict_tile_cache(self.tile_cache_dir, 500))
+        self.assertEqual([False] * 6 + [True] * 4, [os.path.isfile(tile) for tile in self.tiles])
+
+    def test_clear_tile_cache(self):
+        with self.settings(TILE_CACHE_DIR=self.tile_cache_dir):
+            call_command("clear_tile_cache", max_size=950)
+            self.assertEqual(2, sum(not os.path.isfile(tile) for tile in self.tiles))
+
+            call_command("clear_tile_cache")
+            self.assertFalse(os.path.isdir(self.tile_cache_dir))
@@ -23,6 +23,11 @@ CELERY_TRACK_STARTED = True
 CELERYD_PREFETCH_MULTIPLIER = 1
 CELERYBEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "rpc://")
+# Run the format conversions of a provider in parallel after its primary task.  This needs a result backend which
+# supports chords, so it is disabled by default with the rpc backend.
+CELERY_PARALLEL_FORMAT_TASKS = is_true(
+    os.getenv("CELERY_PARALLEL_FORMAT_TASKS", str(not CELERY_RESULT_BACKEND.startswith("rpc")))
+)
 
 # Pickle used to be the default, and accepting pickled content is a security concern.  Using the new default json,
 # causes a circular reference error, that will need to be resolved.
@@ -37,7 +42,8 @@ BEAT_SCHEDULE = {
         "schedule": crontab(minute="*/{}".format(os.getenv("PROVIDER_CHECK_INTERVAL", "30"))),
     },
     "clean-up-queues": {"task": "Clean Up Queues", "schedule": crontab(minute="0", hour="0")},
-    "clear-tile-cache": {"task": "Clear Tile Cache", "schedule": crontab(minute="0", day_of_month="*/14")},
+    "clear-tile-cache": {"task": "Clear Tile Cache", "schedule": crontab(minute="0", hour="1")},
+    "seed-tile-cache": {"task": "Seed Tile Cache", "schedule": crontab(minute="0", hour="2")},
     "clear-user-sessions": {"task": "Clear User Sessions", "schedule": crontab(minute="0", day_of_month="*/2")},
     "update-statistics-cache": {
         "task": "Update Statistics Caches",
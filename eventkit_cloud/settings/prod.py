@@ -58,6 +58,26 @@ if not EXPORT_STAGING_ROOT:
     EXPORT_STAGING_ROOT = os.getenv("EXPORT_STAGING_ROOT", "/var/lib/eventkit/exports_stage/")
 if not TILE_CACHE_DIR:
     TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "/var/lib/eventkit/tile_cache/")
+# The least recently used tiles are evicted when the tile cache is larger than this many bytes.
+TILE_CACHE_MAX_SIZE = int(os.getenv("TILE_CACHE_MAX_SIZE", 10 * 1024 ** 3))
+# Tiles seeded for raster exports are shared between runs in this directory, and evicted when it is larger than
+# TILE_STORE_MAX_SIZE bytes.  Set TILE_STORE_DIR to an empty string to seed every export from the upstream service.
+TILE_STORE_DIR = os.getenv("TILE_STORE_DIR", os.path.join(os.path.dirname(TILE_CACHE_DIR.rstrip("/")), "tile_store"))
+TILE_STORE_MAX_SIZE = int(os.getenv("TILE_STORE_MAX_SIZE", 50 * 1024 ** 3))
+# OSM extracts and thematic geopackages are reused by runs while the overpass data hasn't changed, and are evicted when
+# the directory is larger than OSM_EXTRACT_CACHE_MAX_SIZE bytes.  Set OSM_EXTRACT_CACHE_DIR to an empty string to
+# always query overpass.
+OSM_EXTRACT_CACHE_DIR = os.getenv(
+    "OSM_EXTRACT_CACHE_DIR", os.path.join(os.path.dirname(TILE_CACHE_DIR.rstrip("/")), "osm_extract_cache")
+)
+OSM_EXTRACT_CACHE_MAX_SIZE = int(os.getenv("OSM_EXTRACT_CACHE_MAX_SIZE", 20 * 1024 ** 3))
+# The tile cache is seeded for the providers used by the most jobs in the last TILE_CACHE_SEED_DAYS.  The whole coverage
+# is seeded up to TILE_CACHE_SEED_BASE_LEVEL, and the AOIs of the most recent jobs up to TILE_CACHE_SEED_MAX_LEVEL.
+TILE_CACHE_SEED_PROVIDERS = int(os.getenv("TILE_CACHE_SEED_PROVIDERS", 5))
+TILE_CACHE_SEED_DAYS = int(os.getenv("TILE_CACHE_SEED_DAYS", 7))
+TILE_CACHE_SEED_AOIS = int(os.getenv("TILE_CACHE_SEED_AOIS", 20))
+TILE_CACHE_SEED_BASE_LEVEL = int(os.getenv("TILE_CACHE_SEED_BASE_LEVEL", 4))
+TILE_CACHE_SEED_MAX_LEVEL = int(os.getenv("TILE_CACHE_SEED_MAX_LEVEL", 12))
 
 # where map image snapshots are stored (e.g. thumbnails)
 IMAGES_STAGING = os.path.join(EXPORT_STAGING_ROOT, "images")
@@ -153,6 +173,14 @@ http://wiki.openstreetmap.org/wiki/Overpass_API/Overpass_QL#timeout
 
 OVERPASS_TIMEOUT = os.getenv("OVERPASS_TIMEOUT", 1600)  # query timeout in seconds
 
+# Convert overpass results to PBF as they are downloaded, instead of staging the raw OSM XML on disk first.
+OVERPASS_STREAM_TO_PBF = is_true(os.getenv("OVERPASS_STREAM_TO_PBF", "true"))
+# Overpass queries for areas wider or taller than this many degrees are split into partitions of about this size,
+# which are queried concurrently and merged.  A provider's "partition_size" config overrides it, 0 disables it.
+OVERPASS_PARTITION_SIZE = float(os.getenv("OVERPASS_PARTITION_SIZE", 1))
+# The default number of overpass partitions to query at the same time, a provider's "concurrency" config overrides it.
+OVERPASS_CONCURRENCY = int(os.getenv("OVERPASS_CONCURRENCY", 2))
+
 # Authentication Settings
 
 AUTHENTICATION_BACKENDS = tuple()
@@ -349,9 +377,31 @@ AWS_SECRET_ACCESS_KEY = AWS_SECRET_ACCESS_KEY or os.getenv("AWS_SECRET_ACCESS_KE
 
 # https://django-storages.readthedocs.io/en/latest/backends/amazon-S3.html#settings
 AWS_DEFAULT_ACL = None
+# Files are transferred to and from S3 in parts of AWS_S3_MULTIPART_CHUNKSIZE MB, with up to AWS_S3_MAX_CONCURRENCY
+# parts of a file transferred at the same time.  A run's files are downloaded AWS_S3_DOWNLOAD_CONCURRENCY at a time.
+AWS_S3_MULTIPART_CHUNKSIZE = int(os.getenv("AWS_S3_MULTIPART_CHUNKSIZE", 64))
+AWS_S3_MAX_CONCURRENCY = int(os.getenv("AWS_S3_MAX_CONCURRENCY", 10))
+AWS_S3_DOWNLOAD_CONCURRENCY = int(os.getenv("AWS_S3_DOWNLOAD_CONCURRENCY", 4))
 
 
 MAPPROXY_CONCURRENCY = os.getenv("MAPPROXY_CONCURRENCY", 1)
+# The number of processes to seed raster exports with, the export area is split into a sub-region for each process.
+# Defaults to the provider's concurrency, which it can't exceed.  A provider's "processes" config overrides it.
+MAPPROXY_PROCESSES = int(os.getenv("MAPPROXY_PROCESSES", 0))
+# The default number of chunks to download at the same time for chunked vector services (e.g. WFS or ArcGIS).
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", 4))
+# GDAL is configured once in each worker with a GDAL_CACHEMAX block cache (in MB) and GDAL_NUM_THREADS threads for
+# compression and warping.  GDAL_NUM_THREADS is unset by default since every worker process would use all of the CPUs.
+GDAL_CACHEMAX = int(os.getenv("GDAL_CACHEMAX", 512))
+GDAL_NUM_THREADS = os.getenv("GDAL_NUM_THREADS")
+# The number of files compressed at the same time when building a datapack's zip file, defaults to the number of CPUs.
+ZIP_CONCURRENCY = int(os.getenv("ZIP_CONCURRENCY", 0))
+# The number of keep-alive connections pooled per provider host in each worker, and how long (in seconds) an unused
+# provider pool is kept open.  A provider's "concurrency" config will increase its pool size if it is larger.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+HTTP_POOL_IDLE_TIMEOUT = int(os.getenv("HTTP_POOL_IDLE_TIMEOUT", 300))
+# The number of configured MapProxy apps (per provider and user) to keep in each process for serving map tiles.
+MAPPROXY_APP_CACHE_SIZE = int(os.getenv("MAPPROXY_APP_CACHE_SIZE", 32))
 MAPPROXY_LOGS = {
     "requests": is_true(os.getenv("MAPPROXY_LOGS_REQUESTS")),
     "verbose": is_true(os.getenv("MAPPROXY_LOGS_VERBOSE")),
@@ -380,6 +430,11 @@ else:
     SSL_VERIFICATION = is_true(ssl_verification_settings)
 
 LAND_DATA_URL = os.getenv("LAND_DATA_URL", "https://osmdata.openstreetmap.de/download/land-polygons-split-3857.zip",)
+# The land data is also loaded into this geopackage, whose spatial index is used to clip the land polygons for OSM
+# exports instead of querying the feature_data database.  Set LAND_DATA_FILE to an empty string to use the database.
+LAND_DATA_FILE = os.getenv(
+    "LAND_DATA_FILE", os.path.join(os.path.dirname(TILE_CACHE_DIR.rstrip("/")), "land_polygons.gpkg")
+)
 
 AUTO_LOGOUT_COOKIE_NAME = "eventkit_auto_logout"
 
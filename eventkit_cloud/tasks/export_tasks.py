@@ -73,6 +73,7 @@ from eventkit_cloud.tasks.helpers import (
     get_celery_queue_group,
     extract_metadata_files,
     get_geometry,
+    get_osm_last_update,
     update_progress,
 )
 from eventkit_cloud.tasks.metadata import metadata_tasks
@@ -88,13 +89,22 @@ from eventkit_cloud.tasks.task_base import EventKitBaseTask
 from eventkit_cloud.tasks.util_tasks import shutdown_celery_workers, rerun_data_provider_records
 from eventkit_cloud.utils import overpass, pbf, s3, mapproxy, wcs, geopackage, gdalutils, auth_requests
 from eventkit_cloud.utils.client import EventKitClient
+from eventkit_cloud.utils.generic import get_file_timestamp, link_file, write_zip_files
 from eventkit_cloud.utils.ogcapi_process import OgcApiProcess, get_format_field_from_config
+from eventkit_cloud.utils.osm_extract_cache import OSMExtractCache
 from eventkit_cloud.utils.qgis_utils import convert_qgis_gpkg_to_kml
 from eventkit_cloud.utils.rocket_chat import RocketChat
 from eventkit_cloud.utils.stats.eta_estimator import ETA
 
 BLACKLISTED_ZIP_EXTS = [".ini", ".om5", ".osm", ".lck", ".pyc"]
 
+# The keys of the results of parallel format tasks which the following tasks need.
+MERGED_RESULT_KEYS = ["source", "selection", "gpkg", "pbf"]
+
+# The land polygon clips are cached in a directory which can't be confused with a provider's, since slugs don't start
+# with an underscore.
+LAND_POLYGONS_CACHE_SLUG = "_land_polygons"
+
 # Get an instance of a logger
 logger = get_task_logger(__name__)
 
@@ -105,7 +115,7 @@ logger = get_task_logger(__name__)
 
 def make_file_downloadable(filepath, run_uid, provider_slug=None, skip_copy=False, download_filename=None):
     """ Construct the filesystem location and url needed to download the file at filepath.
-        Copy filepath to the filesystem location required for download.
+        Link (or copy across filesystems) filepath to the filesystem location required for download.
         @provider_slug is specific to ExportTasks, not needed for FinalizeHookTasks
         @skip_copy: It looks like sometimes (At least for OverpassQuery) we don't want the file copied,
             generally can be ignored
@@ -138,7 +148,7 @@ def make_file_downloadable(filepath, run_uid, provider_slug=None, skip_copy=Fals
 
         download_filepath = os.path.join(run_download_dir, download_filename)
         if not skip_copy:
-            shutil.copy(filepath, download_filepath)
+            link_file(filepath, download_filepath)
     return download_url
 
 
@@ -163,15 +173,8 @@ class ExportTask(EventKitBaseTask):
                 .select_related("export_provider_task__provider")
                 .get(uid=task_uid)
             )
-            if self.hide_download:
-                task.hide_download = True
-
             check_cached_task_failures(task.name, task_uid)
 
-            task.started_at = timezone.now()
-            task.worker = socket.gethostname()
-            task.save()
-
             run = task.export_provider_task.run
             run_dir = get_run_staging_dir(run.uid)
 
@@ -195,7 +198,14 @@ class ExportTask(EventKitBaseTask):
                 task_state_result = args[0]
             except IndexError:
                 task_state_result = None
-            self.update_task_state(result=task_state_result, task_uid=task_uid)
+            # The task is started with a single update, which also records where it is running.
+            self.update_task_state(
+                result=task_state_result,
+                task_uid=task_uid,
+                task=task,
+                worker=socket.gethostname(),
+                hide_download=bool(self.hide_download or task.hide_download),
+            )
 
             if TaskState.CANCELED.value not in [task.status, task.export_provider_task.status]:
                 try:
@@ -235,9 +245,7 @@ class ExportTask(EventKitBaseTask):
                     username = task.cancel_user.username
                 raise CancelException(task_name=task.export_provider_task.name, user_name=username)
 
-            task.finished_at = finished
             task.progress = 100
-            task.pid = -1
             # get the output
             output_url = retval["result"]
             stat = os.stat(output_url)
@@ -267,9 +275,18 @@ class ExportTask(EventKitBaseTask):
             # save the task and task result
             result = FileProducingTaskResult.objects.create(filename=filename, size=size, download_url=download_url)
 
-            task.result = result
-            task.status = TaskState.SUCCESS.value
-            task.save()
+            if not task.transition(
+                only_from=[TaskState.RUNNING.value],
+                status=TaskState.SUCCESS.value,
+                finished_at=finished,
+                pid=-1,
+                result=result,
+            ):
+                # The task was canceled while it was running.
+                result.delete()
+                task.refresh_from_db(fields=["cancel_user"])
+                username = task.cancel_user.username if task.cancel_user else None
+                raise CancelException(task_name=task.export_provider_task.name, user_name=username)
             retval["status"] = TaskState.SUCCESS.value
             retval["file_producing_task_result_id"] = result.id
             return retval
@@ -300,8 +317,6 @@ class ExportTask(EventKitBaseTask):
         status = TaskState.FAILED.value
         try:
             export_task_record = ExportTaskRecord.objects.select_related("export_provider_task__run").get(uid=task_id)
-            export_task_record.finished_at = timezone.now()
-            export_task_record.save()
         except Exception:
             logger.error(traceback.format_exc())
             logger.error(
@@ -311,10 +326,14 @@ class ExportTask(EventKitBaseTask):
             return {"status": status}
         ete = ExportTaskException(task=export_task_record, exception=pickle_exception(einfo))
         ete.save()
-        if export_task_record.status == TaskState.CANCELED.value:
+        # A task which was canceled while it was running stays canceled.
+        if not export_task_record.transition(
+            only_from=[state.value for state in TaskState if state != TaskState.CANCELED],
+            status=status,
+            finished_at=timezone.now(),
+        ):
             status = TaskState.CANCELED.value
-        export_task_record.status = status
-        export_task_record.save()
+            export_task_record.transition(finished_at=timezone.now())
         logger.debug("Task name: {0} failed, {1}".format(self.name, einfo))
         if self.abort_on_error or True:
             try:
@@ -328,34 +347,44 @@ class ExportTask(EventKitBaseTask):
                 logger.error("Exception during handling of an error in {}:\n{}".format(self.name, tb))
         return {"status": status}
 
-    def update_task_state(self, result=None, task_status=TaskState.RUNNING.value, task_uid=None):
+    def update_task_state(self, result=None, task_status=TaskState.RUNNING.value, task_uid=None, task=None, **fields):
         """
         Update the task state and celery task uid.
         Can use the celery uid for diagnostics.
+        :param task: The ExportTaskRecord if it was already fetched, otherwise it is fetched with the task_uid.
+        :param fields: Other fields of the ExportTaskRecord to update with the state.
         """
         result = result or {}
         started = timezone.now()
 
         try:
-            task = ExportTaskRecord.objects.get(uid=task_uid)
+            if task is None:
+                task = ExportTaskRecord.objects.select_related("export_provider_task").get(uid=task_uid)
             celery_uid = self.request.id
             if not celery_uid:
                 raise Exception("Failed to save celery_UID")
-            task.celery_uid = celery_uid
-            task.save()
             result = parse_result(result, "status") or []
             if TaskState.CANCELED.value in [task.status, task.export_provider_task.status, result]:
                 logging.info("canceling before run %s", celery_uid)
-                task.status = TaskState.CANCELED.value
-                task.save()
+                task.transition(status=TaskState.CANCELED.value, celery_uid=celery_uid)
                 raise CancelException(task_name=task.export_provider_task.name)
             # The parent ID is actually the process running in celery.
-            task.pid = os.getppid()
-            task.status = task_status
+            # The task isn't updated if it was canceled since it was fetched.
+            if not task.transition(
+                only_from=[state.value for state in TaskState if state != TaskState.CANCELED],
+                celery_uid=celery_uid,
+                pid=os.getppid(),
+                status=task_status,
+                started_at=started,
+                **fields,
+            ):
+                logging.info("canceling before run %s", celery_uid)
+                raise CancelException(task_name=task.export_provider_task.name)
+            # Only the first task of a provider needs to mark it as running.
+            DataProviderTaskRecord.objects.filter(uid=task.export_provider_task.uid).exclude(
+                status__in=[TaskState.RUNNING.value, TaskState.CANCELED.value]
+            ).update(status=TaskState.RUNNING.value, updated_at=started)
             task.export_provider_task.status = TaskState.RUNNING.value
-            task.started_at = started
-            task.save()
-            task.export_provider_task.save()
             logger.debug("Updated task: {0} with uid: {1}".format(task.name, task.uid))
         except DatabaseError as e:
             logger.error("Updating task {0} state throws: {1}".format(task_uid, e))
@@ -411,6 +440,51 @@ class ZipFileTask(FormatTask):
         return retval
 
 
+def get_land_polygons(boundary, geometry, stage_dir, task_uid=None):
+    """
+    Gets the dataset to add the land polygons from, preferring a clip of the local LAND_DATA_FILE for the AOI which is
+    shared by runs until the land data is reloaded.
+    :param boundary: A geojson file or bbox of the AOI.
+    :param geometry: The AOI as a geometry, used to identify the clip in the cache.
+    :param stage_dir: The directory to write the clip to.
+    :param task_uid: The uid of the export task.
+    :return: A tuple of the dataset and the boundary it still needs to be clipped to (None if it is already clipped).
+    """
+    land_data_file = getattr(settings, "LAND_DATA_FILE", None)
+    if not land_data_file or not os.path.isfile(land_data_file):
+        database = settings.DATABASES["feature_data"]
+        in_dataset = "PG:dbname={name} host={host} user={user} password={password} port={port}".format(
+            host=database["HOST"],
+            user=database["USER"],
+            password=database["PASSWORD"].replace("$", "\$"),
+            port=database["PORT"],
+            name=database["NAME"],
+        )
+        return in_dataset, boundary
+
+    # The modified time of the land data identifies the version that a clip was made from.
+    extract_cache = OSMExtractCache(
+        LAND_POLYGONS_CACHE_SLUG, land_data_file, get_file_timestamp(land_data_file), task_uid=task_uid
+    )
+    clip_filepath = os.path.join(stage_dir, "land_polygons.gpkg")
+    if extract_cache.get_gpkg(geometry, "land_polygons", clip_filepath):
+        return clip_filepath, None
+    if not extract_cache.enabled:
+        return land_data_file, boundary
+
+    gdalutils.convert(
+        boundary=boundary,
+        input_file=land_data_file,
+        output_file=clip_filepath,
+        layers=["land_polygons"],
+        driver="gpkg",
+        is_raster=False,
+        task_uid=task_uid,
+    )
+    extract_cache.add_gpkg(geometry, "land_polygons", clip_filepath)
+    return clip_filepath, None
+
+
 @gdalutils.retry
 def osm_data_collection_pipeline(
     export_task_record_uid,
@@ -434,11 +508,23 @@ def osm_data_collection_pipeline(
         logger.error("No configuration was provided for OSM export")
         raise RuntimeError("The configuration field is required for OSM data providers")
 
-    pbf_file = yaml.load(config).get("pbf_file")
+    conf = yaml.load(config)
+    pbf_file = conf.get("pbf_file")
+    provider_slug = get_export_task_record(export_task_record_uid).export_provider_task.provider.slug
+    pbf_filename = os.path.join(stage_dir, "{}_query.pbf".format(job_name))
 
     if pbf_file:
         logger.info(f"Using PBF file: {pbf_file} instead of overpass.")
-        pbf_filepath = pbf_file
+        # --- Reuse a clip of the same (or an enclosing) area if the PBF file hasn't changed since
+        extract_cache = OSMExtractCache(
+            provider_slug, pbf_file, get_file_timestamp(pbf_file), task_uid=export_task_record_uid
+        )
+        pbf_filepath = extract_cache.get_pbf(bbox, pbf_filename)
+        if not pbf_filepath:
+            # --- Clip the PBF file to the AOI, so that only the AOI is read when creating the geopackage
+            update_progress(export_task_record_uid, progress=0, eta=eta, msg="Clipping data from PBF file")
+            pbf_filepath = pbf.clip_pbf_file(pbf_file, bbox, pbf_filename, task_uid=export_task_record_uid)
+            extract_cache.add_pbf(bbox, pbf_filepath)
     else:
         # Reasonable subtask_percentages we're determined by profiling code sections on a developer workstation
         # TODO: Biggest impact to improving ETA estimates reqs higher fidelity tracking of run_query and convert
@@ -455,18 +541,41 @@ def osm_data_collection_pipeline(
             config=config,
         )
 
-        osm_data_filename = op.run_query(user_details=user_details, subtask_percentage=65, eta=eta)  # run the query
+        # --- Reuse an extract of the same (or an enclosing) area if the Overpass data hasn't changed since
+        extract_cache = OSMExtractCache(
+            provider_slug,
+            op.default_template.template,
+            get_osm_last_update(op.url, cert_info=conf.get("cert_info")),
+            task_uid=export_task_record_uid,
+        )
+        pbf_filepath = extract_cache.get_pbf(bbox, pbf_filename)
+        if pbf_filepath:
+            update_progress(export_task_record_uid, progress=65, eta=eta, msg="Using cached data from provider")
+        else:
+            if settings.OVERPASS_STREAM_TO_PBF:
+                # --- Run the query and convert the Overpass result to PBF as it is downloaded
+                pbf_filepath = op.run_query(
+                    user_details=user_details, subtask_percentage=65, eta=eta, pbf_filename=pbf_filename
+                )
+            else:
+                # --- Run the query
+                osm_data_filename = op.run_query(user_details=user_details, subtask_percentage=65, eta=eta)
 
-        # --- Convert Overpass result to PBF
-        osm_filename = os.path.join(stage_dir, osm_data_filename)
-        pbf_filename = os.path.join(stage_dir, "{}_query.pbf".format(job_name))
-        pbf_filepath = pbf.OSMToPBF(osm=osm_filename, pbffile=pbf_filename, task_uid=export_task_record_uid).convert()
+                # --- Convert Overpass result to PBF
+                osm_filename = os.path.join(stage_dir, osm_data_filename)
+                pbf_filepath = pbf.OSMToPBF(
+                    osm=osm_filename, pbffile=pbf_filename, task_uid=export_task_record_uid
+                ).convert()
+            extract_cache.add_pbf(bbox, pbf_filepath)
 
     # --- Generate thematic gpkg from PBF
-    provider_slug = get_export_task_record(export_task_record_uid).export_provider_task.provider.slug
     gpkg_filepath = get_export_filepath(stage_dir, job_name, projection, provider_slug, "gpkg")
 
-    feature_selection = FeatureSelection.example(clean_config(config))
+    feature_selection_config = clean_config(config)
+    z_index_scores = conf.get("z_index_scores")
+    feature_selection = FeatureSelection.example(feature_selection_config, z_index_scores=z_index_scores)
+    # The z_index scores change the geopackage, so they're part of what identifies it in the cache.
+    gpkg_cache_key = [feature_selection_config, feature_selection.z_index_scores]
 
     update_progress(export_task_record_uid, progress=67, eta=eta, msg="Converting data to Geopackage")
     geom = get_geometry(bbox, selection)
@@ -475,7 +584,11 @@ def osm_data_collection_pipeline(
         pbf_filepath, gpkg_filepath, stage_dir, feature_selection, geom, export_task_record_uid=export_task_record_uid
     )
 
-    osm_gpkg = g.run(subtask_start=77, subtask_percentage=8, eta=eta)  # 77% to 85%
+    osm_gpkg = extract_cache.get_gpkg(geom, gpkg_cache_key, gpkg_filepath)
+    if not osm_gpkg:
+        osm_gpkg = g.run(subtask_start=77, subtask_percentage=8, eta=eta)  # 77% to 85%
+        if osm_gpkg:
+            extract_cache.add_gpkg(geom, gpkg_cache_key, osm_gpkg)
     if not osm_gpkg:
         export_task_record = get_export_task_record(export_task_record_uid)
         cancel_export_provider_task.run(
@@ -486,17 +599,10 @@ def osm_data_collection_pipeline(
     # --- Add the Land Boundaries polygon layer, this accounts for the majority of post-processing time
     update_progress(export_task_record_uid, 85.5, eta=eta, msg="Clipping data in Geopackage")
 
-    database = settings.DATABASES["feature_data"]
-    in_dataset = "PG:dbname={name} host={host} user={user} password={password} port={port}".format(
-        host=database["HOST"],
-        user=database["USER"],
-        password=database["PASSWORD"].replace("$", "\$"),
-        port=database["PORT"],
-        name=database["NAME"],
-    )
+    land_dataset, land_boundary = get_land_polygons(selection, geom, stage_dir, task_uid=export_task_record_uid)
     gdalutils.convert(
-        boundary=selection,
-        input_file=in_dataset,
+        boundary=land_boundary,
+        input_file=land_dataset,
         output_file=gpkg_filepath,
         layers=["land_polygons"],
         driver="gpkg",
@@ -1319,6 +1425,7 @@ def wfs_export_task(
             stage_dir,
             get_wfs_query_url(name, service_url, layer, projection),
             configuration.get("cert_info"),
+            concurrency=configuration.get("concurrency"),
         )
 
     result["driver"] = "gpkg"
@@ -1509,6 +1616,7 @@ def arcgis_feature_service_export_task(
             get_arcgis_query_url(service_url),
             configuration.get("cert_info"),
             feature_data=True,
+            concurrency=configuration.get("concurrency"),
         )
 
     if not (out and geopackage.check_content_exists(out)):
@@ -1943,6 +2051,30 @@ def finalize_export_provider_task(result=None, data_provider_task_uid=None, stat
     return result
 
 
+@app.task(name="Merge Format Results", base=EventKitBaseTask, acks_late=True)
+def merge_format_results_task(results=None, *args, **kwargs):
+    """
+    Combines the results of format tasks which ran in parallel, so that the following tasks get a single result.
+    :param results: A list of the results of each branch of format tasks.
+    :return: A result with the status of the least successful branch.
+    """
+    merged_result = {}
+    statuses = []
+    for result in results or []:
+        if isinstance(result, dict):
+            # Only the outputs of the primary task are passed on, each branch's own outputs (e.g. result and driver)
+            # would overwrite each other.
+            merged_result.update({key: result[key] for key in MERGED_RESULT_KEYS if key in result})
+            statuses.append(result.get("status"))
+    for status in [TaskState.CANCELED.value, TaskState.FAILED.value]:
+        if status in statuses:
+            merged_result["status"] = status
+            break
+    else:
+        merged_result["status"] = TaskState.SUCCESS.value
+    return merged_result
+
+
 @gdalutils.retry
 def zip_files(include_files, run_zip_file_uid, file_path=None, static_files=None, metadata=None, *args, **kwargs):
     """
@@ -1991,6 +2123,7 @@ def zip_files(include_files, run_zip_file_uid, file_path=None, static_files=None
                         )
                 manifest_ignore_files.append(filename)
                 zipfile.write(absolute_file_path, arcname=filename)
+        data_files = []
         for filepath in files:
             # This takes files from the absolute stage paths and puts them in the provider directories in the data dir.
             # (e.g. staging_root/run_uid/provider_slug/file_name.ext -> data/provider_slug/file_name.ext)
@@ -2016,16 +2149,20 @@ def zip_files(include_files, run_zip_file_uid, file_path=None, static_files=None
 
                 download_filename = get_download_filename(name, ext)
                 filename = get_archive_data_path(provider_slug, download_filename)
+            data_files.append((filepath, filename))
+
+        def update_message(filename):
             run_zip_file.message = f"Adding {filename} to zip archive."
-            zipfile.write(filepath, arcname=filename)
+
+        # The data files are compressed in parallel, and their CRCs are computed as they're written.
+        write_zip_files(
+            zipfile, data_files, max_workers=getattr(settings, "ZIP_CONCURRENCY", None), callback=update_message
+        )
 
         manifest_file = get_data_package_manifest(metadata=metadata, ignore_files=manifest_ignore_files)
         zipfile.write(manifest_file, arcname=os.path.join("MANIFEST", os.path.basename(manifest_file)))
         add_export_run_files_to_zip(zipfile, run_zip_file)
 
-        if zipfile.testzip():
-            raise Exception("The zipped file was corrupted.")
-
     return file_path
 
 
@@ -1,10 +1,10 @@
 import copy
-import json
 import logging
 import os
 import pickle
 import re
 import signal
+import threading
 import time
 import urllib.parse
 import uuid
@@ -32,10 +32,11 @@ from numpy import linspace
 from eventkit_cloud.core.helpers import get_or_update_session
 from eventkit_cloud.jobs.enumerations import GeospatialDataType
 from eventkit_cloud.jobs.models import ExportFormat, get_data_provider_label, get_data_type_from_provider, DataProvider
-from eventkit_cloud.tasks import DEFAULT_CACHE_EXPIRATION, set_cache_value
+from eventkit_cloud.tasks import set_cache_value
 from eventkit_cloud.tasks.exceptions import FailedException
 from eventkit_cloud.tasks.models import DataProviderTaskRecord, ExportRunFile, ExportTaskRecord
 from eventkit_cloud.utils import gdalutils
+from eventkit_cloud.utils.arcgis_feature_service import ArcGISFeatureService, EsriJsonParser
 from eventkit_cloud.utils.gdalutils import get_band_statistics, get_chunked_bbox
 from eventkit_cloud.utils.generic import cd, get_file_paths  # NOQA
 
@@ -54,6 +55,9 @@ UNSUPPORTED_CARTOGRAPHY_FORMATS = [".pbf", ".gpx"]
 
 CHUNK = 1024 * 1024 * 2  # 2MB chunks
 
+PROGRESS_UPDATE_INCREMENT = 5  # Minimum increase in percent before progress is written.
+PROGRESS_UPDATE_INTERVAL = 60  # Maximum number of seconds between writes while progress is changing.
+
 
 def get_run_staging_dir(run_uid):
     """
@@ -821,8 +825,20 @@ def merge_chunks(
     task_points=100,
     feature_data=False,
     distinct_field=None,
+    concurrency=None,
+    progress_tracker=None,
 ):
-    chunks = download_chunks(task_uid, bbox, stage_dir, base_url, cert_info, task_points, feature_data)
+    chunks = download_chunks(
+        task_uid,
+        bbox,
+        stage_dir,
+        base_url,
+        cert_info,
+        task_points,
+        feature_data,
+        concurrency=concurrency,
+        progress_tracker=progress_tracker,
+    )
     out = gdalutils.convert(
         driver="gpkg",
         input_file=chunks,
@@ -837,7 +853,7 @@ def merge_chunks(
     return out
 
 
-def download_chunks_concurrently(layer, task_points, feature_data):
+def download_chunks_concurrently(layer, task_points, feature_data, concurrency=None, progress_tracker=None):
     base_path = layer.get("base_path")
     if not os.path.exists(base_path):
         os.mkdir(base_path)
@@ -853,23 +869,37 @@ def download_chunks_concurrently(layer, task_points, feature_data):
         task_points=task_points,
         feature_data=feature_data,
         distinct_field=layer.get("distinct_field"),
+        concurrency=concurrency,
+        progress_tracker=progress_tracker,
     )
 
 
 def download_concurrently(layers: ValuesView, concurrency=None, feature_data=False):
     """
     Function concurrently downloads data from a given list URLs and download paths.
+    The concurrency limits the total number of chunks downloaded at the same time, it is split between the layers.
     """
 
     try:
-        executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+        concurrency = int(concurrency or getattr(settings, "CHUNK_CONCURRENCY", 1))
+        layer_concurrency = max(1, min(concurrency, len(layers)))
+        chunk_concurrency = max(1, concurrency // layer_concurrency)
+        executor = futures.ThreadPoolExecutor(max_workers=layer_concurrency)
 
-        # Get the total number of task points to compare against current progress.
+        # Each layer is worth 100 points of the total task points.
         task_points = len(layers) * 100
+        # All of the layers belong to the same task, so they report through a single tracker.
+        task_uid = next(iter(layers), {}).get("task_uid")
+        progress_tracker = ProgressTracker(task_uid, task_points=task_points)
 
         futures_list = [
             executor.submit(
-                download_chunks_concurrently, layer=layer, task_points=task_points, feature_data=feature_data
+                download_chunks_concurrently,
+                layer=layer,
+                task_points=100,
+                feature_data=feature_data,
+                concurrency=chunk_concurrency,
+                progress_tracker=progress_tracker,
             )
             for layer in layers
         ]
@@ -877,6 +907,7 @@ def download_concurrently(layers: ValuesView, concurrency=None, feature_data=Fal
 
         # result() is called for all futures so that any exception raised within is propagated to the caller.
         [ftr.result() for ftr in futures_list]
+        progress_tracker.flush()
 
     except Exception as e:
         logger.error(f"Unable to execute concurrent downloads: {e}")
@@ -886,31 +917,48 @@ def download_concurrently(layers: ValuesView, concurrency=None, feature_data=Fal
 
 
 @gdalutils.retry
-def download_feature_data(task_uid: str, input_url: str, out_file: str, cert_info=None, task_points=100):
+def download_feature_data(
+    task_uid: str, input_url: str, out_file: str, cert_info=None, task_points=100, progress_tracker=None
+):
     # This function is necessary because ArcGIS servers often either
     # respond with a 200 status code but also return an error message in the response body,
     # or redirect to a parent URL if a resource is not found.
+    # The response is validated while it is downloaded so that it doesn't need to be read again.
 
     try:
-        out_file = download_data(task_uid, input_url, out_file, cert_info=cert_info, task_points=task_points)
-        with open(out_file) as f:
-            json_response = json.load(f)
-
-            if json_response.get("error"):
-                logger.error(json_response)
-                raise Exception("The service did not receive a valid response.")
-
-            if "features" not in json_response:
-                logger.error(f"No features were returned for {input_url}")
-                raise Exception("No features were returned.")
+        parser = EsriJsonParser()
+        out_file = download_data(
+            task_uid,
+            input_url,
+            out_file,
+            cert_info=cert_info,
+            task_points=task_points,
+            progress_tracker=progress_tracker,
+            content_handler=parser.feed,
+        )
+        parser.close()
+        if not parser.feature_count:
+            logger.info(f"No features were returned for {input_url}")
 
     except Exception as e:
         logger.error(f"Feature data download error: {e}")
+        # Don't leave an invalid chunk behind, otherwise it would be treated as complete when the task is retried.
+        if os.path.isfile(out_file):
+            os.remove(out_file)
         raise e
 
     return out_file
 
 
+@gdalutils.retry
+def download_chunk_data(
+    task_uid: str, input_url: str, out_file: str, cert_info=None, task_points=100, progress_tracker=None
+):
+    return download_data(
+        task_uid, input_url, out_file, cert_info=cert_info, task_points=task_points, progress_tracker=progress_tracker,
+    )
+
+
 def download_chunks(
     task_uid: str,
     bbox: list,
@@ -920,17 +968,90 @@ def download_chunks(
     task_points=100,
     feature_data=False,
     level=15,
+    concurrency=None,
+    progress_tracker=None,
 ):
+    """
+    Downloads each chunk of the bbox concurrently.
+    Feature service chunks which exceed the layer's maxRecordCount are split into pages, which are also downloaded
+    concurrently.  Chunks or pages which already exist in the stage_dir (i.e. from a previous attempt of the task) are
+    not downloaded again.
+    :param task_points: The number of points all of the chunks are worth together.
+    :param concurrency: The maximum number of chunks to download at the same time, defaults to CHUNK_CONCURRENCY.
+    :param progress_tracker: A ProgressTracker shared by all of the chunks, one is created if not provided.
+    :return: A list of the chunk files in the same order as the chunked bbox.
+    """
     tile_bboxes = get_chunked_bbox(bbox, level=level)
-    chunks = []
+    owns_tracker = progress_tracker is None
+    if owns_tracker:
+        progress_tracker = ProgressTracker(task_uid, task_points=task_points)
+    chunk_points = task_points / (len(tile_bboxes) or 1)
+
+    chunk_urls = []
     for _index, _tile_bbox in enumerate(tile_bboxes):
         # Replace bbox placeholder here, allowing for the bbox as either a list or tuple
         url = base_url.replace("BBOX_PLACEHOLDER", urllib.parse.quote(str([*_tile_bbox]).strip("[]")))
         outfile = os.path.join(stage_dir, f"chunk{_index}.json")
+        chunk_urls.append((url, outfile))
 
-        download_function = download_feature_data if feature_data else download_data
-        download_function(task_uid, url, outfile, cert_info=cert_info, task_points=task_points)
-        chunks.append(outfile)
+    download_function = download_feature_data if feature_data else download_chunk_data
+    concurrency = int(concurrency or getattr(settings, "CHUNK_CONCURRENCY", 1))
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+    futures_list = []
+    try:
+        # Size the pooled connections for the number of concurrent downloads, so that they can all be kept alive.
+        get_or_update_session(cert_info=cert_info, pool_size=concurrency)
+        if feature_data:
+            feature_service = ArcGISFeatureService(base_url, cert_info=cert_info)
+            # Request the layer metadata once, before it is shared between threads.
+            if feature_service.supports_pagination:
+                chunk_pages = list(
+                    executor.map(
+                        lambda chunk: [chunk] if os.path.isfile(chunk[1]) else feature_service.get_pages(*chunk),
+                        chunk_urls,
+                    )
+                )
+            else:
+                chunk_pages = [[chunk] for chunk in chunk_urls]
+        else:
+            chunk_pages = [[chunk] for chunk in chunk_urls]
+
+        chunks = []
+        pending_pages = []
+        for pages in chunk_pages:
+            page_points = chunk_points / len(pages)
+            for url, outfile in pages:
+                chunks.append(outfile)
+                if os.path.isfile(outfile):
+                    logger.info(f"The chunk {outfile} was already downloaded, skipping.")
+                    progress_tracker.add(page_points)
+                    continue
+                pending_pages.append((url, outfile, page_points))
+
+        futures_list = [
+            executor.submit(
+                download_function,
+                task_uid,
+                url,
+                outfile,
+                cert_info=cert_info,
+                task_points=page_points,
+                progress_tracker=progress_tracker,
+            )
+            for url, outfile, page_points in pending_pages
+        ]
+        # result() is called for all futures so that any exception raised within is propagated to the caller.
+        for ftr in futures.as_completed(futures_list):
+            ftr.result()
+        if owns_tracker:
+            progress_tracker.flush()
+    except Exception:
+        # Stop any chunks which haven't started, the finished chunks are kept so that a retry can resume.
+        for ftr in futures_list:
+            ftr.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
     return chunks
 
 
@@ -945,9 +1066,14 @@ def download_data(
     task_points=100,
     cookie=None,
     provider_slug: str = None,
+    progress_tracker=None,
+    content_handler=None,
 ):
     """
     Function for downloading data, optionally using a certificate.
+    :param task_points: The number of points of the task's progress that this download is worth.
+    :param progress_tracker: An optional ProgressTracker to share between multiple downloads for the same task.
+    :param content_handler: An optional callable which is passed each chunk of data as it is written.
     """
 
     response = None
@@ -979,28 +1105,22 @@ def download_data(
     except Exception:
         logger.error("Unable to verify data type.")
 
-    written_size = 0
-    update_interval = total_size / 100
-    cache.set(get_task_progress_cache_key(task_uid), 0, timeout=DEFAULT_CACHE_EXPIRATION)
+    owns_tracker = progress_tracker is None
+    if owns_tracker:
+        progress_tracker = ProgressTracker(task_uid, task_points=task_points)
 
-    with logging_open(out_file, "wb") as file_:
+    # Write to a temporary file so that a partial download is never mistaken for a complete one.
+    partial_file = f"{out_file}.part"
+    with logging_open(partial_file, "wb") as file_:
         for chunk in response.iter_content(CHUNK):
             file_.write(chunk)
-            written_size += CHUNK
-
-            last_update = cache.get_or_set(get_last_update_cache_key(task_uid), 0)
-            last_update += CHUNK
-            cache.set(get_last_update_cache_key(task_uid), last_update, timeout=DEFAULT_CACHE_EXPIRATION)
+            if content_handler:
+                content_handler(chunk)
+            progress_tracker.add(len(chunk) / total_size * task_points)
+    os.replace(partial_file, out_file)
 
-            if last_update > update_interval:
-                updated_points = int((last_update / total_size) * 100) if last_update < total_size else 100
-                cache.incr(get_task_progress_cache_key(task_uid), updated_points)
-
-                progress_points = cache.get(get_task_progress_cache_key(task_uid))
-                progress = progress_points / task_points * 100 if progress_points < task_points else 100
-                update_progress(task_uid, progress)
-
-                cache.set(get_last_update_cache_key(task_uid), 0, timeout=DEFAULT_CACHE_EXPIRATION)
+    if owns_tracker:
+        progress_tracker.flush()
 
     if not os.path.isfile(out_file):
         raise Exception("Nothing was returned from the vector feature service.")
@@ -1008,18 +1128,6 @@ def download_data(
     return out_file
 
 
-def get_task_points_cache_key(task_uid: str):
-    return f"{task_uid}_task_points"
-
-
-def get_task_progress_cache_key(task_uid: str):
-    return f"{task_uid}_progress"
-
-
-def get_last_update_cache_key(task_uid: str):
-    return f"{task_uid}_mb_since_update"
-
-
 def find_in_zip(
     zip_filepath: str, extension: str, stage_dir: str, archive_extension: str = "zip", matched_files: list = list()
 ):
@@ -1148,6 +1256,132 @@ def update_progress(
         )
 
 
+class ProgressTracker(object):
+    """
+    Aggregates the progress of a task in memory and only writes it through update_progress when the progress has
+    increased by at least PROGRESS_UPDATE_INCREMENT percent, or when PROGRESS_UPDATE_INTERVAL seconds have passed and
+    the progress has changed.  This keeps the number of writes per task roughly fixed no matter how often progress is
+    reported.  The tracker is thread safe so that concurrent downloads for a task can share it.
+    """
+
+    def __init__(
+        self,
+        task_uid,
+        task_points=100,
+        subtask_percentage=100.0,
+        subtask_start=0,
+        eta=None,
+        increment=PROGRESS_UPDATE_INCREMENT,
+        interval=PROGRESS_UPDATE_INTERVAL,
+    ):
+        """
+        :param task_uid: A uid to reference the ExportTaskRecord.
+        :param task_points: The number of points that represents 100 percent of the work being tracked.
+        :param subtask_percentage: The percentage of the task that this tracker takes up, see update_progress.
+        :param subtask_start: Where this tracker's block of the task begins, see update_progress.
+        :param eta: An optional ETA estimator to pass to update_progress.
+        :param increment: The minimum increase in percent of progress before it is written.
+        :param interval: The maximum number of seconds between writes while the progress is changing.
+        """
+        self.task_uid = task_uid
+        self.task_points = task_points or 100
+        self.subtask_percentage = subtask_percentage
+        self.subtask_start = subtask_start
+        self.eta = eta
+        self.increment = increment
+        self.interval = interval
+        self.points = 0.0
+        self.last_progress = 0.0
+        self.last_update = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def progress(self):
+        """
+        :return: The current progress as a percent [0-100].
+        """
+        return min(self.points / self.task_points * 100.0, 100.0)
+
+    def add(self, points, msg=None):
+        """
+        Adds completed work to the tracker.
+        :param points: The number of task points completed since the last call.
+        :param msg: Message describing the current activity of the task.
+        """
+        with self.lock:
+            self.points += points
+            self._write(msg)
+
+    def update(self, progress, msg=None, force=False):
+        """
+        Sets the progress of the tracker.
+        :param progress: The percent of completion [0-100].
+        :param msg: Message describing the current activity of the task.
+        :param force: Write the progress even if no threshold has been reached.
+        """
+        with self.lock:
+            self.points = progress / 100.0 * self.task_points
+            self._write(msg, force=force)
+
+    def flush(self, msg=None):
+        """
+        Writes the current progress regardless of the thresholds.
+        :param msg: Message describing the current activity of the task.
+        """
+        with self.lock:
+            self._write(msg, force=True)
+
+    def _write(self, msg=None, force=False):
+        progress = self.progress
+        now = time.time()
+        if not force:
+            if progress == self.last_progress:
+                return
+            if progress - self.last_progress < self.increment and now - self.last_update < self.interval:
+                return
+        update_progress(
+            self.task_uid,
+            progress=progress,
+            subtask_percentage=self.subtask_percentage,
+            subtask_start=self.subtask_start,
+            eta=self.eta,
+            msg=msg,
+        )
+        self.last_progress = progress
+        self.last_update = now
+
+
+class SubProgressTracker(object):
+    """
+    Reports the progress of one part of the work tracked by a shared ProgressTracker, so that parts which run
+    concurrently can each report a percent of their own completion.  If a part is restarted its points are subtracted
+    again, so that the shared progress isn't counted twice.
+    """
+
+    def __init__(self, progress_tracker, task_points=100):
+        """
+        :param progress_tracker: The shared ProgressTracker.
+        :param task_points: The number of points of the shared tracker that this part is worth.
+        """
+        self.progress_tracker = progress_tracker
+        self.task_points = task_points
+        self.points = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, progress, msg=None, force=False):
+        """
+        Sets the progress of this part.
+        :param progress: The percent of completion of this part [0-100].
+        :param msg: Message describing the current activity of the task.
+        :param force: Unused, the shared tracker decides when to write the progress.
+        """
+        with self.lock:
+            points = progress / 100.0 * self.task_points
+            added_points = points - self.points
+            self.points = points
+        self.progress_tracker.add(added_points, msg=msg)
+
+
 def create_license_file(provider_task):
     # checks a DataProviderTaskRecord's license file and adds it to the file list if it exists
     data_provider_license = DataProvider.objects.get(slug=provider_task.provider.slug).license
@@ -39,6 +39,7 @@ from eventkit_cloud.tasks import (
     set_cache_value,
 )
 from eventkit_cloud.tasks.enumerations import TaskState
+from eventkit_cloud.utils.generic import link_file
 from eventkit_cloud.utils.s3 import download_folder_from_s3
 
 logger = logging.getLogger(__name__)
@@ -182,7 +183,9 @@ class FileProducingTaskResult(UIDMixin, NotificationModelMixin):
                 shutil.copytree(old_run_dir, new_run_dir)
             else:
                 if not os.path.exists(new_run_dir):
-                    shutil.copytree(download_dir, new_run_dir, ignore=shutil.ignore_patterns("run/*.zip"))
+                    shutil.copytree(
+                        download_dir, new_run_dir, ignore=shutil.ignore_patterns("run/*.zip"), copy_function=link_file,
+                    )
             cache.set(f"{new_run.uid}", True, DEFAULT_CACHE_EXPIRATION)
 
         for download in downloads:
@@ -403,6 +406,24 @@ class ExportTaskRecord(UIDMixin, TimeStampedModelMixin, TimeTrackingModelMixin):
     def __str__(self):
         return "ExportTaskRecord uid: {0}".format(str(self.uid))
 
+    def transition(self, only_from=None, **fields):
+        """
+        Saves a change to the task with a single UPDATE, instead of saving every field.
+        :param only_from: Only update the task if its status is still one of these statuses, so that a task which was
+            changed by another process (e.g. canceled) isn't overwritten.
+        :param fields: The fields to update.
+        :return: True if the task was updated.
+        """
+        fields["updated_at"] = timezone.now()
+        queryset = ExportTaskRecord.objects.filter(uid=self.uid)
+        if only_from is not None:
+            queryset = queryset.filter(status__in=only_from)
+        if not queryset.update(**fields):
+            return False
+        for field, value in fields.items():
+            setattr(self, field, value)
+        return True
+
     @property
     def progress(self):
         if TaskState[self.status] in TaskState.get_finished_states():
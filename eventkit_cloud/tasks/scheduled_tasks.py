@@ -30,6 +30,7 @@ from eventkit_cloud.tasks.models import ExportRun
 from eventkit_cloud.tasks.task_base import LockingTask, EventKitBaseTask
 from eventkit_cloud.tasks.util_tasks import shutdown_celery_workers
 from eventkit_cloud.utils.docker_client import DockerClient
+from eventkit_cloud.utils.mapproxy import seed_tile_cache
 from eventkit_cloud.utils.pcf import PcfClient
 from eventkit_cloud.utils.stats.generator import update_all_statistics_caches
 
@@ -363,7 +364,48 @@ def clean_up_queues_task():
 
 @app.task(name="Clear Tile Cache", base=EventKitBaseTask)
 def clear_tile_cache_task():
-    call_command("clear_tile_cache")
+    call_command("clear_tile_cache", max_size=settings.TILE_CACHE_MAX_SIZE)
+    if getattr(settings, "TILE_STORE_DIR", None):
+        call_command("clear_tile_cache", max_size=settings.TILE_STORE_MAX_SIZE, directory=settings.TILE_STORE_DIR)
+    if getattr(settings, "OSM_EXTRACT_CACHE_DIR", None):
+        call_command(
+            "clear_tile_cache", max_size=settings.OSM_EXTRACT_CACHE_MAX_SIZE, directory=settings.OSM_EXTRACT_CACHE_DIR
+        )
+
+
+@app.task(name="Seed Tile Cache", base=EventKitBaseTask)
+def seed_tile_cache_task():
+    """
+    Warms the map tile cache for the providers used by the most recent jobs.  The low zoom levels are seeded for the
+    whole world and the higher zoom levels for the AOIs of the recent jobs.
+    """
+    from eventkit_cloud.jobs.models import DataProviderTask
+
+    since = timezone.now() - timezone.timedelta(days=settings.TILE_CACHE_SEED_DAYS)
+    provider_tasks = (
+        DataProviderTask.objects.filter(job__created_at__gte=since, provider__display=True)
+        .select_related("provider", "job")
+        .order_by("-job__created_at")
+    )
+    provider_extents = OrderedDict()
+    providers = {}
+    for provider_task in provider_tasks:
+        providers[provider_task.provider.slug] = provider_task.provider
+        provider_extents.setdefault(provider_task.provider.slug, []).append(provider_task.job.extents)
+
+    base_level = settings.TILE_CACHE_SEED_BASE_LEVEL
+    popular_slugs = sorted(provider_extents, key=lambda slug: len(provider_extents[slug]), reverse=True)
+    for slug in popular_slugs[: settings.TILE_CACHE_SEED_PROVIDERS]:
+        provider = providers[slug]
+        max_level = min(settings.TILE_CACHE_SEED_MAX_LEVEL, provider.level_to or base_level)
+        seeds = [([-180, -90, 180, 90], 0, min(base_level, max_level))]
+        if max_level > base_level:
+            extents = list(OrderedDict.fromkeys(provider_extents[slug]))[: settings.TILE_CACHE_SEED_AOIS]
+            seeds += [(list(extent), base_level + 1, max_level) for extent in extents]
+        try:
+            seed_tile_cache(slug, seeds)
+        except Exception as e:
+            logger.error(f"Unable to seed the tile cache for {slug}: {e}")
 
 
 @app.task(name="Clear User Sessions", base=EventKitBaseTask)
@@ -3,12 +3,13 @@ import importlib
 import logging
 from typing import List
 
-from celery import chain  # required for tests
+from celery import chain, chord  # required for tests
+from django.conf import settings
 from django.db import DatabaseError
 
 from eventkit_cloud.jobs.models import DataProviderTask, ExportFormat
 from eventkit_cloud.tasks.enumerations import TaskState
-from eventkit_cloud.tasks.export_tasks import reprojection_task, create_datapack_preview
+from eventkit_cloud.tasks.export_tasks import reprojection_task, create_datapack_preview, merge_format_results_task
 from eventkit_cloud.tasks.helpers import (
     normalize_name,
     get_metadata,
@@ -139,23 +140,30 @@ class TaskChainBuilder(object):
         Create a celery chain which gets the data & runs export formats
         """
         if export_tasks:
-            subtasks = list()
+            # Each branch is a format task followed by its reprojections, which need the format task's result, and
+            # whether the branch moves the output of the primary task, so has to run after the others.
+            branches = list()
             if data_provider.preview_url:
-                subtasks.append(
-                    create_datapack_preview.s(
-                        run_uid=run.uid,
-                        stage_dir=stage_dir,
-                        task_uid=data_provider_task.uid,
-                        user_details=user_details,
-                        task_record_uid=data_provider_task_record.uid,
-                    ).set(queue=queue_group, routing_key=queue_group)
+                branches.append(
+                    (
+                        [
+                            create_datapack_preview.s(
+                                run_uid=run.uid,
+                                stage_dir=stage_dir,
+                                task_uid=data_provider_task.uid,
+                                user_details=user_details,
+                                task_record_uid=data_provider_task_record.uid,
+                            ).set(queue=queue_group, routing_key=queue_group)
+                        ],
+                        False,
+                    )
                 )
 
             for current_format, (export_task_record, export_task) in export_tasks.items():
                 supported_projections = get_supported_projections(current_format)
                 default_projection = get_default_projection(supported_projections, selected_projections=projections)
 
-                subtasks.append(
+                branch = [
                     export_task.s(
                         run_uid=run.uid,
                         stage_dir=stage_dir,
@@ -175,7 +183,8 @@ class TaskChainBuilder(object):
                         layer=data_provider.layer,
                         service_type=service_type,
                     ).set(queue=queue_group, routing_key=queue_group)
-                )
+                ]
+                moves_source = False
 
                 for projection in list(set(supported_projections) & set(projections)):
 
@@ -190,20 +199,29 @@ class TaskChainBuilder(object):
                         worker=worker,
                         display=getattr(export_task, "display", True),
                     )
-                    subtasks.append(
+                    # Reprojecting to 4326 moves the source file instead of converting it, so only those tasks need
+                    # to hold the provider's lock.
+                    if "4326" in str(projection):
+                        moves_source = True
+                        locking_task_key = data_provider_task_record.uid
+                    else:
+                        locking_task_key = projection_task.uid
+                    branch.append(
                         reprojection_task.s(
                             run_uid=run.uid,
                             stage_dir=stage_dir,
                             job_name=job_name,
                             task_uid=projection_task.uid,
                             user_details=user_details,
-                            locking_task_key=data_provider_task_record.uid,
+                            locking_task_key=locking_task_key,
                             projection=projection,
                             config=data_provider.config,
                         ).set(queue=queue_group, routing_key=queue_group)
                     )
 
-            format_tasks = chain(subtasks)
+                branches.append((branch, moves_source))
+
+            format_tasks = get_format_tasks(branches, queue_group)
         else:
             format_tasks = None
 
@@ -258,6 +276,29 @@ class TaskChainBuilder(object):
         return data_provider_task_record.uid, tasks
 
 
+def get_format_tasks(branches, queue_group=None):
+    """
+    Runs the branches of format tasks in parallel, they all read the output of the primary task independently.
+    Without CELERY_PARALLEL_FORMAT_TASKS the branches are chained in the order they were given.
+    :param branches: A list of tuples of a list of task signatures, which are chained, and whether the branch has to run
+    after all of the other branches.
+    :param queue_group: The queue for the task which merges the results of the parallel branches.
+    :return: A celery signature for all of the format tasks.
+    """
+    serial_branches = [branch for branch, serial in branches if serial]
+    parallel_branches = [branch for branch, serial in branches if not serial]
+    if not getattr(settings, "CELERY_PARALLEL_FORMAT_TASKS", False) or len(parallel_branches) < 2:
+        return chain([task for branch, _ in branches for task in branch])
+
+    format_tasks = chord(
+        [chain(branch) for branch in parallel_branches],
+        merge_format_results_task.s().set(queue=queue_group, routing_key=queue_group),
+    )
+    if serial_branches:
+        format_tasks = chain(format_tasks, *[task for branch in serial_branches for task in branch])
+    return format_tasks
+
+
 def create_format_task(task_format):
     task_fq_name = export_task_registry[task_format]
     # instantiate the required class.
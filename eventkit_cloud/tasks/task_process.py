@@ -1,18 +1,62 @@
 import collections
+import collections.abc
+import io
 import logging
+import os
 import subprocess
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from django.db import connection
 
+from eventkit_cloud.tasks.exceptions import CancelException
+
 logger = logging.getLogger(__name__)
 
+# The number of lines of output kept from each command, the rest is only logged.
+MAX_OUTPUT_LINES = 1000
+
+_gdal_configured_pid = None
+_canceled_tasks = set()
+
+
+def configure_gdal():
+    """
+    Configures GDAL once for each worker process, the settings apply to all of its threads.
+    """
+    global _gdal_configured_pid
+    if _gdal_configured_pid == os.getpid():
+        return
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    gdal_cachemax = getattr(settings, "GDAL_CACHEMAX", None)
+    if gdal_cachemax:
+        gdal.SetCacheMax(int(gdal_cachemax) * 1024 * 1024)
+    gdal_num_threads = getattr(settings, "GDAL_NUM_THREADS", None)
+    if gdal_num_threads:
+        gdal.SetConfigOption("GDAL_NUM_THREADS", str(gdal_num_threads))
+    _gdal_configured_pid = os.getpid()
+
+
+def is_canceled(task_uid):
+    """
+    :param task_uid: The uid of an export task.
+    :return: True if a TaskProcess of this process found that the task was canceled, so that long running functions can
+        stop early (e.g. by returning 0 from a GDAL progress callback).
+    """
+    return bool(task_uid) and str(task_uid) in _canceled_tasks
+
 
 class TaskProcess(object):
     """Wraps a Task subprocess up and handles logic specifically for the application.
     If the child process calls other subprcesses use billiard.
     Note, unlike multi-use process classes start and join/wait happen during instantiation."""
 
+    # How often (in seconds) to check whether the task was canceled while a command runs.
+    cancel_check_interval = 5
+
     def __init__(self, task_uid=None):
         from eventkit_cloud.tasks.models import ExportTaskRecord
 
@@ -23,27 +67,143 @@ class TaskProcess(object):
         self.export_task = ExportTaskRecord.objects.filter(uid=self.task_uid).first()
 
     def start_process(self, command=None, *args, **kwargs):
-        from eventkit_cloud.tasks.enumerations import TaskState
-
         # We need to close the existing connection because the logger could be using a forked process which,
         # will be invalid and throw an error.
         connection.close()
 
-        if isinstance(command, collections.Callable):
-            with ThreadPoolExecutor() as executor:
-                future = executor.submit(command)
-                future.result()
+        if isinstance(command, collections.abc.Callable):
+            self.run_function(command)
         else:
             proc = subprocess.Popen(command, *args, **kwargs)
-            (self.stdout, self.stderr) = proc.communicate()
             self.store_pid(pid=proc.pid)
+            self.wait_subprocess(proc)
+        self.check_canceled()
+
+    def run_function(self, function):
+        """
+        Runs a function in the calling thread, so that callers which already run several functions in threads (e.g.
+        download_concurrently) run them in parallel, since GDAL releases the GIL while it works.  Meanwhile another
+        thread checks whether the task was canceled, and marks it so that the function can stop early.
+        :param function: The function to run.
+        :return: The result of the function.
+        """
+        configure_gdal()
+        if not self.export_task:
+            return function()
+
+        task_uid = str(self.task_uid)
+        finished = threading.Event()
+
+        def watch_canceled():
+            try:
+                while not finished.wait(self.cancel_check_interval):
+                    try:
+                        self.check_canceled(refresh=True)
+                    except CancelException:
+                        _canceled_tasks.add(task_uid)
+                        return
+            finally:
+                # Database connections belong to the thread which opened them.
+                connection.close()
+
+        watcher = threading.Thread(target=watch_canceled, name=f"cancel-{task_uid}", daemon=True)
+        watcher.start()
+        try:
+            return function()
+        finally:
+            finished.set()
+            watcher.join()
+            # The mark is removed once the function returns, so that the set doesn't grow for the life of the worker.
+            _canceled_tasks.discard(task_uid)
+
+    def wait_subprocess(self, proc):
+        # The output is read as it's written so that it doesn't have to fit in memory, and so that it is logged while
+        # the command runs.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stdout = executor.submit(self.read_output, proc.stdout) if proc.stdout else None
+            stderr = executor.submit(self.read_output, proc.stderr) if proc.stderr else None
+            while True:
+                try:
+                    self.exitcode = proc.wait(timeout=self.cancel_check_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    try:
+                        self.check_canceled(refresh=True)
+                    except CancelException:
+                        proc.terminate()
+                        raise
+            self.stdout = stdout.result() if stdout else None
+            self.stderr = stderr.result() if stderr else None
+
+    @staticmethod
+    def read_output(stream):
+        """
+        :param stream: A pipe from a subprocess.
+        :return: The last MAX_OUTPUT_LINES of the output.
+        """
+        lines = collections.deque(maxlen=MAX_OUTPUT_LINES)
+        for line in stream:
+            logger.debug(line.rstrip())
+            lines.append(line)
+        stream.close()
+        return ("" if isinstance(stream, io.TextIOBase) else b"").join(lines)
+
+    def stream_process(self, command=None, input_chunks=None, output=None, chunk_size=1024 * 1024, **kwargs):
+        """
+        Runs a command that reads from stdin and writes to stdout, without staging either on disk.
+        :param command: The command to run.
+        :param input_chunks: An iterable of bytes which are written to the stdin of the command.
+        :param output: A file-like object which the stdout of the command is written to.
+        :param chunk_size: The number of bytes to read from stdout at a time.
+        :return: None
+        """
+        connection.close()
+
+        proc = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+        )
+        self.store_pid(pid=proc.pid)
+
+        def feed():
+            try:
+                for chunk in input_chunks:
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                # The command exited early, its exit code will be reported instead.
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        # Stdin and stderr are handled in threads so that none of the pipes can fill up and block the command.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fed = executor.submit(feed)
+            stderr = executor.submit(proc.stderr.read)
+            for data in iter(lambda: proc.stdout.read(chunk_size), b""):
+                output.write(data)
             self.exitcode = proc.wait()
+            self.stderr = stderr.result()
+            # Raise any errors from the input, e.g. a failed download.
+            fed.result()
 
-        if self.export_task and self.export_task.status == TaskState.CANCELED.value:
-            from eventkit_cloud.tasks.exceptions import CancelException
+        self.check_canceled()
+
+    def check_canceled(self, refresh=False):
+        """
+        :param refresh: Reload the status of the task, otherwise the status from when the process started is used.
+        :raises CancelException: If the task was canceled.
+        """
+        from eventkit_cloud.tasks.enumerations import TaskState
 
+        if self.export_task and refresh:
+            self.export_task.refresh_from_db(fields=["status", "cancel_user"])
+        if self.export_task and self.export_task.status == TaskState.CANCELED.value:
+            cancel_user = self.export_task.cancel_user
             raise CancelException(
-                task_name=self.export_task.export_provider_task.name, user_name=self.export_task.cancel_user.username,
+                task_name=self.export_task.export_provider_task.name,
+                user_name=cancel_user.username if cancel_user else None,
             )
 
     def store_pid(self, pid=None):
@@ -38,6 +38,7 @@ from eventkit_cloud.tasks.export_tasks import (
     bounds_export_task,
     parse_result,
     finalize_export_provider_task,
+    merge_format_results_task,
     FormatTask,
     wait_for_providers_task,
     create_zip_task,
@@ -52,6 +53,7 @@ from eventkit_cloud.tasks.export_tasks import (
     reprojection_task,
     ogcapi_process_export_task,
     get_ogcapi_data,
+    get_land_polygons,
 )
 from eventkit_cloud.tasks.export_tasks import zip_files
 from eventkit_cloud.tasks.helpers import default_format_time
@@ -475,8 +477,13 @@ class TestExportTasks(ExportTaskBase):
             layer=layer,
             bbox=[1, 2, 3, 4],
         )
-        mock_download_data.assert_called_with(
-            str(saved_export_task.uid), ANY, expected_input_path[3], cert_info=None, task_points=100
+        mock_download_data.assert_any_call(
+            str(saved_export_task.uid),
+            ANY,
+            expected_input_path[3],
+            cert_info=None,
+            task_points=ANY,
+            progress_tracker=ANY,
         )
 
     @patch("eventkit_cloud.utils.gdalutils.convert")
@@ -591,6 +598,10 @@ class TestExportTasks(ExportTaskBase):
         self.assertEqual(expected_output_path, result["result"])
         self.assertEqual(example_input_file, result["source"])
 
+    @patch("eventkit_cloud.tasks.export_tasks.get_file_timestamp")
+    @patch("eventkit_cloud.tasks.export_tasks.get_land_polygons")
+    @patch("eventkit_cloud.tasks.export_tasks.get_osm_last_update")
+    @patch("eventkit_cloud.tasks.export_tasks.OSMExtractCache")
     @patch("eventkit_cloud.tasks.export_tasks.sqlite3.connect")
     @patch("eventkit_cloud.tasks.export_tasks.cancel_export_provider_task.run")
     @patch("eventkit_cloud.tasks.export_tasks.get_export_filepath")
@@ -615,7 +626,12 @@ class TestExportTasks(ExportTaskBase):
         mock_get_export_filepath,
         mock_cancel_provider_task,
         mock_connect,
+        mock_osm_extract_cache,
+        mock_get_osm_last_update,
+        mock_get_land_polygons,
+        mock_get_file_timestamp,
     ):
+        mock_get_land_polygons.return_value = ("/path/to/land_polygons.gpkg", None)
         provider_slug = "osm"
         mock_get_export_task_record.return_value = Mock(export_provider_task=Mock(provider=Mock(slug=provider_slug)))
         example_export_task_record_uid = "1234"
@@ -624,6 +640,8 @@ class TestExportTasks(ExportTaskBase):
         example_gpkg = "/path/to/file.gpkg"
         mock_get_export_filepath.return_value = example_gpkg
         mock_geopackage.Geopackage.return_value = Mock(results=[Mock(parts=[example_gpkg])])
+        mock_osm_extract_cache.return_value.get_pbf.return_value = None
+        mock_osm_extract_cache.return_value.get_gpkg.return_value = None
         # Test with using overpass
         example_overpass_query = "some_query; out;"
         example_config = {"overpass_query": example_overpass_query}
@@ -632,9 +650,34 @@ class TestExportTasks(ExportTaskBase):
         )
         mock_connect.assert_called_once()
         mock_overpass.Overpass.assert_called_once()
-        mock_pbf.OSMToPBF.assert_called_once()
+        mock_pbf.OSMToPBF.assert_not_called()
+        self.assertIn("pbf_filename", mock_overpass.Overpass().run_query.call_args[1])
         mock_feature_selection.example.assert_called_once()
         mock_cancel_provider_task.assert_not_called()
+        mock_osm_extract_cache.return_value.add_pbf.assert_called_once_with(
+            example_bbox, mock_overpass.Overpass().run_query.return_value
+        )
+        mock_osm_extract_cache.return_value.add_gpkg.assert_called_once()
+
+        # Test reusing a cached extract and geopackage.
+        mock_overpass.Overpass().run_query.reset_mock()
+        mock_geopackage.Geopackage().run.reset_mock()
+        mock_osm_extract_cache.return_value.get_pbf.return_value = "/path/to/query.pbf"
+        mock_osm_extract_cache.return_value.get_gpkg.return_value = example_gpkg
+        osm_data_collection_pipeline(
+            example_export_task_record_uid, stage_dir, bbox=example_bbox, config=yaml.dump(example_config)
+        )
+        mock_overpass.Overpass().run_query.assert_not_called()
+        mock_geopackage.Geopackage().run.assert_not_called()
+        mock_osm_extract_cache.return_value.get_pbf.return_value = None
+        mock_osm_extract_cache.return_value.get_gpkg.return_value = None
+
+        # Test converting the overpass results to pbf after they are downloaded.
+        with self.settings(OVERPASS_STREAM_TO_PBF=False):
+            osm_data_collection_pipeline(
+                example_export_task_record_uid, stage_dir, bbox=example_bbox, config=yaml.dump(example_config)
+            )
+        mock_pbf.OSMToPBF.assert_called_once()
 
         # Test canceling the provider task on an empty geopackage.
         mock_geopackage.Geopackage().run.return_value = None
@@ -658,6 +701,53 @@ class TestExportTasks(ExportTaskBase):
         mock_overpass.Overpass.assert_not_called()
         mock_pbf.OSMToPBF.assert_not_called()
         mock_feature_selection.assert_not_called()
+        mock_osm_extract_cache.assert_called_with(
+            provider_slug,
+            example_pbf_file,
+            mock_get_file_timestamp.return_value,
+            task_uid=example_export_task_record_uid,
+        )
+        mock_pbf.clip_pbf_file.assert_called_once_with(
+            example_pbf_file, example_bbox, mock_os.path.join.return_value, task_uid=example_export_task_record_uid
+        )
+        mock_geopackage.Geopackage.assert_called_once()
+        self.assertEqual(mock_pbf.clip_pbf_file.return_value, mock_geopackage.Geopackage.call_args[0][0])
+
+    @patch("eventkit_cloud.tasks.export_tasks.get_file_timestamp")
+    @patch("eventkit_cloud.tasks.export_tasks.OSMExtractCache")
+    @patch("eventkit_cloud.tasks.export_tasks.gdalutils")
+    @patch("eventkit_cloud.tasks.export_tasks.os.path.isfile")
+    def test_get_land_polygons(self, mock_isfile, mock_gdalutils, mock_osm_extract_cache, mock_get_file_timestamp):
+        stage_dir = settings.EXPORT_STAGING_ROOT
+        selection = "selection.geojson"
+        geometry = Mock()
+        clip_filepath = os.path.join(stage_dir, "land_polygons.gpkg")
+
+        # Without the land data file the database is clipped.
+        mock_isfile.return_value = False
+        dataset, boundary = get_land_polygons(selection, geometry, stage_dir)
+        self.assertTrue(dataset.startswith("PG:"))
+        self.assertEqual(selection, boundary)
+
+        # A cached clip of the AOI is used.
+        mock_isfile.return_value = True
+        with self.settings(LAND_DATA_FILE="/path/to/land_polygons.gpkg"):
+            mock_osm_extract_cache.return_value.get_gpkg.return_value = clip_filepath
+            self.assertEqual((clip_filepath, None), get_land_polygons(selection, geometry, stage_dir))
+            mock_gdalutils.convert.assert_not_called()
+            # The clips are cached apart from the providers.
+            mock_osm_extract_cache.assert_called_with(
+                "_land_polygons", "/path/to/land_polygons.gpkg", mock_get_file_timestamp.return_value, task_uid=None,
+            )
+
+            # Otherwise the land data file is clipped and added to the cache.
+            mock_osm_extract_cache.return_value.get_gpkg.return_value = None
+            self.assertEqual((clip_filepath, None), get_land_polygons(selection, geometry, stage_dir))
+            mock_gdalutils.convert.assert_called_once()
+            self.assertEqual("/path/to/land_polygons.gpkg", mock_gdalutils.convert.call_args[1]["input_file"])
+            mock_osm_extract_cache.return_value.add_gpkg.assert_called_once_with(
+                geometry, "land_polygons", clip_filepath
+            )
 
     @patch("eventkit_cloud.tasks.export_tasks.get_export_filepath")
     @patch("eventkit_cloud.tasks.export_tasks.get_creation_options")
@@ -830,14 +920,22 @@ class TestExportTasks(ExportTaskBase):
         )
         self.assertEqual(returned_result, expected_result)
 
+    @patch("eventkit_cloud.tasks.helpers.ArcGISFeatureService")
     @patch("eventkit_cloud.tasks.export_tasks.geopackage")
     @patch("eventkit_cloud.tasks.export_tasks.download_concurrently")
     @patch("eventkit_cloud.tasks.helpers.download_feature_data")
     @patch("eventkit_cloud.tasks.export_tasks.gdalutils.convert")
     @patch("celery.app.task.Task.request")
     def test_run_arcgis_feature_service_export_task(
-        self, mock_request, mock_convert, mock_download_feature_data, mock_download_concurrently, mock_geopackage
+        self,
+        mock_request,
+        mock_convert,
+        mock_download_feature_data,
+        mock_download_concurrently,
+        mock_geopackage,
+        mock_arcgis_feature_service,
     ):
+        mock_arcgis_feature_service.return_value.supports_pagination = False
         celery_uid = str(uuid.uuid4())
         type(mock_request).id = PropertyMock(return_value=celery_uid)
         job_name = self.job.name.lower()
@@ -897,8 +995,8 @@ class TestExportTasks(ExportTaskBase):
             bbox=bbox,
         )
 
-        mock_download_feature_data.assert_called_with(
-            str(saved_export_task.uid), expected_input_url, ANY, cert_info=None, task_points=100
+        mock_download_feature_data.assert_any_call(
+            str(saved_export_task.uid), expected_input_url, ANY, cert_info=None, task_points=ANY, progress_tracker=ANY,
         )
 
         mock_convert.assert_called_once_with(
@@ -1037,8 +1135,13 @@ class TestExportTasks(ExportTaskBase):
             service_url=url_1,
             bbox=bbox,
         )
-        mock_download_feature_data.assert_called_with(
-            str(saved_export_task.uid), expected_input_url, "dir/chunk3.json", cert_info=None, task_points=100
+        mock_download_feature_data.assert_any_call(
+            str(saved_export_task.uid),
+            expected_input_url,
+            "dir/chunk3.json",
+            cert_info=None,
+            task_points=ANY,
+            progress_tracker=ANY,
         )
 
     @patch("celery.app.task.Task.request")
@@ -1105,6 +1208,7 @@ class TestExportTasks(ExportTaskBase):
         self.assertEqual(error_type, ValueError)
         self.assertEqual("some unexpected error", str(msg))
 
+    @patch("eventkit_cloud.tasks.export_tasks.write_zip_files")
     @patch("eventkit_cloud.tasks.export_tasks.get_data_package_manifest")
     @patch("eventkit_cloud.tasks.export_tasks.gdalutils.retry")
     @patch("shutil.copy")
@@ -1114,10 +1218,25 @@ class TestExportTasks(ExportTaskBase):
     @patch("os.path.getsize")
     @patch("eventkit_cloud.tasks.export_tasks.s3.upload_to_s3")
     def test_zipfile_task(
-        self, s3, os_path_getsize, mock_os_walk, mock_zipfile, remove, copy, mock_retry, mock_get_data_package_manifest
+        self,
+        s3,
+        os_path_getsize,
+        mock_os_walk,
+        mock_zipfile,
+        remove,
+        copy,
+        mock_retry,
+        mock_get_data_package_manifest,
+        mock_write_zip_files,
     ):
         os_path_getsize.return_value = 20
 
+        def write_zip_files(zipfile, files, **kwargs):
+            for filepath, arcname in files:
+                zipfile.write(filepath, arcname=arcname)
+
+        mock_write_zip_files.side_effect = write_zip_files
+
         class MockZipFile:
             def __init__(self):
                 self.files = {}
@@ -1170,10 +1289,8 @@ class TestExportTasks(ExportTaskBase):
         self.assertEqual(zipfile.files, expected_archived_files)
         self.assertEqual(result, zipfile_path)
         mock_get_data_package_manifest.assert_called_once()
-
-        zipfile.testzip = Exception("Bad Zip")
-        with self.assertRaises(Exception):
-            zip_files(include_files=include_files, file_path=zipfile_path)
+        # The data files are written in parallel, and the archive isn't read back to verify it.
+        mock_write_zip_files.assert_called_once()
 
     @patch("celery.app.task.Task.request")
     @patch("eventkit_cloud.tasks.export_tasks.geopackage")
@@ -1371,6 +1488,19 @@ class TestExportTasks(ExportTaskBase):
         returned_result = parse_result(task_result, "test")
         self.assertEqual(expected_result, returned_result)
 
+    def test_merge_format_results_task(self):
+        results = [
+            {"source": "source.gpkg", "result": "file.shp", "status": TaskState.SUCCESS.value},
+            {"source": "source.gpkg", "result": "file.kml", "status": TaskState.SUCCESS.value},
+        ]
+        merged_result = merge_format_results_task.run(results)
+        self.assertEqual({"source": "source.gpkg", "status": TaskState.SUCCESS.value}, merged_result)
+
+        results.append({"status": TaskState.FAILED.value})
+        self.assertEqual(TaskState.FAILED.value, merge_format_results_task.run(results)["status"])
+        results.append({"status": TaskState.CANCELED.value})
+        self.assertEqual(TaskState.CANCELED.value, merge_format_results_task.run(results)["status"])
+
     def test_finalize_export_provider_task(self):
         worker_name = "test_worker"
         task_pid = 55
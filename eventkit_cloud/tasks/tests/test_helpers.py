@@ -11,7 +11,7 @@ from django.test import TestCase
 from django.utils import timezone
 
 from eventkit_cloud.tasks.enumerations import TaskState
-from unittest.mock import patch, call, Mock, MagicMock
+from unittest.mock import patch, call, Mock, MagicMock, ANY
 import os
 from eventkit_cloud.tasks.helpers import (
     get_style_files,
@@ -28,6 +28,10 @@ from eventkit_cloud.tasks.helpers import (
     get_download_filename,
     get_data_package_manifest,
     update_progress,
+    download_chunks,
+    download_concurrently,
+    ProgressTracker,
+    SubProgressTracker,
 )
 from eventkit_cloud.tasks.helpers import progressive_kill
 
@@ -412,3 +416,142 @@ class TestHelpers(TestCase):
                 call(uid=uid, attribute="estimated_finish", model_name="ExportTaskRecord", value=estimated),
             ]
         )
+
+    @patch("eventkit_cloud.tasks.helpers.ProgressTracker")
+    @patch("eventkit_cloud.tasks.helpers.download_chunks_concurrently")
+    def test_download_concurrently(self, mock_download_chunks_concurrently, mock_progress_tracker):
+        # The concurrency is shared by all of the layers rather than used for each one.
+        for layer_count, concurrency, expected_chunk_concurrency in [(2, 8, 4), (3, 4, 1), (8, 4, 1), (1, 4, 4)]:
+            mock_download_chunks_concurrently.reset_mock()
+            layers = {str(index): {"task_uid": "1234"} for index in range(layer_count)}
+            download_concurrently(layers.values(), concurrency=concurrency)
+            self.assertEqual(layer_count, mock_download_chunks_concurrently.call_count)
+            for _, kwargs in mock_download_chunks_concurrently.call_args_list:
+                self.assertEqual(expected_chunk_concurrency, kwargs["concurrency"])
+
+    @patch("eventkit_cloud.tasks.helpers.os.path.isfile")
+    @patch("eventkit_cloud.tasks.helpers.download_feature_data")
+    @patch("eventkit_cloud.tasks.helpers.download_data")
+    @patch("eventkit_cloud.tasks.helpers.get_chunked_bbox")
+    def test_download_chunks(self, mock_get_chunked_bbox, mock_download_data, mock_download_feature_data, mock_isfile):
+        task_uid = "1234"
+        stage_dir = "/stage"
+        base_url = "https://abc.gov/query?bbox=BBOX_PLACEHOLDER"
+        mock_get_chunked_bbox.return_value = [(0, 0, 1, 1), (1, 0, 2, 1), (0, 1, 1, 2)]
+        expected_chunks = [os.path.join(stage_dir, f"chunk{index}.json") for index in range(3)]
+        # The second chunk was already downloaded by a previous attempt.
+        mock_isfile.side_effect = lambda path: path == expected_chunks[1]
+        mock_download_data.side_effect = lambda task_uid, url, out_file, **kwargs: out_file
+
+        chunks = download_chunks(task_uid, [0, 0, 2, 2], stage_dir, base_url, concurrency=2)
+
+        self.assertEqual(expected_chunks, chunks)
+        self.assertEqual(mock_download_data.call_count, 2)
+        mock_download_data.assert_any_call(
+            task_uid,
+            "https://abc.gov/query?bbox=0%2C%200%2C%201%2C%201",
+            expected_chunks[0],
+            cert_info=None,
+            task_points=100 / 3,
+            progress_tracker=ANY,
+        )
+        mock_download_data.assert_any_call(
+            task_uid,
+            "https://abc.gov/query?bbox=0%2C%201%2C%201%2C%202",
+            expected_chunks[2],
+            cert_info=None,
+            task_points=100 / 3,
+            progress_tracker=ANY,
+        )
+        mock_download_feature_data.assert_not_called()
+
+        mock_download_data.reset_mock()
+        mock_download_feature_data.side_effect = Exception("No features were returned.")
+        with patch("eventkit_cloud.tasks.helpers.ArcGISFeatureService") as mock_arcgis_feature_service:
+            mock_arcgis_feature_service.return_value.supports_pagination = False
+            with self.assertRaises(Exception):
+                download_chunks(task_uid, [0, 0, 2, 2], stage_dir, base_url, feature_data=True, concurrency=1)
+        mock_download_data.assert_not_called()
+
+    @patch("eventkit_cloud.tasks.helpers.os.path.isfile")
+    @patch("eventkit_cloud.tasks.helpers.ArcGISFeatureService")
+    @patch("eventkit_cloud.tasks.helpers.download_feature_data")
+    @patch("eventkit_cloud.tasks.helpers.get_chunked_bbox")
+    def test_download_chunks_pages(
+        self, mock_get_chunked_bbox, mock_download_feature_data, mock_arcgis_feature_service, mock_isfile
+    ):
+        task_uid = "1234"
+        stage_dir = "/stage"
+        base_url = "https://abc.gov/query?geometry=BBOX_PLACEHOLDER"
+        mock_get_chunked_bbox.return_value = [(0, 0, 1, 1), (1, 0, 2, 1)]
+        feature_service = mock_arcgis_feature_service.return_value
+        feature_service.supports_pagination = True
+        # The first chunk is split into two pages, the first of which was already downloaded.
+        expected_pages = [
+            ("https://abc.gov/query?page=0", os.path.join(stage_dir, "chunk0-0.json")),
+            ("https://abc.gov/query?page=1", os.path.join(stage_dir, "chunk0-1.json")),
+        ]
+        feature_service.get_pages.side_effect = lambda url, out_file: (
+            expected_pages if out_file.endswith("chunk0.json") else [(url, out_file)]
+        )
+        mock_isfile.side_effect = lambda path: path == expected_pages[0][1]
+        mock_download_feature_data.side_effect = lambda task_uid, url, out_file, **kwargs: out_file
+
+        chunks = download_chunks(task_uid, [0, 0, 2, 2], stage_dir, base_url, feature_data=True, concurrency=2)
+
+        expected_chunks = [expected_pages[0][1], expected_pages[1][1], os.path.join(stage_dir, "chunk1.json")]
+        self.assertEqual(expected_chunks, chunks)
+        mock_arcgis_feature_service.assert_called_once_with(base_url, cert_info=None)
+        self.assertEqual(mock_download_feature_data.call_count, 2)
+        mock_download_feature_data.assert_any_call(
+            task_uid, expected_pages[1][0], expected_pages[1][1], cert_info=None, task_points=25, progress_tracker=ANY
+        )
+
+    @patch("eventkit_cloud.tasks.helpers.time")
+    @patch("eventkit_cloud.tasks.helpers.update_progress")
+    def test_progress_tracker(self, mock_update_progress, mock_time):
+        uid = "1234"
+        mock_time.time.return_value = 0
+        progress_tracker = ProgressTracker(uid, task_points=200, increment=5, interval=60)
+
+        # Less than the increment is only kept in memory.
+        progress_tracker.add(8)
+        mock_update_progress.assert_not_called()
+
+        progress_tracker.add(4, msg="Downloading")
+        mock_update_progress.assert_called_once_with(
+            uid, progress=6.0, subtask_percentage=100.0, subtask_start=0, eta=None, msg="Downloading"
+        )
+
+        # Small changes are written once the interval has passed.
+        mock_update_progress.reset_mock()
+        progress_tracker.add(2)
+        mock_update_progress.assert_not_called()
+        mock_time.time.return_value = 61
+        progress_tracker.add(2)
+        mock_update_progress.assert_called_once_with(
+            uid, progress=8.0, subtask_percentage=100.0, subtask_start=0, eta=None, msg=None
+        )
+
+        # Flushing always writes and progress is capped at 100.
+        mock_update_progress.reset_mock()
+        progress_tracker.update(150)
+        progress_tracker.flush()
+        mock_update_progress.assert_has_calls(
+            [
+                call(uid, progress=100.0, subtask_percentage=100.0, subtask_start=0, eta=None, msg=None),
+                call(uid, progress=100.0, subtask_percentage=100.0, subtask_start=0, eta=None, msg=None),
+            ]
+        )
+
+    def test_sub_progress_tracker(self):
+        progress_tracker = Mock()
+        sub_progress_tracker = SubProgressTracker(progress_tracker, task_points=50)
+
+        sub_progress_tracker.update(50, msg="Downloading")
+        progress_tracker.add.assert_called_once_with(25.0, msg="Downloading")
+
+        # Restarting the part removes the points that it had already added.
+        progress_tracker.reset_mock()
+        sub_progress_tracker.update(10)
+        progress_tracker.add.assert_called_once_with(-20.0, msg=None)
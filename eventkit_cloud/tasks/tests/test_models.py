@@ -281,6 +281,18 @@ class TestExportTask(TestCase):
         delete_from_s3.assert_called_once_with(download_url=download_url)
         remove.assert_called_once_with(full_download_path)
 
+    def test_transition(self):
+        self.assertTrue(self.task.transition(status=TaskState.RUNNING.value, pid=1))
+        self.assertEqual(TaskState.RUNNING.value, self.task.status)
+        saved_task = ExportTaskRecord.objects.get(uid=self.task_uid)
+        self.assertEqual((TaskState.RUNNING.value, 1), (saved_task.status, saved_task.pid))
+
+        # A task which was canceled by another process isn't changed.
+        ExportTaskRecord.objects.filter(uid=self.task_uid).update(status=TaskState.CANCELED.value)
+        self.assertFalse(self.task.transition(only_from=[TaskState.RUNNING.value], status=TaskState.SUCCESS.value))
+        self.assertEqual(TaskState.RUNNING.value, self.task.status)
+        self.assertEqual(TaskState.CANCELED.value, ExportTaskRecord.objects.get(uid=self.task_uid).status)
+
 
 class TestExportTaskException(TestCase):
     """
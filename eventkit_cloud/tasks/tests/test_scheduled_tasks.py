@@ -16,7 +16,7 @@ from django.test.utils import override_settings
 from django.utils import timezone
 from notifications.models import Notification
 
-from eventkit_cloud.jobs.models import DataProvider, DataProviderStatus
+from eventkit_cloud.jobs.models import DataProvider, DataProviderStatus, DataProviderTask
 from eventkit_cloud.jobs.models import Job
 from eventkit_cloud.tasks.models import ExportRun
 from eventkit_cloud.tasks.scheduled_tasks import (
@@ -31,6 +31,8 @@ from eventkit_cloud.tasks.scheduled_tasks import (
     get_celery_tasks_scale_by_task,
     scale_by_runs,
     scale_celery_task,
+    clear_tile_cache_task,
+    seed_tile_cache_task,
 )
 from eventkit_cloud.utils.provider_check import CheckResult
 
@@ -297,3 +299,61 @@ class TestCleanUpRabbit(TestCase):
         with self.settings(BROKER_API_URL=example_api_url):
             clean_up_queues_task()
             mock_delete_rabbit_objects.assert_called_once_with(example_api_url)
+
+
+class TestTileCacheTasks(TestCase):
+    fixtures = ("osm_provider.json",)
+
+    @patch("eventkit_cloud.tasks.scheduled_tasks.call_command")
+    def test_clear_tile_cache_task(self, mock_call_command):
+        with self.settings(
+            TILE_CACHE_MAX_SIZE=1000,
+            TILE_STORE_DIR="/tile_store",
+            TILE_STORE_MAX_SIZE=2000,
+            OSM_EXTRACT_CACHE_DIR="/osm_extract_cache",
+            OSM_EXTRACT_CACHE_MAX_SIZE=3000,
+        ):
+            clear_tile_cache_task()
+        mock_call_command.assert_any_call("clear_tile_cache", max_size=1000)
+        mock_call_command.assert_any_call("clear_tile_cache", max_size=2000, directory="/tile_store")
+        mock_call_command.assert_any_call("clear_tile_cache", max_size=3000, directory="/osm_extract_cache")
+
+    @patch("eventkit_cloud.tasks.scheduled_tasks.seed_tile_cache")
+    def test_seed_tile_cache_task(self, mock_seed_tile_cache):
+        with patch("eventkit_cloud.jobs.signals.Group"):
+            user = User.objects.create(username="test", email="test@test.com", password="test")
+        DataProvider.objects.update(display=True, level_to=14)
+        providers = list(DataProvider.objects.order_by("id")[:2])
+        extents = [(-10.85, 6.25, -10.62, 6.40), (1, 2, 3, 4)]
+        for extent in extents:
+            job = Job.objects.create(
+                name="TestJob", user=user, the_geom=GEOSGeometry(Polygon.from_bbox(extent), srid=4326)
+            )
+            DataProviderTask.objects.create(provider=providers[0], job=job)
+        DataProviderTask.objects.create(provider=providers[1], job=job)
+        old_job = Job.objects.create(
+            name="TestJob",
+            user=user,
+            the_geom=GEOSGeometry(Polygon.from_bbox((5, 6, 7, 8)), srid=4326),
+            created_at=timezone.now() - timezone.timedelta(days=30),
+        )
+        DataProviderTask.objects.create(provider=providers[1], job=old_job)
+
+        with self.settings(
+            TILE_CACHE_SEED_PROVIDERS=1,
+            TILE_CACHE_SEED_DAYS=7,
+            TILE_CACHE_SEED_BASE_LEVEL=4,
+            TILE_CACHE_SEED_MAX_LEVEL=12,
+        ):
+            seed_tile_cache_task()
+
+        # Only the most popular provider is seeded, with the most recent AOIs first.
+        mock_seed_tile_cache.assert_called_once()
+        slug, seeds = mock_seed_tile_cache.call_args[0]
+        self.assertEqual(providers[0].slug, slug)
+        self.assertEqual([-180, -90, 180, 90], seeds[0][0])
+        self.assertEqual((0, 4), seeds[0][1:])
+        self.assertEqual([(5, 12), (5, 12)], [seed[1:] for seed in seeds[1:]])
+        self.assertEqual(
+            [list(extent) for extent in reversed(extents)], [[round(c, 2) for c in seed[0]] for seed in seeds[1:]]
+        )
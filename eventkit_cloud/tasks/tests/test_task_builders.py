@@ -10,7 +10,7 @@ from django.test import TestCase
 
 from eventkit_cloud.jobs.models import ExportFormat, Job, Region, DataProviderTask, DataProvider
 from eventkit_cloud.tasks.export_tasks import osm_data_collection_task, mapproxy_export_task, wcs_export_task
-from eventkit_cloud.tasks.task_builders import TaskChainBuilder, create_export_task_record
+from eventkit_cloud.tasks.task_builders import TaskChainBuilder, create_export_task_record, get_format_tasks
 from eventkit_cloud.tasks.task_factory import create_run
 
 logger = logging.getLogger(__name__)
@@ -113,6 +113,30 @@ class TestTaskBuilder(TestCase):
         tasks = run.data_provider_task_records.first().tasks.filter(name="Geotiff Format (.tif)")
         self.assertIsNotNone(tasks)
 
+    @patch("eventkit_cloud.tasks.task_builders.merge_format_results_task")
+    @patch("eventkit_cloud.tasks.task_builders.chord")
+    @patch("eventkit_cloud.tasks.task_builders.chain")
+    def test_get_format_tasks(self, mock_chain, mock_chord, mock_merge_format_results_task):
+        branches = [(["shp", "shp-3857"], False), (["mbtiles", "mbtiles-4326"], True), (["kml"], False)]
+
+        # The branches are chained in their original order.
+        with self.settings(CELERY_PARALLEL_FORMAT_TASKS=False):
+            get_format_tasks(branches, "queue")
+        mock_chain.assert_called_once_with(["shp", "shp-3857", "mbtiles", "mbtiles-4326", "kml"])
+        mock_chord.assert_not_called()
+
+        mock_chain.reset_mock()
+        with self.settings(CELERY_PARALLEL_FORMAT_TASKS=True):
+            format_tasks = get_format_tasks(branches, "queue")
+        mock_chain.assert_any_call(["shp", "shp-3857"])
+        mock_chain.assert_any_call(["kml"])
+        mock_chord.assert_called_once_with(
+            [mock_chain.return_value, mock_chain.return_value],
+            mock_merge_format_results_task.s.return_value.set.return_value,
+        )
+        mock_chain.assert_called_with(mock_chord.return_value, "mbtiles", "mbtiles-4326")
+        self.assertEqual(mock_chain.return_value, format_tasks)
+
     @patch("eventkit_cloud.tasks.task_builders.ExportTaskRecord")
     def test_create_export_task_record(self, mock_export_task):
         from eventkit_cloud.tasks.enumerations import TaskState
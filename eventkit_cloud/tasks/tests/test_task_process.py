@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import Group, User
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.test import TestCase
+
+from eventkit_cloud.jobs.models import Job
+from eventkit_cloud.tasks.enumerations import TaskState
+from eventkit_cloud.tasks.exceptions import CancelException
+from eventkit_cloud.tasks.models import DataProviderTaskRecord, ExportRun, ExportTaskRecord
+from eventkit_cloud.tasks.task_process import TaskProcess, is_canceled
+
+
+class TestTaskProcess(TestCase):
+    def setUp(self):
+        self.export_task_record_patcher = patch("eventkit_cloud.tasks.models.ExportTaskRecord")
+        self.mock_export_task_record = self.export_task_record_patcher.start()
+        self.addCleanup(self.export_task_record_patcher.stop)
+        self.export_task = Mock(status=TaskState.RUNNING.value)
+        self.mock_export_task_record.objects.filter.return_value.first.return_value = self.export_task
+
+    @patch("eventkit_cloud.tasks.task_process.configure_gdal")
+    def test_start_process_callable(self, mock_configure_gdal):
+        task_process = TaskProcess(task_uid="1234")
+        self.assertIsNone(task_process.start_process(lambda: "gdal"))
+        self.assertEqual("gdal", task_process.run_function(lambda: "gdal"))
+        mock_configure_gdal.assert_called()
+
+        # Functions run in the calling thread, so callers which use threads (e.g. download_concurrently) run them in
+        # parallel.  The barrier only passes if both functions run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = [
+                executor.submit(TaskProcess(task_uid="1234").start_process, lambda: barrier.wait()) for _ in range(2)
+            ]
+            for result in results:
+                result.result()
+
+    def test_start_process_command(self):
+        task_process = TaskProcess(task_uid="1234")
+        task_process.start_process(
+            [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.assertEqual(3, task_process.exitcode)
+        self.assertEqual(b"out", task_process.stdout.strip())
+        self.assertEqual(b"err", task_process.stderr.strip())
+
+        task_process.start_process(
+            [sys.executable, "-c", "print('out')"], stdout=subprocess.PIPE, universal_newlines=True,
+        )
+        self.assertEqual("out", task_process.stdout.strip())
+
+    @patch("eventkit_cloud.tasks.task_process.configure_gdal")
+    def test_cancel_process(self, mock_configure_gdal):
+        def cancel(**kwargs):
+            self.export_task.status = TaskState.CANCELED.value
+
+        self.export_task.refresh_from_db.side_effect = cancel
+        task_process = TaskProcess(task_uid="1234")
+        task_process.cancel_check_interval = 0.01
+        marked = []
+
+        def function():
+            # The function stops early once the task is marked, like the GDAL progress callback.
+            for _ in range(500):
+                if is_canceled("1234"):
+                    marked.append(True)
+                    return
+                time.sleep(0.01)
+
+        with self.assertRaises(CancelException):
+            task_process.start_process(function)
+        self.assertEqual([True], marked)
+        # The task is no longer marked once the function returns.
+        self.assertFalse(is_canceled("1234"))
+
+        # The canceled function doesn't hold up the functions of other tasks.
+        self.assertEqual("gdal", TaskProcess(task_uid="5678").run_function(lambda: "gdal"))
+
+        self.export_task.status = TaskState.RUNNING.value
+        with self.assertRaises(CancelException):
+            task_process.start_process([sys.executable, "-c", "import time; time.sleep(5)"])
+
+
+class TestTaskProcessCancel(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group, created = Group.objects.get_or_create(name="TestDefaultExportExtentGroup")
+        with patch("eventkit_cloud.jobs.signals.Group") as mock_group:
+            mock_group.objects.get.return_value = group
+            user = User.objects.create_user(username="demo", email="demo@demo.com", password="demo", is_active=True)
+        the_geom = GEOSGeometry(Polygon.from_bbox((-7.96, 22.6, -8.14, 27.12)), srid=4326)
+        cls.job = Job.objects.create(
+            name="TestTaskProcess", description="Test description", user=user, the_geom=the_geom
+        )
+
+    def test_check_canceled(self):
+        run = ExportRun.objects.create(job=self.job, user=self.job.user)
+        export_provider_task = DataProviderTaskRecord.objects.create(run=run, name="provider")
+        export_task = ExportTaskRecord.objects.create(
+            export_provider_task=export_provider_task, status=TaskState.RUNNING.value
+        )
+        task_process = TaskProcess(task_uid=str(export_task.uid))
+        task_process.check_canceled(refresh=True)
+
+        # The task is canceled by another process without a user (e.g. by an admin task).
+        ExportTaskRecord.objects.filter(uid=export_task.uid).update(status=TaskState.CANCELED.value)
+        with self.assertRaises(CancelException):
+            task_process.check_canceled(refresh=True)
+
+        ExportTaskRecord.objects.filter(uid=export_task.uid).update(cancel_user=self.job.user)
+        with self.assertRaisesRegex(CancelException, "demo"):
+            task_process.check_canceled(refresh=True)
@@ -14,6 +14,7 @@ from eventkit_cloud.tasks.helpers import get_run_download_dir, get_run_staging_d
 from eventkit_cloud.tasks.models import ExportRun
 from eventkit_cloud.tasks.models import FileProducingTaskResult, RunZipFile, UserDownload
 from eventkit_cloud.tasks.task_factory import get_zip_task_chain
+from eventkit_cloud.utils.generic import link_file
 from eventkit_cloud.utils.s3 import download_folder_from_s3, get_presigned_url
 
 logger = getLogger(__name__)
@@ -77,7 +78,7 @@ def generate_zipfile(data_provider_task_record_uids, run_zip_file):
         download_folder_from_s3(str(run.uid))
     else:
         if not os.path.exists(stage_dir):
-            shutil.copytree(download_dir, stage_dir, ignore=shutil.ignore_patterns("*.zip"))
+            shutil.copytree(download_dir, stage_dir, ignore=shutil.ignore_patterns("*.zip"), copy_function=link_file)
 
     # Kick off the zip process with get_zip_task_chain
     return get_zip_task_chain(
@@ -0,0 +1,269 @@
+import codecs
+import json
+import logging
+import os
+from typing import List, Tuple
+from urllib.parse import urlencode
+
+from eventkit_cloud.core.helpers import get_or_update_session
+
+logger = logging.getLogger(__name__)
+
+JSON_WHITESPACE = " \t\n\r"
+
+
+class EsriJsonError(Exception):
+    pass
+
+
+class EsriJsonParser(object):
+    """
+    Incrementally parses an Esri JSON feature set (i.e. an ArcGIS query response) as it is downloaded.
+
+    Data is passed in with feed() as it arrives and only the unparsed remainder is kept in memory, so memory use stays
+    flat regardless of the size of the response.  The top level values other than the features are kept in metadata,
+    each feature is passed to the feature_handler (if provided) and then discarded.
+    """
+
+    START, KEY, COLON, VALUE, AFTER_VALUE, FEATURE, AFTER_FEATURE, DONE = range(8)
+
+    def __init__(self, feature_handler=None):
+        """
+        :param feature_handler: An optional callable which is passed each feature as a dict.
+        """
+        self.feature_handler = feature_handler
+        self.metadata = {}
+        self.feature_count = 0
+        self.has_features = False
+        self.state = self.START
+        self.key = None
+        self.buffer = ""
+        self.position = 0
+        self.final = False
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, data: bytes):
+        """
+        :param data: The next chunk of the response.
+        """
+        self.buffer = self.buffer[self.position :] + self.text_decoder.decode(data)
+        self.position = 0
+        self._parse()
+
+    def close(self):
+        """
+        Parses any remaining data and validates the response.
+        :raises EsriJsonError: If the response was an error, was incomplete, or didn't contain any features.
+        """
+        self.buffer = self.buffer[self.position :] + self.text_decoder.decode(b"", final=True)
+        self.position = 0
+        self.final = True
+        self._parse()
+
+        if self.metadata.get("error"):
+            logger.error(self.metadata.get("error"))
+            raise EsriJsonError("The service did not receive a valid response.")
+        if self.state != self.DONE or self.buffer[self.position :].strip(JSON_WHITESPACE):
+            raise EsriJsonError("The service returned an incomplete or invalid response.")
+        if not self.has_features:
+            raise EsriJsonError("No features were returned.")
+
+    def _next_char(self):
+        """
+        Skips whitespace and returns the next character without consuming it, or None if more data is needed.
+        """
+        while self.position < len(self.buffer) and self.buffer[self.position] in JSON_WHITESPACE:
+            self.position += 1
+        if self.position < len(self.buffer):
+            return self.buffer[self.position]
+        return None
+
+    def _decode_value(self):
+        """
+        Decodes the next JSON value, or returns (None, False) if more data is needed.
+        """
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if self.final:
+                raise EsriJsonError("The service returned an invalid response.")
+            return None, False
+        # A number (or literal) at the very end of the buffer might continue in the next chunk.
+        if end == len(self.buffer) and not self.final:
+            return None, False
+        self.position = end
+        return value, True
+
+    def _expect(self, char, next_state):
+        if self._next_char() != char:
+            raise EsriJsonError(f"Expected '{char}' in the service response.")
+        self.position += 1
+        self.state = next_state
+
+    def _parse(self):  # NOQA
+        while self.state != self.DONE:
+            char = self._next_char()
+            if char is None:
+                return
+
+            if self.state == self.START:
+                self._expect("{", self.KEY)
+
+            elif self.state == self.KEY:
+                if char == "}":
+                    self.position += 1
+                    self.state = self.DONE
+                    continue
+                key, complete = self._decode_value()
+                if not complete:
+                    return
+                if not isinstance(key, str):
+                    raise EsriJsonError("The service returned an invalid response.")
+                self.key = key
+                self.state = self.COLON
+
+            elif self.state == self.COLON:
+                self._expect(":", self.VALUE)
+
+            elif self.state == self.VALUE:
+                if self.key == "features" and char == "[":
+                    self.position += 1
+                    self.has_features = True
+                    self.state = self.FEATURE
+                    continue
+                value, complete = self._decode_value()
+                if not complete:
+                    return
+                self.metadata[self.key] = value
+                self.state = self.AFTER_VALUE
+
+            elif self.state == self.AFTER_VALUE:
+                if char == ",":
+                    self.position += 1
+                    self.state = self.KEY
+                else:
+                    self._expect("}", self.DONE)
+
+            elif self.state == self.FEATURE:
+                if char == "]" and not self.feature_count:
+                    self.position += 1
+                    self.state = self.AFTER_VALUE
+                    continue
+                feature, complete = self._decode_value()
+                if not complete:
+                    return
+                self.feature_count += 1
+                if self.feature_handler:
+                    self.feature_handler(feature)
+                self.state = self.AFTER_FEATURE
+
+            elif self.state == self.AFTER_FEATURE:
+                if char == ",":
+                    self.position += 1
+                    self.state = self.FEATURE
+                else:
+                    self._expect("]", self.AFTER_VALUE)
+
+
+class ArcGISFeatureService(object):
+    """
+    A client for querying an ArcGIS feature service layer.
+
+    The layer metadata is requested once and used to split queries into pages of at most maxRecordCount features, so
+    that dense areas aren't silently truncated by the server.
+    """
+
+    def __init__(self, query_url: str, cert_info: dict = None, slug: str = None):
+        """
+        :param query_url: A query url for the layer (e.g. https://host/arcgis/rest/services/x/FeatureServer/0/query?...)
+        :param cert_info: Optionally a dict containing cert path and pass.
+        :param slug: Optionally the provider slug used to look up credentials.
+        """
+        self.service_url = query_url.split("/query?")[0].rstrip("/")
+        self.cert_info = cert_info
+        self.slug = slug
+        self._metadata = None
+
+    def get_session(self):
+        return get_or_update_session(cert_info=self.cert_info, slug=self.slug)
+
+    @property
+    def metadata(self) -> dict:
+        """
+        :return: The layer metadata, or an empty dict if it couldn't be retrieved.
+        """
+        if self._metadata is None:
+            try:
+                response = self.get_session().get(self.service_url, params={"f": "json"})
+                response.raise_for_status()
+                metadata = response.json()
+                if metadata.get("error"):
+                    raise Exception(metadata.get("error"))
+            except Exception as e:
+                logger.warning(f"Unable to get the layer metadata for {self.service_url}: {e}")
+                metadata = {}
+            self._metadata = metadata
+        return self._metadata
+
+    @property
+    def max_record_count(self) -> int:
+        return int(self.metadata.get("maxRecordCount") or 0)
+
+    @property
+    def supports_pagination(self) -> bool:
+        advanced_query_capabilities = self.metadata.get("advancedQueryCapabilities") or {}
+        return bool(advanced_query_capabilities.get("supportsPagination") and self.max_record_count)
+
+    @property
+    def object_id_field(self) -> str:
+        if self.metadata.get("objectIdField"):
+            return self.metadata["objectIdField"]
+        for field in self.metadata.get("fields") or []:
+            if field.get("type") == "esriFieldTypeOID":
+                return field.get("name")
+        return "objectid"
+
+    def get_feature_count(self, query_url: str) -> int:
+        """
+        :param query_url: A query url for the layer.
+        :return: The number of features which match the query.
+        """
+        response = self.get_session().get(f"{query_url}&{urlencode({'returnCountOnly': 'true'})}")
+        response.raise_for_status()
+        response_content = response.json()
+        if "count" not in response_content:
+            raise Exception(f"The service did not return a count: {response_content}")
+        return int(response_content["count"])
+
+    def get_pages(self, query_url: str, out_file: str) -> List[Tuple[str, str]]:
+        """
+        Splits a query into pages using resultOffset, if the layer supports it and the query exceeds maxRecordCount.
+        :param query_url: A query url for the layer.
+        :param out_file: The file that the query would be downloaded to.
+        :return: A list of (query_url, out_file) tuples, one for each page.
+        """
+        if not self.supports_pagination:
+            return [(query_url, out_file)]
+        try:
+            feature_count = self.get_feature_count(query_url)
+        except Exception as e:
+            logger.warning(f"Unable to get the feature count for {query_url}, the query will not be paged: {e}")
+            return [(query_url, out_file)]
+
+        page_size = self.max_record_count
+        if feature_count <= page_size:
+            return [(query_url, out_file)]
+
+        out_file_name, out_file_ext = os.path.splitext(out_file)
+        pages = []
+        for page, result_offset in enumerate(range(0, feature_count, page_size)):
+            page_params = {
+                "resultOffset": result_offset,
+                "resultRecordCount": page_size,
+                # An order is required so that the pages are consistent.
+                "orderByFields": self.object_id_field,
+            }
+            pages.append((f"{query_url}&{urlencode(page_params)}", f"{out_file_name}-{page}{out_file_ext}"))
+        logger.info(f"Splitting {feature_count} features into {len(pages)} pages for {query_url}.")
+        return pages
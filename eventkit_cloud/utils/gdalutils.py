@@ -2,10 +2,10 @@
 import json
 import logging
 import math
-import multiprocessing
 import os
 import time
-from functools import wraps
+from collections import namedtuple
+from functools import lru_cache, wraps
 from itertools import repeat
 from statistics import mean
 from tempfile import NamedTemporaryFile
@@ -15,7 +15,7 @@ from django.conf import settings
 from mapproxy.grid import tile_grid
 from osgeo import gdal, ogr, osr
 
-from eventkit_cloud.tasks.task_process import TaskProcess
+from eventkit_cloud.tasks.task_process import TaskProcess, is_canceled
 from eventkit_cloud.utils.generic import requires_zip, create_zip_file, get_zip_name
 from eventkit_cloud.utils.geocoding.geocode import GeocodeAdapter, is_valid_bbox
 
@@ -69,14 +69,21 @@ def retry(f):
 
 
 def progress_callback(pct, msg, user_data):
-    from eventkit_cloud.tasks.helpers import update_progress
-
-    update_progress(
-        user_data.get("task_uid"),
-        progress=round(pct * 100),
-        subtask_percentage=user_data.get("subtask_percentage", 100.0),
-        msg=msg,
-    )
+    from eventkit_cloud.tasks.helpers import ProgressTracker
+
+    # Returning 0 stops gdal, so that a canceled task stops at its next progress update.
+    if is_canceled(user_data.get("task_uid")):
+        return 0
+
+    # GDAL calls this very frequently, so the progress is aggregated and only written periodically.
+    # The tracker is kept in the callback data so that it lasts for the whole gdal operation.
+    progress_tracker = user_data.get("progress_tracker")
+    if progress_tracker is None:
+        progress_tracker = ProgressTracker(
+            user_data.get("task_uid"), subtask_percentage=user_data.get("subtask_percentage", 100.0)
+        )
+        user_data["progress_tracker"] = progress_tracker
+    progress_tracker.update(round(pct * 100), msg=msg)
 
 
 def open_dataset(file_path, is_raster):
@@ -140,68 +147,108 @@ def cleanup_dataset(dataset):
         del dataset
 
 
-@retry
-def get_meta(ds_path, is_raster=True):
-    """
-    This function is a wrapper for the get_gdal metadata because if there is a database diconnection there is no obvious
-    way to clean up and free those resources therefore it is put on a separate process and if it fails it can just be
-    tried again.
+DatasetInfo = namedtuple("DatasetInfo", ["driver", "is_raster", "nodata", "band_count", "layers"])
 
-    This is using GDAL 2.2.4 this should be checked again to see if it can be simplified in a later version.
-    :param ds_path: String: Path to dataset
-    :param is_raster Boolean: Do not try to do OGR lookup if a raster dataset can be opened, otherwise it will try both,
-         and return the vector if that is an option.
-    :return: Metadata dict
-        driver: Short name of GDAL driver for dataset
-        is_raster: True if dataset is a raster type
-        nodata: NODATA value for all bands if all bands have the same one, otherwise None (raster sets only)
-    """
 
-    multiprocess_queue = multiprocessing.dummy.Queue()
-    proc = multiprocessing.dummy.Process(target=get_gdal_metadata, args=(ds_path, is_raster, multiprocess_queue,))
-    proc.start()
-    proc.join()
-    return multiprocess_queue.get()
-
-
-def get_gdal_metadata(ds_path, is_raster, multiprocess_queue):
+def open_dataset_ex(ds_path, flags):
     """
-    Don't call this directly use get_meta.
+    :param ds_path: Path to dataset
+    :param flags: The gdal.OF_* flags of the types of dataset to open.
+    :return: The dataset, or None if it couldn't be opened.
+    """
+    gdal.UseExceptions()
+    try:
+        return gdal.OpenEx(ds_path, flags | gdal.OF_READONLY)
+    except Exception as e:
+        logger.debug("Could not open dataset {0}: {1}".format(ds_path, e))
+        return None
 
-    Given a path to a raster or vector dataset, return the appropriate driver type.
 
-    :param ds_path: String: Path to dataset
-    :param A multiprocess queue.
-    :return: None.
+def read_dataset_info(ds_path, is_raster=True):
     """
-
+    Opens a dataset once and reads its metadata, don't call this directly use inspect_dataset.
+    :param ds_path: Path to dataset
+    :param is_raster: Prefer the raster data if the dataset has both raster and vector data.
+    :return: A DatasetInfo.
+    """
+    logger.info("Opening the dataset: {}".format(ds_path))
     dataset = None
-    ret = {"driver": None, "is_raster": None, "nodata": None}
-
     try:
-        dataset = open_dataset(ds_path, is_raster)
-        if isinstance(dataset, ogr.DataSource):
-            ret["driver"] = dataset.GetDriver().GetName()
-            ret["is_raster"] = False
-
-        elif isinstance(dataset, gdal.Dataset):
-            ret["driver"] = dataset.GetDriver().ShortName
-            ret["is_raster"] = True
-            if dataset.RasterCount:
-                bands = list(set([dataset.GetRasterBand(i + 1).GetNoDataValue() for i in range(dataset.RasterCount)]))
-                if len(bands) == 1:
-                    ret["nodata"] = bands[0]
-
-        if ret["driver"]:
-            logger.debug("Identified dataset {0} as {1}".format(ds_path, ret["driver"]))
+        if is_raster:
+            dataset = open_dataset_ex(ds_path, gdal.OF_RASTER | gdal.OF_VECTOR) or open_dataset_ex(
+                ds_path, gdal.OF_VECTOR
+            )
         else:
+            # Databases can fail to open as rasters, so vectors are only opened as rasters if they aren't vectors.
+            dataset = open_dataset_ex(ds_path, gdal.OF_VECTOR) or open_dataset_ex(ds_path, gdal.OF_RASTER)
+        if not dataset:
             logger.debug("Could not identify dataset {0}".format(ds_path))
-
-        multiprocess_queue.put(ret)
+            return DatasetInfo(driver=None, is_raster=None, nodata=None, band_count=0, layers=[])
+
+        band_count = dataset.RasterCount
+        layers = [dataset.GetLayerByIndex(index).GetName() for index in range(dataset.GetLayerCount())]
+        nodata = None
+        if band_count:
+            nodata_values = list(set([dataset.GetRasterBand(i + 1).GetNoDataValue() for i in range(band_count)]))
+            if len(nodata_values) == 1:
+                nodata = nodata_values[0]
+        dataset_info = DatasetInfo(
+            driver=dataset.GetDriver().ShortName,
+            is_raster=bool(band_count) and (is_raster or not layers),
+            nodata=nodata,
+            band_count=band_count,
+            layers=layers,
+        )
+        logger.debug("Identified dataset {0} as {1}".format(ds_path, dataset_info.driver))
+        return dataset_info
     finally:
         cleanup_dataset(dataset)
 
 
+@lru_cache(maxsize=1024)
+def read_file_dataset_info(ds_path, is_raster, mtime, size):
+    """
+    Memoizes read_dataset_info for files, the modified time and size are part of the key so that changed files are
+    inspected again.
+    """
+    return read_dataset_info(ds_path, is_raster)
+
+
+@retry
+def inspect_dataset(ds_path, is_raster=True):
+    """
+    Gets the metadata of a dataset, files are only opened again if they have changed.
+    :param ds_path: Path to dataset
+    :param is_raster: Prefer the raster data if the dataset has both raster and vector data.
+    :return: A DatasetInfo with:
+        driver: Short name of GDAL driver for dataset
+        is_raster: True if dataset is a raster type
+        nodata: NODATA value for all bands if all bands have the same one, otherwise None (raster sets only)
+        band_count: The number of raster bands.
+        layers: The names of the vector layers.
+    """
+    try:
+        stat = os.stat(ds_path)
+    except (OSError, TypeError, ValueError):
+        # Databases and services can change at any time, so they aren't cached.
+        return read_dataset_info(ds_path, is_raster)
+    return read_file_dataset_info(ds_path, bool(is_raster), stat.st_mtime_ns, stat.st_size)
+
+
+def get_meta(ds_path, is_raster=True):
+    """
+    :param ds_path: String: Path to dataset
+    :param is_raster Boolean: Do not try to do OGR lookup if a raster dataset can be opened, otherwise it will try both,
+         and return the vector if that is an option.
+    :return: Metadata dict
+        driver: Short name of GDAL driver for dataset
+        is_raster: True if dataset is a raster type
+        nodata: NODATA value for all bands if all bands have the same one, otherwise None (raster sets only)
+    """
+    dataset_info = inspect_dataset(ds_path, is_raster)
+    return {"driver": dataset_info.driver, "is_raster": dataset_info.is_raster, "nodata": dataset_info.nodata}
+
+
 def get_area(geojson):
     """
     Given a GeoJSON string or object, return an approximation of its geodesic area in km².
@@ -331,15 +378,13 @@ def convert(
     if isinstance(input_file, str) and not use_translate:
         input_file = [input_file]
 
-    meta_list = []
     for _index, _file in enumerate(input_file):
         input_file[_index], output_file = get_dataset_names(_file, output_file)
-        meta_list.append(get_meta(input_file[_index], is_raster))
 
     src_src = f"EPSG:{src_srs}"
     dst_src = f"EPSG:{projection}"
     # Currently, when there are more than 1 files, they much each be the same driver, making the meta the same.
-    meta = meta_list[0]
+    meta = get_meta(input_file[0], is_raster)
     if not driver:
         driver = meta["driver"] or "gpkg"
 
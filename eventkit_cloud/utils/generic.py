@@ -1,11 +1,25 @@
+import collections
+import errno
+import itertools
 import logging
 import os
+import shutil
+import tempfile
+import uuid
+import zlib
 
+from concurrent import futures
 from contextlib import contextmanager
-from zipfile import ZipFile, ZIP_DEFLATED
+from datetime import datetime
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
 
 logger = logging.getLogger()
 
+# Files with these extensions are already compressed, so they are stored in archives without compressing them again.
+COMPRESSED_EXTS = [".zip", ".kmz", ".gz", ".7z", ".jpg", ".jpeg", ".png", ".jp2"]
+# The private ZipFile attributes used to write members which are compressed ahead of time.
+ZIPFILE_INTERNALS = ["_lock", "_seekable", "_writecheck", "_didModify", "start_dir", "fp", "filelist", "NameToInfo"]
+
 
 @contextmanager
 def cd(newdir):
@@ -17,6 +31,14 @@ def cd(newdir):
         os.chdir(prevdir)
 
 
+def get_file_timestamp(file_path):
+    """
+    :param file_path: A local file path.
+    :return: The time the file was last modified, in the same format as the overpass timestamp.
+    """
+    return datetime.utcfromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 def get_file_paths(directory, paths=None):
     paths = paths or dict()
     with cd(directory):
@@ -26,6 +48,31 @@ def get_file_paths(directory, paths=None):
     return paths
 
 
+def link_file(src, dst):
+    """
+    Makes the file at src available at dst without copying its data when possible.  Within a filesystem the file is
+    hardlinked, so both paths share the same data and the filesystem keeps the link count; removing one path (e.g. when
+    the staging directory is cleaned up) leaves the other intact.  Across devices, or where links aren't supported, the
+    file is copied.
+    :param src: The file to link.
+    :param dst: The new path of the file.
+    :return: The new path of the file.
+    """
+    # Link to a temporary name and replace, since os.link won't overwrite an existing file.
+    temp_dst = f"{dst}.{uuid.uuid4()}"
+    try:
+        os.link(src, temp_dst)
+        os.replace(temp_dst, dst)
+    except OSError as e:
+        if os.path.exists(temp_dst):
+            os.remove(temp_dst)
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+        logger.debug(f"Could not link {src} to {dst} ({e}), copying it instead.")
+        shutil.copy2(src, dst)
+    return dst
+
+
 def requires_zip(file_format):
     zipped_formats = ["KML", "ESRI Shapefile"]
     if file_format in zipped_formats:
@@ -59,3 +106,173 @@ def get_zip_name(file_name):
     if ext == ".kml":
         return basename + ".kmz"
     return basename + ".zip"
+
+
+def is_compressible(file_path, sample_size=256 * 1024, min_ratio=0.9):
+    """
+    Estimates whether deflating a file is worthwhile by compressing samples from throughout it, since formats like
+    tiled geopackages or compressed GeoTIFFs hold data which is already compressed after their headers.
+    :param file_path: The file to check.
+    :param sample_size: The number of bytes in each sample.
+    :param min_ratio: The compressed samples must be smaller than this ratio of their size.
+    :return: True if the file should be compressed.
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size <= sample_size * 4:
+        return True
+    sample_bytes = compressed_bytes = 0
+    with open(file_path, "rb") as sample_file:
+        for offset in [file_size // 4, file_size // 2, file_size * 3 // 4]:
+            sample_file.seek(offset)
+            sample = sample_file.read(sample_size)
+            sample_bytes += len(sample)
+            compressed_bytes += len(zlib.compress(sample, 1))
+    return compressed_bytes < sample_bytes * min_ratio
+
+
+def compress_zip_member(file_path, arcname, compress_type=ZIP_DEFLATED, temp_dir=None, block_size=1024 * 1024):
+    """
+    Compresses a file for a zip archive, computing its CRC at the same time.
+    :param file_path: The file to compress.
+    :param arcname: The name of the file in the archive.
+    :param compress_type: The compression of the archive, already compressed files are stored.
+    :param temp_dir: Where to write the compressed data.
+    :param block_size: The number of bytes to read at a time.
+    :return: A tuple of the ZipInfo for the file, and a temporary file with its compressed data or None if it's stored.
+    """
+    zinfo = ZipInfo.from_file(file_path, arcname)
+    if compress_type == ZIP_DEFLATED and (
+        os.path.splitext(file_path)[1].lower() in COMPRESSED_EXTS or not is_compressible(file_path)
+    ):
+        compress_type = ZIP_STORED
+    zinfo.compress_type = compress_type
+
+    compressor = compressed_file = None
+    if compress_type == ZIP_DEFLATED:
+        # The same raw deflate stream which zipfile writes.
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed_file = tempfile.TemporaryFile(dir=temp_dir)
+    elif compress_type != ZIP_STORED:
+        raise ValueError(f"Unsupported compression type: {compress_type}")
+
+    crc = file_size = 0
+    try:
+        with open(file_path, "rb") as source_file:
+            for block in iter(lambda: source_file.read(block_size), b""):
+                crc = zlib.crc32(block, crc)
+                file_size += len(block)
+                if compressor:
+                    compressed_file.write(compressor.compress(block))
+        if compressor:
+            compressed_file.write(compressor.flush())
+            zinfo.compress_size = compressed_file.tell()
+            compressed_file.seek(0)
+        else:
+            zinfo.compress_size = file_size
+    except Exception:
+        if compressed_file:
+            compressed_file.close()
+        raise
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    return zinfo, compressed_file
+
+
+def has_zipfile_internals(zipfile):
+    """
+    write_zip_member relies on ZipFile internals which aren't part of its public API.  They were checked against
+    CPython 3.7 (which EventKit runs on) through 3.11.
+    :param zipfile: An open ZipFile.
+    :return: True if the ZipFile has the internals used by write_zip_member.
+    """
+    return all(hasattr(zipfile, attribute) for attribute in ZIPFILE_INTERNALS)
+
+
+def write_zip_member(zipfile, zinfo, file_path, compressed_file=None):
+    """
+    Writes a file which was prepared by compress_zip_member to an open archive, the same way ZipFile writes
+    directories.  Since the CRC and sizes are already known the local header is complete and nothing is read back.
+    :param zipfile: An open ZipFile.
+    :param zinfo: The ZipInfo of the file.
+    :param file_path: The file, which is copied if it isn't compressed.
+    :param compressed_file: The compressed data of the file.
+    """
+    with zipfile._lock:
+        if zipfile._seekable:
+            zipfile.fp.seek(zipfile.start_dir)
+        zinfo.header_offset = zipfile.fp.tell()
+        zipfile._writecheck(zinfo)
+        zipfile._didModify = True
+        zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+        zipfile.fp.write(zinfo.FileHeader(zip64))
+        if compressed_file:
+            shutil.copyfileobj(compressed_file, zipfile.fp, 1024 * 1024)
+        else:
+            with open(file_path, "rb") as source_file:
+                remaining = zinfo.file_size
+                while remaining:
+                    block = source_file.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        raise Exception(f"{file_path} was changed while it was being added to the archive.")
+                    zipfile.fp.write(block)
+                    remaining -= len(block)
+        zipfile.filelist.append(zinfo)
+        zipfile.NameToInfo[zinfo.filename] = zinfo
+        zipfile.start_dir = zipfile.fp.tell()
+
+
+def write_zip_files(zipfile, files, max_workers=None, callback=None):
+    """
+    Compresses files in parallel and writes them to an open archive in order.
+    :param zipfile: An open ZipFile.
+    :param files: A list of (file path, archive name) tuples.
+    :param max_workers: The number of files to compress at the same time, defaults to the number of CPUs.
+    :param callback: Called with the archive name of each file before it's written.
+    """
+    if not has_zipfile_internals(zipfile):
+        logger.warning("This version of Python's ZipFile isn't supported, compressing the files one at a time.")
+        for file_path, arcname in files:
+            if callback:
+                callback(arcname)
+            zipfile.write(file_path, arcname=arcname)
+        return
+
+    max_workers = max_workers or os.cpu_count()
+    temp_dir = os.path.dirname(os.path.abspath(zipfile.filename)) if zipfile.filename else None
+    # Only max_workers files are compressed ahead of the one being written, so that the compressed copies of a large
+    # run don't all wait in the staging directory behind a large file.
+    pending = collections.deque()
+    files = iter(files)
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit_next():
+            for file_path, arcname in itertools.islice(files, 1):
+                pending.append(
+                    (
+                        file_path,
+                        arcname,
+                        executor.submit(compress_zip_member, file_path, arcname, zipfile.compression, temp_dir),
+                    )
+                )
+
+        for _ in range(max_workers):
+            submit_next()
+        try:
+            while pending:
+                file_path, arcname, member = pending.popleft()
+                zinfo, compressed_file = member.result()
+                submit_next()
+                try:
+                    if callback:
+                        callback(arcname)
+                    write_zip_member(zipfile, zinfo, file_path, compressed_file)
+                finally:
+                    if compressed_file:
+                        compressed_file.close()
+        finally:
+            # Discard the files which were compressed ahead of a failure.
+            for _, _, member in pending:
+                if not member.cancel() and not member.exception():
+                    _, compressed_file = member.result()
+                    if compressed_file:
+                        compressed_file.close()
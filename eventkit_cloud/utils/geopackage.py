@@ -351,16 +351,16 @@ class Geopackage(object):
         self.update_zindexes(cur, self.feature_selection)
         update_progress(self.export_task_record_uid, 42, subtask_percentage, subtask_start, eta=eta)
 
-        # add themes
+        # add themes, the source tables with several themes are routed to them in a single scan
         create_sqls, index_sqls = self.feature_selection.sqls
         for query in create_sqls:
             logger.debug(query)
             cur.executescript(query)
         update_progress(self.export_task_record_uid, 50, subtask_percentage, subtask_start, eta=eta)
 
-        for query in index_sqls:
-            logger.debug(query)
-            cur.executescript(query)
+        # The spatial indexes are all created in one transaction, instead of committing each one.
+        logger.debug(index_sqls)
+        cur.executescript("BEGIN;\n{0}\nCOMMIT;".format("".join(index_sqls)))
 
         """
         Remove points/lines/multipolygons tables
@@ -389,7 +389,7 @@ class Geopackage(object):
                 for geom_type in self.feature_selection.geom_types(theme):
                     for stmt in self.feature_selection.create_sql(theme, geom_type):
                         cur.executescript(stmt)
-                cur.execute("VACUUM;")
+                # Nothing was deleted from the new geopackage, so it doesn't need to be vacuumed.
                 conn.commit()
                 conn.close()
 
@@ -413,50 +413,11 @@ class Geopackage(object):
             return [Artifact([self.output_gpkg], Geopackage.name)]
 
     def update_zindexes(self, cur, feature_selection):
-        # arguably, determing Z-index should require all 5 of these OSM keys
-        # to construct a consistent z-index.
-        for geom_type in ["point", "line", "polygon"]:
-            key_union = feature_selection.key_union(geom_type + "s")  # boo
-            MAPPING = {"point": "points", "line": "lines", "polygon": "multipolygons"}
-            table_name = MAPPING[geom_type]
-            if any([x in key_union for x in ["highway", "railway", "layer", "bridge", "tunnel"]]):
-                cur.execute("ALTER TABLE {table} ADD COLUMN z_index SMALLINT DEFAULT 0;".format(table=table_name))
-                if "highway" in key_union:
-                    cur.executescript(
-                        """
-                        UPDATE {table} SET z_index = 3 WHERE highway IN ('path', 'track', 'footway', 'minor',
-                        'road', 'service', 'unclassified', 'residential');
-                        UPDATE {table} SET z_index = 4 WHERE highway IN ('tertiary_link', 'tertiary');
-                        UPDATE {table} SET z_index = 6 WHERE highway IN ('secondary_link', 'secondary');
-                        UPDATE {table} SET z_index = 7 WHERE highway IN ('primary_link', 'primary');
-                        UPDATE {table} SET z_index = 8 WHERE highway IN  ('trunk_link', 'trunk');
-                        UPDATE {table} SET z_index = 9 WHERE highway IN  ('motorway_link', 'motorway');
-                    """.format(
-                            table=table_name
-                        )
-                    )
-                if "railway" in key_union:
-                    cur.execute(
-                        "UPDATE {table} SET z_index = z_index + 5 WHERE railway IS NOT NULL".format(table=table_name)
-                    )
-                if "layer" in key_union:
-                    cur.execute(
-                        "UPDATE {table} SET z_index = z_index + 10 * cast(layer AS SMALLINT) WHERE layer IS NOT NULL".format(  # NOQA
-                            table=table_name
-                        )
-                    )
-                if "bridge" in key_union:
-                    cur.execute(
-                        "UPDATE {table} SET z_index = z_index + 10 WHERE bridge IN ('yes', 'true', 1)".format(
-                            table=table_name
-                        )
-                    )
-                if "tunnel" in key_union:
-                    cur.execute(
-                        "UPDATE {table} SET z_index = z_index - 10 WHERE tunnel IN ('yes', 'true', 1)".format(
-                            table=table_name
-                        )
-                    )
+        # The z_index is computed from the scores of the feature selection with a single update of each table.
+        for geom_type, table_name in [("points", "points"), ("lines", "lines"), ("polygons", "multipolygons")]:
+            z_index_sql = feature_selection.z_index_sql(table_name, geom_type)
+            if z_index_sql:
+                cur.executescript(z_index_sql)
 
 
 def add_geojson_to_geopackage(geojson=None, gpkg=None, layer_name=None, task_uid=None, user_details=None):
@@ -556,6 +517,32 @@ def get_tile_table_names(gpkg):
         return [table for (table,) in result]
 
 
+def merge_tile_tables(source_gpkg, target_gpkg):
+    """
+    Copies the tiles from each tile table in the source geopackage into the same table in the target geopackage.
+    Tiles which are in both geopackages are replaced by the source tile.
+
+    :param source_gpkg: Path to the geopackage to copy the tiles from.
+    :param target_gpkg: Path to the geopackage to copy the tiles into, the tile tables must already exist.
+    :return: None
+    """
+    tables = get_tile_table_names(source_gpkg)
+    with sqlite3.connect(target_gpkg) as conn:
+        conn.execute("ATTACH DATABASE ? AS source;", (source_gpkg,))
+        for table in tables:
+            quoted_table = '"{0}"'.format(table.replace('"', '""'))
+            conn.execute(
+                "INSERT OR REPLACE INTO {0} (zoom_level, tile_column, tile_row, tile_data) "
+                "SELECT zoom_level, tile_column, tile_row, tile_data FROM source.{0};".format(quoted_table)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO gpkg_tile_matrix SELECT * FROM source.gpkg_tile_matrix WHERE table_name = ?;",
+                (table,),
+            )
+        conn.commit()
+        conn.execute("DETACH DATABASE source;")
+
+
 def get_table_gpkg_contents_information(gpkg, table_name):
     """
 
@@ -4,7 +4,7 @@ import os
 from django.conf import settings
 from django.core.cache import cache
 
-from eventkit_cloud.utils.mapproxy import mapproxy_config_keys_index
+from eventkit_cloud.utils.mapproxy import invalidate_mapproxy_apps, mapproxy_config_keys_index
 
 logger = logging.getLogger()
 
@@ -34,3 +34,4 @@ def get_download_paths(relative_path):
 def clear_mapproxy_config_cache():
     mapproxy_config_keys = cache.get_or_set(mapproxy_config_keys_index, set())
     cache.delete_many(list(mapproxy_config_keys))
+    invalidate_mapproxy_apps()
@@ -3,19 +3,25 @@ import logging
 import multiprocessing
 import os
 import sqlite3
+import threading
 import time
+import uuid
+from collections import OrderedDict, namedtuple
+from functools import partial
 from multiprocessing import Process
 from multiprocessing.dummy import DummyProcess
-from typing import Tuple
+from typing import List, Tuple
 
+import billiard
 import mapproxy
 import yaml
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.contrib.gis.geos import GEOSGeometry
-from django.core.cache import cache
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.core.cache import cache, close_caches
 from django.db import connections
 from mapproxy.config.config import load_config, load_default_config
+from mapproxy.grid import TileGrid
 from mapproxy.config.loader import (
     ProxyConfiguration,
     ConfigurationError,
@@ -34,14 +40,17 @@ from eventkit_cloud.utils.geopackage import (
     set_gpkg_contents_bounds,
     get_table_tile_matrix_information,
     get_zoom_levels_table,
+    merge_tile_tables,
     remove_empty_zoom_levels,
 )
+from eventkit_cloud.utils.osm_extract_cache import get_hash
 from eventkit_cloud.utils.stats.eta_estimator import ETA
 
 # Mapproxy uses processes by default, but we can run child processes in demonized process, so we use
 # a dummy process which relies on threads.  This fixes a bunch of deadlock issues which happen when using billiard.
 multiprocessing.Process = DummyProcess
 from mapproxy.seed import seeder  # noqa: E402
+from mapproxy.srs import SRS  # noqa: E402
 from mapproxy.seed.config import SeedingConfiguration  # noqa: E402
 from mapproxy.seed.util import ProgressLog, exp_backoff, timestamp, ProgressStore  # noqa: E402
 
@@ -57,6 +66,13 @@ client_logger = logging.getLogger("mapproxy.source.request")
 client_logger.setLevel(settings.LOG_LEVEL if log_settings.get("requests", False) else logging.ERROR)
 
 mapproxy_config_keys_index = "mapproxy-config-cache-keys"
+shared_tile_store_name = "shared_tile_store"
+mapproxy_apps_version_key = "mapproxy-apps-version"
+
+# A process-local LRU of configured MapProxy apps, as {mapproxy_config_key: (version, app, cert_info, cred_var)}.
+# The version is shared through the cache so that invalidating the apps in one process invalidates them in all of them.
+_mapproxy_apps = OrderedDict()
+_mapproxy_apps_lock = threading.Lock()
 
 
 def get_mapproxy_config_template(slug, user=None):
@@ -68,17 +84,19 @@ def get_mapproxy_config_template(slug, user=None):
 
 class CustomLogger(ProgressLog):
     def __init__(self, task_uid=None, *args, **kwargs):
+        from eventkit_cloud.tasks.helpers import ProgressTracker
+
         self.task_uid = task_uid
         super(CustomLogger, self).__init__(*args, **kwargs)
-        # Log mapproxy status but allow a setting to reduce database writes.
+        # Log mapproxy status but allow a setting to reduce cache lookups.
         self.log_step_step = 1
         self.log_step_counter = self.log_step_step
         self.eta = ETA(task_uid=task_uid)
+        # The tracker limits how often the progress is actually written.
+        self.progress_tracker = ProgressTracker(task_uid, eta=self.eta)
         self.interval = 1
 
     def log_step(self, progress):
-        from eventkit_cloud.tasks.helpers import update_progress
-
         self.eta.update(progress.progress)  # This may also get called by update_progress but because update_progress
         # is rate-limited; we also do it here to get more data points for making
         # better eta estimates
@@ -93,7 +111,7 @@ class CustomLogger(ProgressLog):
                     logger.error(f"The task uid: {self.task_uid} was canceled. Exiting...")
                     raise Exception("The task was canceled.")
 
-                update_progress(self.task_uid, progress=progress.progress * 100, eta=self.eta)
+                self.progress_tracker.update(progress.progress * 100)
                 self.log_step_counter = self.log_step_step
             self.log_step_counter -= 1
 
@@ -109,6 +127,27 @@ class CustomLogger(ProgressLog):
             self._laststep = time.time()
 
 
+class SubRegionProgressLog(ProgressLog):
+    """
+    Reports the progress of a sub-region, which is seeded in a separate process, through shared memory.
+    """
+
+    def __init__(self, progress=None, index=0, *args, **kwargs):
+        """
+        :param progress: A shared array with the progress (from 0 to 1) of each sub-region.
+        :param index: The index of this sub-region in the array.
+        """
+        super(SubRegionProgressLog, self).__init__(*args, **kwargs)
+        self.progress = progress
+        self.index = index
+
+    def log_step(self, progress):
+        self.progress[self.index] = progress.progress
+
+
+SeedProgress = namedtuple("SeedProgress", ["progress", "progress_str"])
+
+
 def get_custom_exp_backoff(max_repeat=None, task_uid=None):
     def custom_exp_backoff(*args, **kwargs):
         if max_repeat:
@@ -168,9 +207,26 @@ class MapproxyGeopackage(object):
     def build_config(self):
         pass
 
-    def get_check_config(self):
+    def use_tile_store(self) -> bool:
+        """
+        :return: True if the tiles for this export can be read from and written to the provider's shared tile store.
+        """
+        if self.projection or not self.name or not getattr(settings, "TILE_STORE_DIR", None):
+            return False
+        from eventkit_cloud.jobs.models import RegionalPolicy  # Circular reference
+
+        # Tiles within a regional policy's region are only for users with a justification, so they aren't shared.
+        if self.bbox:
+            aoi = GEOSGeometry(Polygon.from_bbox(self.bbox), srid=4326)
+            if RegionalPolicy.objects.filter(providers__slug=self.name, region__the_geom__intersects=aoi).exists():
+                logger.info(f"Not using the shared tile store for {self.name}, the AOI is within a regional policy.")
+                return False
+        return True
+
+    def get_check_config(self, seed_dict: dict = None):
         """
         Create a MapProxy configuration object and verifies its validity
+        :param seed_dict: Optionally the seeds to use instead of seeding the whole bbox and all of the levels.
         """
         if self.config or self.projection:
             conf_dict = yaml.safe_load(self.config) or dict()
@@ -199,6 +255,9 @@ class MapproxyGeopackage(object):
                 table_name=self.layer,
             )
 
+        if self.use_tile_store():
+            add_shared_tile_store(conf_dict, self.name)
+
         if self.projection:
             conf_dict["caches"]["repro_cache"] = copy.deepcopy(conf_dict["caches"]["default"])
             conf_dict["caches"]["repro_cache"]["cache"]["filename"] = self.input_gpkg
@@ -234,13 +293,14 @@ class MapproxyGeopackage(object):
                 logger.warning("Using bbox instead of selection, because the area is too small")
                 self.selection = None
 
-        seed_dict = get_seed_template(
-            bbox=self.bbox,
-            level_from=self.level_from,
-            level_to=self.level_to,
-            coverage_file=self.selection,
-            projection=self.projection,
-        )
+        if not seed_dict:
+            seed_dict = get_seed_template(
+                bbox=self.bbox,
+                level_from=self.level_from,
+                level_to=self.level_to,
+                coverage_file=self.selection,
+                projection=self.projection,
+            )
 
         # Create a seed configuration object
         seed_configuration = SeedingConfiguration(seed_dict, mapproxy_conf=mapproxy_configuration)
@@ -253,6 +313,105 @@ class MapproxyGeopackage(object):
 
         return conf_dict, seed_configuration, mapproxy_configuration
 
+    def get_sub_regions(self, conf_dict: dict, mapproxy_configuration: ProxyConfiguration) -> List[Tuple[dict, int]]:
+        """
+        :param conf_dict: The MapProxy configuration.
+        :param mapproxy_configuration: The loaded MapProxy configuration, for the grid and meta size of the export.
+        :return: A list of (seed_dict, estimated tile count) tuples, or an empty list if the export shouldn't be split.
+        """
+        # Reprojected exports are seeded from a geopackage in a different grid, so they aren't split.
+        if self.projection or not self.bbox:
+            return []
+        # Each process gets at least one request at a time, so there can't be more processes than the provider's
+        # concurrency.
+        concurrency = get_concurrency(conf_dict)
+        processes = min(
+            int(conf_dict.get("processes") or getattr(settings, "MAPPROXY_PROCESSES", 0) or concurrency), concurrency
+        )
+        if processes < 2:
+            return []
+        default_cache = mapproxy_configuration.caches.get("default")
+        grid = default_cache.conf.get("grids")[0]
+        meta_size = mapproxy_configuration.globals.get_value(
+            "meta_size", default_cache.conf, global_key="cache.meta_size"
+        )
+        return get_sub_region_seeds(
+            self.bbox,
+            self.level_from or 0,
+            self.level_to or 10,
+            processes,
+            mapproxy_configuration.grids.get(grid).tile_grid(),
+            meta_size=meta_size,
+            coverage_file=self.selection,
+        )
+
+    def seed_sub_region(self, gpkgfile: str, seed_dict: dict, concurrency: int, progress, index: int):
+        """
+        Seeds a sub-region of the export into its own geopackage, this is run in a separate process.
+        """
+        sub_region = copy.copy(self)
+        sub_region.gpkgfile = gpkgfile
+        _, seed_configuration, _ = sub_region.get_check_config(seed_dict=seed_dict)
+        try:
+            seeder.seed(
+                tasks=seed_configuration.seeds(list(seed_dict["seeds"].keys())),
+                concurrency=concurrency,
+                progress_logger=SubRegionProgressLog(progress=progress, index=index, verbose=False, silent=True),
+            )
+        finally:
+            connections.close_all()
+            close_caches()
+
+    def seed_sub_regions(self, sub_regions: List[Tuple[dict, int]], conf_dict: dict, progress_logger: CustomLogger):
+        """
+        Seeds each sub-region in a separate process, into a separate geopackage, and then merges the tiles into the
+        export geopackage.  The provider's concurrency is divided between the processes.
+        This has to be called from the task's own thread rather than through a TaskProcess, since forking while other
+        threads hold locks (e.g. for logging or GDAL) can deadlock the forked processes.
+        """
+        concurrency = max(1, get_concurrency(conf_dict) // len(sub_regions))
+        tile_counts = [tile_count for _, tile_count in sub_regions]
+        total_tile_count = sum(tile_counts) or 1
+        progress = billiard.Array("d", len(sub_regions))
+
+        # The first sub-region is seeded into the export geopackage, so only the others need to be merged.
+        file_name, file_ext = os.path.splitext(self.gpkgfile)
+        gpkgfiles = [self.gpkgfile] + [f"{file_name}-{index}{file_ext}" for index in range(1, len(sub_regions))]
+        for gpkgfile in gpkgfiles[1:]:
+            if os.path.isfile(gpkgfile):
+                os.remove(gpkgfile)
+
+        # Database and cache connections can't be shared with the forked processes.  They are local to the thread which
+        # opened them, which is this one.
+        connections.close_all()
+        close_caches()
+        processes = [
+            billiard.Process(target=self.seed_sub_region, args=(gpkgfile, seed_dict, concurrency, progress, index))
+            for index, ((seed_dict, _), gpkgfile) in enumerate(zip(sub_regions, gpkgfiles))
+        ]
+        logger.info(f"Seeding {len(processes)} sub-regions with a concurrency of {concurrency} each.")
+        try:
+            for process in processes:
+                process.start()
+            while any(process.is_alive() for process in processes):
+                # The overall progress is weighted by the number of tiles in each sub-region.
+                seeded = sum(progress[index] * tile_count for index, tile_count in enumerate(tile_counts))
+                progress_logger.log_step(SeedProgress(seeded / total_tile_count, ""))
+                time.sleep(1)
+            failed = [index for index, process in enumerate(processes) if process.exitcode != 0]
+            if failed:
+                raise Exception(f"Seeding failed for sub-regions {failed} of {self.gpkgfile}.")
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        for gpkgfile in gpkgfiles[1:]:
+            merge_tile_tables(gpkgfile, self.gpkgfile)
+            os.remove(gpkgfile)
+        return self.gpkgfile
+
     # @retry
     def convert(self,):
         """
@@ -284,14 +443,19 @@ class MapproxyGeopackage(object):
                 verbose=log_settings.get("verbose"),
                 silent=log_settings.get("silent"),
             )
-            task_process = TaskProcess(task_uid=self.task_uid)
-            task_process.start_process(
-                lambda: seeder.seed(
-                    tasks=seed_configuration.seeds(["seed"]),
-                    concurrency=get_concurrency(conf_dict),
-                    progress_logger=progress_logger,
+            sub_regions = self.get_sub_regions(conf_dict, mapproxy_configuration)
+            if sub_regions:
+                # The progress logger stops the processes if the task is canceled.
+                self.seed_sub_regions(sub_regions, conf_dict, progress_logger)
+            else:
+                task_process = TaskProcess(task_uid=self.task_uid)
+                task_process.start_process(
+                    lambda: seeder.seed(
+                        tasks=seed_configuration.seeds(["seed"]),
+                        concurrency=get_concurrency(conf_dict),
+                        progress_logger=progress_logger,
+                    )
                 )
-            )
             check_zoom_levels(self.gpkgfile, mapproxy_configuration)
             remove_empty_zoom_levels(self.gpkgfile)
             set_gpkg_contents_bounds(self.gpkgfile, self.layer, self.bbox)
@@ -330,6 +494,40 @@ def get_cache_template(sources, grids, geopackage, table_name="tiles"):
     }
 
 
+def add_shared_tile_store(conf_dict: dict, slug: str) -> dict:
+    """
+    Puts a file cache, which is shared by every export of the provider, between the default cache and its sources.
+    Tiles are stored by provider, source configuration, grid, z, x and y so tiles which another run already seeded are
+    read from disk instead of being requested from the upstream service again.  Changing the provider's sources or
+    grids (e.g. the url, layer or style) starts a new store, and the old tiles are evicted with the least recently used.
+    :param conf_dict: A MapProxy configuration with a default cache.
+    :param slug: The provider slug used to separate the tiles of each provider.
+    :return: The updated configuration.
+    """
+    default_cache = conf_dict["caches"]["default"]
+    shared_cache = {
+        "sources": default_cache.get("sources", []),
+        "grids": default_cache.get("grids", []),
+        "cache": {"type": "file"},
+    }
+    for option in ["format", "request_format", "meta_size", "meta_buffer", "image"]:
+        if option in default_cache:
+            shared_cache[option] = copy.deepcopy(default_cache[option])
+    # The sources may be other caches of the configuration.
+    source_config = {
+        "sources": {
+            source: conf_dict.get("sources", {}).get(source) or conf_dict["caches"].get(source)
+            for source in shared_cache["sources"]
+        },
+        "grids": {grid: conf_dict.get("grids", {}).get(grid) for grid in shared_cache["grids"]},
+        "cache": shared_cache,
+    }
+    shared_cache["cache_dir"] = os.path.join(settings.TILE_STORE_DIR, slug, get_hash(source_config)[:16])
+    conf_dict["caches"][shared_tile_store_name] = shared_cache
+    default_cache["sources"] = [shared_tile_store_name]
+    return conf_dict
+
+
 def get_seed_template(bbox=None, level_from=None, level_to=None, coverage_file=None, projection=None):
     out_projection = 4326
     if projection:
@@ -357,6 +555,103 @@ def get_seed_template(bbox=None, level_from=None, level_to=None, coverage_file=N
     return seed_template
 
 
+def get_tile_count_estimate(bbox: list, level_from: int, level_to: int, tile_grid: TileGrid) -> int:
+    """
+    Estimates the number of tiles in a bbox.
+    :param bbox: The bbox in the SRS of the grid.
+    :param level_from: The first level.
+    :param level_to: The last level.
+    :param tile_grid: The MapProxy grid of the tiles.
+    :return: The number of tiles.
+    """
+    tile_count = 0
+    for level in range(level_from, level_to + 1):
+        _, (columns, rows), _ = tile_grid.get_affected_level_tiles(bbox, level)
+        tile_count += columns * rows
+    return tile_count
+
+
+def get_sub_region_seeds(
+    bbox: list,
+    level_from: int,
+    level_to: int,
+    regions: int,
+    tile_grid: TileGrid,
+    meta_size: List[int] = None,
+    coverage_file: str = None,
+) -> List[Tuple[dict, int]]:
+    """
+    Splits the seed area into independent sub-regions which can be seeded in parallel.
+    The bbox is split into vertical strips of whole meta tiles from the first level with at least two meta tiles per
+    strip, the levels below that are seeded entirely in the first sub-region so that no tiles are requested by more
+    than one sub-region.
+    :param bbox: The bbox in EPSG:4326.
+    :param level_from: The first level to seed.
+    :param level_to: The last level to seed.
+    :param regions: The number of sub-regions to split the area into.
+    :param tile_grid: The MapProxy grid which is seeded.
+    :param meta_size: The number of tiles in each meta tile, as [columns, rows].  MapProxy's default is [4, 4].
+    :param coverage_file: Optionally a file with the selection, which each sub-region is intersected with.
+    :return: A list of (seed_dict, estimated tile count) tuples, or an empty list if the area is too small to split.
+    """
+    if regions < 2:
+        return []
+    meta_columns = (meta_size or [4, 4])[0]
+    srs_code = tile_grid.srs.srs_code
+    grid_bbox = list(SRS(4326).transform_bbox_to(tile_grid.srs, bbox)) if tile_grid.srs != SRS(4326) else list(bbox)
+    # Only the part of the bbox within the grid can be seeded.
+    grid_bbox = [
+        max(grid_bbox[0], tile_grid.bbox[0]),
+        max(grid_bbox[1], tile_grid.bbox[1]),
+        min(grid_bbox[2], tile_grid.bbox[2]),
+        min(grid_bbox[3], tile_grid.bbox[3]),
+    ]
+    if grid_bbox[0] >= grid_bbox[2] or grid_bbox[1] >= grid_bbox[3]:
+        return []
+
+    def get_meta_tile_columns(level):
+        # Tiles which the bbox only touches aren't seeded, the same as in TileGrid.get_affected_level_tiles.
+        delta = tile_grid.resolution(level) / 10.0
+        first_column = tile_grid.tile(grid_bbox[0] + delta, grid_bbox[1] + delta, level)[0]
+        last_column = tile_grid.tile(grid_bbox[2] - delta, grid_bbox[3] - delta, level)[0]
+        return list(range(first_column // meta_columns, last_column // meta_columns + 1))
+
+    split_level = next(
+        (level for level in range(level_from, level_to + 1) if len(get_meta_tile_columns(level)) >= regions * 2), None,
+    )
+    if split_level is None:
+        return []
+
+    columns = get_meta_tile_columns(split_level)
+    sub_regions = []
+    for index in range(regions):
+        strip_columns = columns[index * len(columns) // regions : (index + 1) * len(columns) // regions]
+        # The strips are snapped to meta tile boundaries so that no meta tile is requested by two sub-regions.  With
+        # the usual resolution factor of two these are also meta tile boundaries at the higher levels.
+        left = tile_grid.tile_bbox((strip_columns[0] * meta_columns, 0, split_level))[0]
+        right = tile_grid.tile_bbox(((strip_columns[-1] + 1) * meta_columns - 1, 0, split_level))[2]
+        strip = [max(left, grid_bbox[0]), grid_bbox[1], min(right, grid_bbox[2]), grid_bbox[3]]
+        seeds = [(strip, split_level, level_to)]
+        if index == 0 and split_level > level_from:
+            seeds.append((grid_bbox, level_from, split_level - 1))
+
+        seed_dict = {"coverages": {}, "seeds": {}}
+        for seed_index, (seed_bbox, seed_level_from, seed_level_to) in enumerate(seeds):
+            coverage = {"srs": srs_code, "bbox": seed_bbox}
+            if coverage_file:
+                coverage = {"intersection": [coverage, {"srs": "EPSG:4326", "datasource": str(coverage_file)}]}
+            seed_dict["coverages"][f"geom-{seed_index}"] = coverage
+            seed_dict["seeds"][f"seed-{seed_index}"] = {
+                "coverages": [f"geom-{seed_index}"],
+                "refresh_before": {"minutes": 0},
+                "levels": {"from": seed_level_from, "to": seed_level_to},
+                "caches": ["default"],
+            }
+        tile_count = sum(get_tile_count_estimate(*seed, tile_grid) for seed in seeds)
+        sub_regions.append((seed_dict, tile_count))
+    return sub_regions
+
+
 def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
     return abs(a - b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
 
@@ -402,48 +697,93 @@ def get_concurrency(conf_dict):
     return int(concurrency)
 
 
+def invalidate_mapproxy_apps():
+    """
+    Invalidates the configured MapProxy apps in every process, so that they are rebuilt on the next request.
+    """
+    cache.set(mapproxy_apps_version_key, uuid.uuid4().hex, None)
+    with _mapproxy_apps_lock:
+        _mapproxy_apps.clear()
+
+
+def patch_mapproxy_requests(slug: str, cert_info: dict = None, cred_var: str = None):
+    auth_requests.patch_https(cert_info=cert_info)
+    auth_requests.patch_mapproxy_opener_cache(slug=slug, cred_var=cred_var)
+
+
+def get_mapproxy_app_config(slug: str, conf_dict: dict) -> dict:
+    """
+    Builds the MapProxy configuration used to display a provider on the map, with a file cache in the TILE_CACHE_DIR.
+    :param slug: A string matching the slug of a DataProvider.
+    :param conf_dict: The provider's configuration from get_conf_dict.
+    :return: The MapProxy configuration as a dict.
+    """
+    # TODO: place this somewhere else consolidate settings.
+    base_config = {
+        "services": {
+            "demo": None,
+            "tms": None,
+            "wmts": {
+                "featureinfo_formats": [
+                    {"mimetype": "application/json", "suffix": "json"},
+                    {"mimetype": "application/gml+xml; version=3.1", "suffix": "gml"},
+                ]
+            },
+        },
+        # Cache based on slug so that the caches don't overwrite each other.
+        "caches": {slug: {"cache": {"type": "file"}, "sources": ["default"], "grids": ["default"]}},
+        "layers": [{"name": slug, "title": slug, "sources": [slug]}],
+        "globals": {"cache": {"base_dir": getattr(settings, "TILE_CACHE_DIR")}},
+    }
+    if conf_dict["sources"].get("info"):
+        base_config["caches"][slug]["sources"] += ["info"]
+    if conf_dict["sources"].get("footprint"):
+        base_config["caches"][get_footprint_layer_name(slug)] = {
+            "cache": {"type": "file"},
+            "sources": ["footprint"],
+            "grids": ["default"],
+        }
+        base_config["layers"] += [
+            {
+                "name": get_footprint_layer_name(slug),
+                "title": get_footprint_layer_name(slug),
+                "sources": [get_footprint_layer_name(slug)],
+            }
+        ]
+    base_config, conf_dict = add_restricted_regions_to_config(base_config, conf_dict, slug, None)
+    mapproxy_config = load_default_config()
+    load_config(mapproxy_config, config_dict=base_config)
+    load_config(mapproxy_config, config_dict=conf_dict)
+    return mapproxy_config
+
+
 def create_mapproxy_app(slug: str, user: User = None) -> TestApp:
     mapproxy_config_key = get_mapproxy_config_template(slug, user=user)
-    mapproxy_config = cache.get(mapproxy_config_key)
+    cached_values = cache.get_many([mapproxy_config_key, mapproxy_apps_version_key])
+    mapproxy_config = cached_values.get(mapproxy_config_key)
+    apps_version = cached_values.get(mapproxy_apps_version_key)
+
+    # The app is only reused while its configuration is still cached, so it expires with the configuration.
+    if mapproxy_config and apps_version:
+        with _mapproxy_apps_lock:
+            cached_app = _mapproxy_apps.get(mapproxy_config_key)
+            if cached_app and cached_app[0] == apps_version:
+                _mapproxy_apps.move_to_end(mapproxy_config_key)
+            else:
+                cached_app = None
+        if cached_app:
+            _, app, cert_info, cred_var = cached_app
+            patch_mapproxy_requests(slug, cert_info=cert_info, cred_var=cred_var)
+            return app
+
+    if not apps_version:
+        cache.add(mapproxy_apps_version_key, uuid.uuid4().hex, None)
+        apps_version = cache.get(mapproxy_apps_version_key)
+
     conf_dict = cache.get_or_set(f"base-config-{slug}", lambda: get_conf_dict(slug), 360)
     if not mapproxy_config:
-        # TODO: place this somewhere else consolidate settings.
-        base_config = {
-            "services": {
-                "demo": None,
-                "tms": None,
-                "wmts": {
-                    "featureinfo_formats": [
-                        {"mimetype": "application/json", "suffix": "json"},
-                        {"mimetype": "application/gml+xml; version=3.1", "suffix": "gml"},
-                    ]
-                },
-            },
-            # Cache based on slug so that the caches don't overwrite each other.
-            "caches": {slug: {"cache": {"type": "file"}, "sources": ["default"], "grids": ["default"]}},
-            "layers": [{"name": slug, "title": slug, "sources": [slug]}],
-            "globals": {"cache": {"base_dir": getattr(settings, "TILE_CACHE_DIR")}},
-        }
-        if conf_dict["sources"].get("info"):
-            base_config["caches"][slug]["sources"] += ["info"]
-        if conf_dict["sources"].get("footprint"):
-            base_config["caches"][get_footprint_layer_name(slug)] = {
-                "cache": {"type": "file"},
-                "sources": ["footprint"],
-                "grids": ["default"],
-            }
-            base_config["layers"] += [
-                {
-                    "name": get_footprint_layer_name(slug),
-                    "title": get_footprint_layer_name(slug),
-                    "sources": [get_footprint_layer_name(slug)],
-                }
-            ]
-        base_config, conf_dict = add_restricted_regions_to_config(base_config, conf_dict, slug, None)
         try:
-            mapproxy_config = load_default_config()
-            load_config(mapproxy_config, config_dict=base_config)
-            load_config(mapproxy_config, config_dict=conf_dict)
+            mapproxy_config = get_mapproxy_app_config(slug, conf_dict)
             mapproxy_configuration = ProxyConfiguration(mapproxy_config)
 
             if settings.REGIONAL_JUSTIFICATION_TIMEOUT_DAYS:
@@ -466,14 +806,54 @@ def create_mapproxy_app(slug: str, user: User = None) -> TestApp:
             raise
 
     cert_info = conf_dict.get("cert_info")
-    auth_requests.patch_https(cert_info=cert_info)
-
     cred_var = conf_dict.get("cred_var")
-    auth_requests.patch_mapproxy_opener_cache(slug=slug, cred_var=cred_var)
+    patch_mapproxy_requests(slug, cert_info=cert_info, cred_var=cred_var)
+
+    app = TestApp(MapProxyApp(mapproxy_configuration.configured_services(), mapproxy_config))
+
+    with _mapproxy_apps_lock:
+        _mapproxy_apps[mapproxy_config_key] = (apps_version, app, cert_info, cred_var)
+        _mapproxy_apps.move_to_end(mapproxy_config_key)
+        while len(_mapproxy_apps) > getattr(settings, "MAPPROXY_APP_CACHE_SIZE", 32):
+            _mapproxy_apps.popitem(last=False)
+
+    return app
+
+
+def seed_tile_cache(slug: str, seeds: List[Tuple[list, int, int]]):
+    """
+    Seeds the tile cache which is used to display a provider on the map (i.e. the cache used by create_mapproxy_app).
+    Tiles which are already cached are skipped.
+    :param slug: A string matching the slug of a DataProvider.
+    :param seeds: A list of (bbox, level_from, level_to) tuples to seed, the bbox is in EPSG:4326.
+    """
+    conf_dict = cache.get_or_set(f"base-config-{slug}", lambda: get_conf_dict(slug), 360)
+    mapproxy_config = get_mapproxy_app_config(slug, conf_dict)
+    mapproxy_configuration = ProxyConfiguration(mapproxy_config, seed=seeder.seed, renderd=None)
+
+    seed_dict = {"coverages": {}, "seeds": {}}
+    for index, (bbox, level_from, level_to) in enumerate(seeds):
+        seed_dict["coverages"][f"coverage-{index}"] = {"srs": "EPSG:4326", "bbox": bbox}
+        seed_dict["seeds"][f"seed-{index}"] = {
+            "caches": [slug],
+            "coverages": [f"coverage-{index}"],
+            "levels": {"from": level_from, "to": level_to},
+        }
+    seed_configuration = SeedingConfiguration(seed_dict, mapproxy_conf=mapproxy_configuration)
 
-    app = MapProxyApp(mapproxy_configuration.configured_services(), mapproxy_config)
+    # Reset the backoff in case it was customized for an export task in this process.
+    mapproxy.seed.seeder.exp_backoff = partial(exp_backoff, max_repeat=int(conf_dict.get("max_repeat", 5)))
+    patch_mapproxy_requests(slug, cert_info=conf_dict.get("cert_info"), cred_var=conf_dict.get("cred_var"))
 
-    return TestApp(app)
+    logger.info(f"Seeding the tile cache for {slug} with {len(seeds)} seeds.")
+    try:
+        seeder.seed(
+            tasks=seed_configuration.seeds(list(seed_dict["seeds"].keys())),
+            concurrency=get_concurrency(conf_dict),
+            progress_logger=ProgressLog(verbose=log_settings.get("verbose"), silent=log_settings.get("silent")),
+        )
+    finally:
+        connections.close_all()
 
 
 def get_conf_dict(slug: str) -> dict:
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+
+from eventkit_cloud.utils.pbf import clip_pbf_file
+
+logger = logging.getLogger(__name__)
+
+
+def get_hash(*parts):
+    """
+    :param parts: Values which can be serialized as json.
+    :return: A hex digest identifying the values.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def contains(outer_bbox, inner_bbox):
+    """
+    :param outer_bbox: A bounding box of the form [long0, lat0, long1, lat1].
+    :param inner_bbox: A bounding box of the form [long0, lat0, long1, lat1].
+    :return: True if the outer bounding box contains the inner bounding box.
+    """
+    return (
+        outer_bbox[0] <= inner_bbox[0]
+        and outer_bbox[1] <= inner_bbox[1]
+        and outer_bbox[2] >= inner_bbox[2]
+        and outer_bbox[3] >= inner_bbox[3]
+    )
+
+
+def get_area(bbox):
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+
+class OSMExtractCache(object):
+    """
+    A cache of OSM extracts (pbf) and thematic geopackages for a provider, shared by all of its runs.
+
+    Each file is stored with a json sidecar recording the bbox it covers, a hash of the query or the feature selection
+    used to create it, and the overpass timestamp of its data.  Pbf extracts are reused for any bbox which they enclose
+    by clipping them, geopackages are only reused for the same AOI and feature selection.  Files with an older
+    timestamp than the server's are removed when they are found, since they will never be used again.
+    """
+
+    def __init__(self, slug, query, timestamp, cache_dir=None, task_uid=None):
+        """
+        :param slug: The slug of the data provider.
+        :param query: The overpass query template used for the extracts, so that different queries aren't mixed.
+        :param timestamp: The overpass timestamp of the data, caching is disabled without one.
+        :param cache_dir: The directory of the cache, defaults to OSM_EXTRACT_CACHE_DIR.
+        :param task_uid: The uid of the task using the cache.
+        """
+        cache_dir = cache_dir if cache_dir is not None else getattr(settings, "OSM_EXTRACT_CACHE_DIR", None)
+        self.cache_dir = os.path.join(cache_dir, slug) if cache_dir else None
+        self.query_hash = get_hash(query)
+        self.timestamp = timestamp
+        self.task_uid = task_uid
+
+    @property
+    def enabled(self):
+        return bool(self.cache_dir and self.timestamp)
+
+    def get_entries(self, extract_type, key):
+        """
+        :param extract_type: The type of file (pbf or gpkg).
+        :param key: The hash of what the file was created from.
+        :return: A list of (metadata, path) tuples for the current files matching the type and key.
+        """
+        entries = []
+        try:
+            filenames = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for filename in filenames:
+            if not filename.startswith(f"{extract_type}-") or not filename.endswith(".json"):
+                continue
+            metadata_path = os.path.join(self.cache_dir, filename)
+            path = f"{os.path.splitext(metadata_path)[0]}.{extract_type}"
+            try:
+                with open(metadata_path) as metadata_file:
+                    metadata = json.load(metadata_file)
+            except (OSError, ValueError):
+                continue
+            if metadata.get("key") != key:
+                continue
+            # The file may have been evicted from the cache, or may be outdated.
+            if metadata.get("timestamp", "") < self.timestamp or not os.path.isfile(path):
+                logger.info(f"Removing outdated OSM extract: {path}")
+                for outdated_path in [path, metadata_path]:
+                    try:
+                        os.remove(outdated_path)
+                    except OSError:
+                        pass
+                continue
+            if metadata.get("timestamp") == self.timestamp:
+                entries.append((metadata, path))
+        return entries
+
+    def add(self, extract_type, key, bbox, filename):
+        """
+        Copies a file into the cache.
+        :param extract_type: The type of file (pbf or gpkg).
+        :param key: The hash of what the file was created from.
+        :param bbox: The bbox covered by the file.
+        :param filename: The file to add.
+        :return: The path to the cached file.
+        """
+        if not self.enabled:
+            return None
+        entry_name = f"{extract_type}-{get_hash(key, bbox, self.timestamp)}"
+        path = os.path.join(self.cache_dir, f"{entry_name}.{extract_type}")
+        metadata = {"key": key, "bbox": list(bbox), "timestamp": self.timestamp}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Copy to temporary files first, so that other processes never see a partial entry.  The metadata is
+            # written last since it is what makes the entry visible.
+            temp_path = f"{path}.{uuid.uuid4()}"
+            shutil.copyfile(filename, temp_path)
+            os.replace(temp_path, path)
+            temp_path = os.path.join(self.cache_dir, f"{entry_name}.json.{uuid.uuid4()}")
+            with open(temp_path, "w") as metadata_file:
+                json.dump(metadata, metadata_file)
+            os.replace(temp_path, os.path.join(self.cache_dir, f"{entry_name}.json"))
+        except OSError as e:
+            logger.warning(f"Could not add {filename} to the OSM extract cache: {e}")
+            return None
+        logger.info(f"Added {filename} to the OSM extract cache.")
+        return path
+
+    def get_pbf(self, bbox, pbf_filename):
+        """
+        Gets a pbf extract for the bbox from the cache, clipping an enclosing extract if necessary.  Only bboxes inside
+        an earlier extract are found, any other bbox has to be clipped from the whole source again.
+        :param bbox: The bbox of the extract, of the form [long0, lat0, long1, lat1].
+        :param pbf_filename: Where to write the extract.
+        :return: The path to the extract, or None if there isn't a cached extract which encloses the bbox.
+        """
+        if not self.enabled:
+            return None
+        enclosing_entries = [
+            (metadata, path)
+            for metadata, path in self.get_entries("pbf", self.query_hash)
+            if contains(metadata["bbox"], bbox)
+        ]
+        if not enclosing_entries:
+            return None
+        # The smallest enclosing extract is the fastest to clip.
+        metadata, path = min(enclosing_entries, key=lambda entry: get_area(entry[0]["bbox"]))
+        try:
+            # Update the access time so that recently used extracts are evicted last.
+            os.utime(path)
+            if list(metadata["bbox"]) == list(bbox):
+                logger.info(f"Using cached OSM extract: {path}")
+                shutil.copyfile(path, pbf_filename)
+            else:
+                logger.info(f"Clipping cached OSM extract: {path}")
+                clip_pbf_file(path, bbox, pbf_filename, task_uid=self.task_uid)
+        except OSError as e:
+            logger.warning(f"Could not use the cached OSM extract {path}: {e}")
+            return None
+        return pbf_filename
+
+    def add_pbf(self, bbox, pbf_filename):
+        return self.add("pbf", self.query_hash, bbox, pbf_filename)
+
+    def get_gpkg_key(self, geometry, feature_selection):
+        """
+        :param geometry: The AOI of the geopackage.
+        :param feature_selection: The feature selection config of the geopackage.
+        :return: The hash identifying a thematic geopackage.
+        """
+        return get_hash(self.query_hash, geometry.wkt, feature_selection)
+
+    def get_gpkg(self, geometry, feature_selection, gpkg_filename):
+        """
+        Gets a thematic geopackage for the same AOI and feature selection from the cache.
+        :param geometry: The AOI of the geopackage.
+        :param feature_selection: The feature selection config of the geopackage.
+        :param gpkg_filename: Where to write the geopackage.
+        :return: The path to the geopackage, or None if it isn't cached.
+        """
+        if not self.enabled:
+            return None
+        entries = self.get_entries("gpkg", self.get_gpkg_key(geometry, feature_selection))
+        if not entries:
+            return None
+        _, path = entries[0]
+        try:
+            os.utime(path)
+            # The geopackage is copied because more layers are added to it after the thematic layers.
+            shutil.copyfile(path, gpkg_filename)
+        except OSError as e:
+            logger.warning(f"Could not use the cached geopackage {path}: {e}")
+            return None
+        logger.info(f"Using cached geopackage: {path}")
+        return gpkg_filename
+
+    def add_gpkg(self, geometry, feature_selection, gpkg_filename):
+        return self.add("gpkg", self.get_gpkg_key(geometry, feature_selection), geometry.extent, gpkg_filename)
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 import argparse
 import logging
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from string import Template
 
 from django.conf import settings
 from requests import exceptions
 from eventkit_cloud.core.helpers import get_or_update_session
+from eventkit_cloud.utils.gdalutils import get_chunked_bbox, retry
+from eventkit_cloud.utils.pbf import OSMToPBF, merge_pbf_files
 import yaml
 
 logger = logging.getLogger(__name__)
@@ -54,8 +58,8 @@ class Overpass(object):
         self.task_uid = task_uid
         self.config = config
         if bbox:
-            # Overpass expects a bounding box string of the form "<lat0>,<long0>,<lat1>,<long1>"
-            self.bbox = f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}"
+            self.extent = [float(coordinate) for coordinate in bbox]
+            self.bbox = get_overpass_bbox(bbox)
         else:
             raise Exception("A bounding box is required: miny,minx,maxy,maxx")
 
@@ -67,10 +71,11 @@ class Overpass(object):
         )
         self.default_template = Template(conf.get("overpass_query", self.default_template))
 
+        self.partition_size = float(conf.get("partition_size", settings.OVERPASS_PARTITION_SIZE) or 0)
+        self.concurrency = int(conf.get("concurrency") or settings.OVERPASS_CONCURRENCY)
+
         # dump out all osm data for the specified bounding box
-        max_size = settings.OVERPASS_MAX_SIZE
-        timeout = settings.OVERPASS_TIMEOUT
-        self.query = self.default_template.safe_substitute({"maxsize": max_size, "timeout": timeout, "bbox": self.bbox})
+        self.query = self.get_bbox_query(self.bbox)
         # set up required paths
         if raw_data_filename is None:
             raw_data_filename = "query.osm"
@@ -85,39 +90,177 @@ class Overpass(object):
         """Get the overpass query used for this extract."""
         return self.query
 
-    def run_query(self, user_details=None, subtask_percentage=100, subtask_start=0, eta=None):
+    def get_bbox_query(self, bbox):
+        """
+        Get the overpass query for a bounding box string of the form "<lat0>,<long0>,<lat1>,<long1>".
+        """
+        max_size = settings.OVERPASS_MAX_SIZE
+        timeout = settings.OVERPASS_TIMEOUT
+        return self.default_template.safe_substitute({"maxsize": max_size, "timeout": timeout, "bbox": bbox})
+
+    def get_partitions(self):
+        """
+        Split the extent into partitions of about partition_size degrees, so that large areas can be queried
+        concurrently.
+
+        Return:
+            a list of bboxes of the form [long0, lat0, long1, lat1] covering the extent
+        """
+        width = self.extent[2] - self.extent[0]
+        height = self.extent[3] - self.extent[1]
+        if not self.partition_size or (width <= self.partition_size and height <= self.partition_size):
+            return [self.extent]
+        # Size the grid so that each (256 pixel) tile covers about partition_size degrees.
+        size = (
+            math.ceil(width / self.partition_size) * 256,
+            math.ceil(height / self.partition_size) * 256,
+        )
+        partitions = []
+        for tile_bbox in get_chunked_bbox(self.extent, size=size):
+            # The tiles on the edges of the grid can extend past the extent.
+            partition = [
+                max(tile_bbox[0], self.extent[0]),
+                max(tile_bbox[1], self.extent[1]),
+                min(tile_bbox[2], self.extent[2]),
+                min(tile_bbox[3], self.extent[3]),
+            ]
+            if partition[0] < partition[2] and partition[1] < partition[3]:
+                partitions.append(partition)
+        return partitions
+
+    def run_query(self, user_details=None, subtask_percentage=100, subtask_start=0, eta=None, pbf_filename=None):
         """
         Run the overpass query.
         subtask_percentage is the percentage of the task referenced by self.task_uid this method takes up.
             Used to update progress.
+        If a pbf_filename is provided, the results are converted to pbf as they are downloaded, instead of being
+            written to disk as osm and converted afterwards.
 
         Return:
-            the path to the overpass extract
+            the path to the overpass extract, or to the pbf file if a pbf_filename was provided
         """
-        from eventkit_cloud.tasks.helpers import update_progress
         from audit_logging.file_logging import logging_open
 
         # This is just to make it easier to trace when user_details haven't been sent
         if user_details is None:
             user_details = {"username": "unknown-run_query"}
 
-        req = None
-        query = self.get_query()
-        logger.debug(query)
         logger.debug(f"Query started at: {datetime.now()}")
-        try:
-            update_progress(
-                self.task_uid,
-                progress=0,
+        if pbf_filename and len(self.get_partitions()) > 1:
+            return self.run_partitioned_query(
+                pbf_filename,
+                user_details=user_details,
                 subtask_percentage=subtask_percentage,
                 subtask_start=subtask_start,
                 eta=eta,
-                msg="Querying provider data",
             )
+
+        osm_chunks = self.get_query_data(subtask_percentage=subtask_percentage, subtask_start=subtask_start, eta=eta)
+        if pbf_filename:
+            pbf_filepath = OSMToPBF(pbffile=pbf_filename, task_uid=self.task_uid).convert_stream(
+                osm_chunks, user_details=user_details
+            )
+            logger.debug(f"Query finished at {datetime.now()}")
+            logger.debug(f"Converted overpass query results to: {pbf_filepath}")
+            return pbf_filepath
+
+        with logging_open(self.raw_osm, "wb", user_details=user_details) as fd:
+            for chunk in osm_chunks:
+                fd.write(chunk)
+
+        logger.debug(f"Query finished at {datetime.now()}")
+        logger.debug(f"Wrote overpass query results to: {self.raw_osm}")
+        return self.raw_osm
+
+    def run_partitioned_query(
+        self, pbf_filename, user_details=None, subtask_percentage=100, subtask_start=0, eta=None,
+    ):
+        """
+        Run an overpass query for each partition of the extent concurrently, and merge the results.
+        Each partition is retried on its own if it fails, and partitions which were completed by a previous attempt
+        of the task are not queried again.
+
+        Return:
+            the path to the merged pbf file
+        """
+        from eventkit_cloud.tasks.helpers import ProgressTracker, SubProgressTracker
+
+        partitions = self.get_partitions()
+        logger.info(f"Querying overpass in {len(partitions)} partitions, {self.concurrency} at a time.")
+        # Each partition is worth 100 points of the total task points.
+        progress_tracker = ProgressTracker(
+            self.task_uid,
+            task_points=len(partitions) * 100,
+            subtask_percentage=subtask_percentage,
+            subtask_start=subtask_start,
+            eta=eta,
+        )
+        root, ext = os.path.splitext(pbf_filename)
+        partition_args = [
+            (partition, f"{root}_{index}{ext}", SubProgressTracker(progress_tracker))
+            for index, partition in enumerate(partitions)
+        ]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures_list = [
+                executor.submit(self.run_partition_query, *args, user_details=user_details) for args in partition_args
+            ]
+            # result() is called for all futures so that any exception raised within is propagated to the caller.
+            partition_files = [future.result() for future in futures_list]
+        progress_tracker.flush(msg="Merging data from provider")
+
+        pbf_filepath = merge_pbf_files(partition_files, pbf_filename, task_uid=self.task_uid)
+        for partition_file in partition_files:
+            os.remove(partition_file)
+        logger.debug(f"Query finished at {datetime.now()}")
+        logger.debug(f"Merged overpass query results to: {pbf_filepath}")
+        return pbf_filepath
+
+    @retry
+    def run_partition_query(self, partition, pbf_filename, progress_tracker, user_details=None):
+        """
+        Run the overpass query for a single partition of the extent and convert the results to pbf.
+
+        Return:
+            the path to the partition's pbf file
+        """
+        if os.path.isfile(pbf_filename):
+            logger.info(f"Using previously queried partition: {pbf_filename}")
+            progress_tracker.update(100)
+            return pbf_filename
+        # Write to a temporary file so that a failed partition isn't mistaken for a complete one.
+        partial_filename = f"{pbf_filename}.part"
+        osm_chunks = self.get_query_data(
+            query=self.get_bbox_query(get_overpass_bbox(partition)), progress=progress_tracker
+        )
+        OSMToPBF(pbffile=partial_filename, task_uid=self.task_uid).convert_stream(osm_chunks, user_details=user_details)
+        os.replace(partial_filename, pbf_filename)
+        return pbf_filename
+
+    def get_query_data(self, subtask_percentage=100, subtask_start=0, eta=None, query=None, progress=None):
+        """
+        Run the overpass query and yield the results as they are downloaded.
+        subtask_percentage is the percentage of the task referenced by self.task_uid this method takes up.
+            Used to update progress.
+        query is the overpass query to run, defaults to the query for the whole extent.
+        progress is an optional tracker to report the progress of this query to, instead of updating the task.
+
+        Return:
+            a generator of the raw osm data in chunks of bytes
+        """
+        from eventkit_cloud.tasks.helpers import ProgressTracker
+
+        req = None
+        query = query or self.get_query()
+        logger.debug(query)
+        progress_tracker = progress or ProgressTracker(
+            self.task_uid, subtask_percentage=subtask_percentage, subtask_start=subtask_start, eta=eta
+        )
+        try:
+            progress_tracker.update(0, msg="Querying provider data", force=True)
             conf: dict = yaml.safe_load(self.config) or dict()
             cert_info = conf.get("cert_info")
 
-            session = get_or_update_session(cert_info=cert_info, slug=self.slug)
+            session = get_or_update_session(cert_info=cert_info, slug=self.slug, pool_size=self.concurrency)
             req = session.post(self.url, data=query, stream=True)
             if not req.ok:
                 # Workaround for https://bugs.python.org/issue27777
@@ -135,54 +278,31 @@ class Overpass(object):
             # Since the request takes a while, jump progress to a very high percent...
             query_percent = 85.0
             download_percent = 100.0 - query_percent
-            update_progress(
-                self.task_uid,
-                progress=query_percent,
-                subtask_percentage=subtask_percentage,
-                subtask_start=subtask_start,
-                eta=eta,
+            progress_tracker.update(
+                query_percent,
                 msg="Downloading data from provider: 0 of {:.2f} MB(s)".format(total_size / float(1e6)),
+                force=True,
             )
 
             CHUNK = 1024 * 1024 * 2  # 2MB chunks
-            update_interval = 1024 * 1024 * 250  # Every 250 MB
 
             written_size = 0
-            last_update = 0
-            with logging_open(self.raw_osm, "wb", user_details=user_details) as fd:
-                for chunk in req.iter_content(CHUNK):
-                    fd.write(chunk)
-                    written_size += CHUNK
-
-                    # Limit the number of calls to update_progress because every time update_progress is called,
-                    # the ExportTask model is updated, causing django_audit_logging to update the audit way to much
-                    # (via the post_save hook). In the future, we might try still using update progress just as much
-                    # but update the model less to make the audit log less spammed, or making audit_logging only log
-                    # certain model changes rather than logging absolutely everything.
-                    last_update += CHUNK
-                    if last_update > update_interval:
-                        last_update = 0
-                        progress = query_percent + (float(written_size) / float(total_size) * download_percent)
-                        update_progress(
-                            self.task_uid,
-                            progress=progress,
-                            subtask_percentage=subtask_percentage,
-                            subtask_start=subtask_start,
-                            eta=eta,
-                            msg="Downloading data from provider: {:.2f} of {:.2f} MB(s)".format(
-                                written_size / float(1e6), total_size / float(1e6)
-                            ),
-                        )
+            for chunk in req.iter_content(CHUNK):
+                yield chunk
+                written_size += len(chunk)
+
+                # The tracker limits how often the progress is written, because every write updates the
+                # ExportTaskRecord in the cache and the audit log.
+                progress = query_percent + (float(written_size) / float(total_size) * download_percent)
+                progress_tracker.update(
+                    progress,
+                    msg="Downloading data from provider: {:.2f} of {:.2f} MB(s)".format(
+                        written_size / float(1e6), total_size / float(1e6)
+                    ),
+                )
 
             # Done w/ this subtask
-            update_progress(
-                self.task_uid,
-                progress=100,
-                subtask_percentage=subtask_percentage,
-                subtask_start=subtask_start,
-                eta=eta,
-                msg="Completed downloading data from provider",
-            )
+            progress_tracker.update(100, msg="Completed downloading data from provider", force=True)
         except exceptions.RequestException as e:
             logger.error("Overpass query threw: {0}".format(e))
             raise exceptions.RequestException(e)
@@ -190,9 +310,14 @@ class Overpass(object):
             if req:
                 req.close()
 
-        logger.debug(f"Query finished at {datetime.now()}")
-        logger.debug(f"Wrote overpass query results to: {self.raw_osm}")
-        return self.raw_osm
+
+def get_overpass_bbox(bbox):
+    """
+    Overpass expects a bounding box string of the form "<lat0>,<long0>,<lat1>,<long1>".
+    :param bbox: A bounding box of the form [long0, lat0, long1, lat1].
+    :return: The overpass bounding box string.
+    """
+    return f"{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}"
 
 
 if __name__ == "__main__":
@@ -22,11 +22,14 @@ class OSMToPBF(object):
         Initialize the OSMToPBF utility.
 
         Args:
-            osm: the raw osm file to convert
+            osm: the raw osm file to convert, can be omitted when the osm data is streamed with convert_stream
             pbffile: the location of the pbf output file
         """
         self.osm = osm
-        if not os.path.exists(self.osm):
+        if self.osm is None:
+            if not pbffile:
+                raise ValueError("A pbf file is required to convert streamed OSM data.")
+        elif not os.path.exists(self.osm):
             raise IOError("Cannot find raw OSM data for this task.")
         self.pbffile = pbffile
         if not self.pbffile:
@@ -62,6 +65,80 @@ class OSMToPBF(object):
             print("Osmconvert returned: %s" % task_process.exitcode)
         return self.pbffile
 
+    def convert_stream(self, osm_chunks, user_details=None):
+        """
+        Convert raw osm to pbf as it is downloaded, without writing the osm to disk first.
+        :param osm_chunks: An iterable of bytes of raw osm data.
+        :param user_details: The user details used for audit logging.
+        :return: The path to the pbf file.
+        """
+        from audit_logging.file_logging import logging_open
+
+        # osmconvert reads the osm from stdin and writes the pbf to stdout.
+        convert_cmd = ["osmconvert", "-", "--out-pbf"]
+        if self.debug:
+            print("Running: %s" % " ".join(convert_cmd))
+        task_process = TaskProcess(task_uid=self.task_uid)
+        with logging_open(self.pbffile, "wb", user_details=user_details) as fd:
+            task_process.stream_process(convert_cmd, input_chunks=osm_chunks, output=fd)
+        if task_process.exitcode != 0:
+            logger.error("{0}".format(task_process.stderr))
+            logger.error("osmconvert failed with return code: {0}".format(task_process.exitcode))
+            logger.error("osmconvert most commonly fails due to lack of memory.")
+            raise Exception("Osmconvert Failed.")
+
+        if self.debug:
+            print("Osmconvert returned: %s" % task_process.exitcode)
+        return self.pbffile
+
+
+def merge_pbf_files(pbf_files, pbffile, task_uid=None):
+    """
+    Merge pbf files into a single pbf file.  Objects which are in more than one of the files (e.g. ways crossing the
+    boundary between the extents of two overpass queries) are only written once.
+    :param pbf_files: A list of the pbf files to merge, each sorted by object type and id as overpass returns them.
+    :param pbffile: The location of the merged pbf file.
+    :param task_uid: The uid of the task running the merge.
+    :return: The path to the merged pbf file.
+    """
+    merge_cmd = ["osmconvert", *pbf_files, "--out-pbf", f"-o={pbffile}"]
+    task_process = TaskProcess(task_uid=task_uid)
+    task_process.start_process(merge_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if task_process.exitcode != 0:
+        logger.error("{0}".format(task_process.stderr))
+        logger.error("osmconvert failed to merge with return code: {0}".format(task_process.exitcode))
+        raise Exception("Osmconvert Failed.")
+    return pbffile
+
+
+def clip_pbf_file(pbf_file, bbox, pbffile, task_uid=None):
+    """
+    Clip a pbf file to a bounding box.  Ways and relations which cross the bounding box are kept whole, like they are
+    in the results of an overpass query.  To complete them osmconvert reads the whole pbf file twice, so the time taken
+    depends on the size of the pbf file rather than the bounding box.
+    :param pbf_file: The pbf file to clip.
+    :param bbox: The bounding box to clip to, of the form [long0, lat0, long1, lat1].
+    :param pbffile: The location of the clipped pbf file.
+    :param task_uid: The uid of the task running the clip.
+    :return: The path to the clipped pbf file.
+    """
+    clip_cmd = [
+        "osmconvert",
+        pbf_file,
+        "-b={0},{1},{2},{3}".format(*bbox),
+        "--complete-ways",
+        "--complete-multipolygons",
+        "--out-pbf",
+        f"-o={pbffile}",
+    ]
+    task_process = TaskProcess(task_uid=task_uid)
+    task_process.start_process(clip_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if task_process.exitcode != 0:
+        logger.error("{0}".format(task_process.stderr))
+        logger.error("osmconvert failed to clip with return code: {0}".format(task_process.exitcode))
+        raise Exception("Osmconvert Failed.")
+    return pbffile
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Converts OSM XML to PBF")
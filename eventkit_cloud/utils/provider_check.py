@@ -158,6 +158,7 @@ class ProviderCheck(object):
             slug=self.slug,
             params=self.query,
             timeout=self.timeout,
+            pool_size=self.config.get("concurrency"),
         )
 
         if aoi_geojson is not None and aoi_geojson != "":
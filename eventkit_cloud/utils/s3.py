@@ -1,17 +1,28 @@
+import hashlib
 import logging
 import os
 import pathlib
+from concurrent import futures
 from urllib.parse import urlparse
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
 def get_s3_client():
+    # Each file can use up to AWS_S3_MAX_CONCURRENCY connections, for up to AWS_S3_DOWNLOAD_CONCURRENCY files at once.
+    max_concurrency = getattr(settings, "AWS_S3_MAX_CONCURRENCY", 10)
+    download_concurrency = getattr(settings, "AWS_S3_DOWNLOAD_CONCURRENCY", 4)
     return boto3.client(
-        "s3", aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        config=Config(max_pool_connections=max_concurrency * download_concurrency),
     )
 
 
@@ -21,9 +32,88 @@ def get_s3_resource():
     )
 
 
+def get_transfer_config():
+    """
+    :return: A TransferConfig which splits files into AWS_S3_MULTIPART_CHUNKSIZE MB parts and transfers up to
+    AWS_S3_MAX_CONCURRENCY of them at the same time.
+    """
+    chunk_size = getattr(settings, "AWS_S3_MULTIPART_CHUNKSIZE", 64) * 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=getattr(settings, "AWS_S3_MAX_CONCURRENCY", 10),
+        use_threads=True,
+    )
+
+
+def get_file_checksum(file_path, block_size=1024 * 1024):
+    """
+    :param file_path: A local file path.
+    :param block_size: The number of bytes to read at a time.
+    :return: The sha256 hex digest of the file.
+    """
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as checksum_file:
+        for block in iter(lambda: checksum_file.read(block_size), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+class ChecksumReader(object):
+    """
+    Wraps a file which is being uploaded to compute its sha256 checksum while the upload reads it, so that the file
+    isn't read an extra time.  Data which is read again (e.g. when a part is retried) is only counted once.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.checksum = hashlib.sha256()
+        self.checksummed = 0
+
+    def read(self, size=-1):
+        position = self.fileobj.tell()
+        data = self.fileobj.read(size)
+        if position <= self.checksummed < position + len(data):
+            self.checksum.update(data[self.checksummed - position :])
+            self.checksummed = position + len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+    def hexdigest(self, size):
+        """
+        :param size: The size of the file.
+        :return: The sha256 hex digest of the file, or None if it wasn't read from start to end.
+        """
+        if self.checksummed == size:
+            return self.checksum.hexdigest()
+
+
+def get_object_checksum(client, key, size):
+    """
+    :param client: An S3 client.
+    :param key: The key of an object in the AWS_STORAGE_BUCKET_NAME bucket.
+    :param size: The size of the local file which is compared to the object.
+    :return: The sha256 checksum the object was tagged with when it was uploaded, or None if the object doesn't exist,
+    has a different size or wasn't tagged.
+    """
+    try:
+        head = client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+        if head.get("ContentLength") != size:
+            return None
+        tagging = client.get_object_tagging(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError:
+        return None
+    for tag in tagging.get("TagSet", []):
+        if tag.get("Key") == "sha256":
+            return tag.get("Value")
+
+
 def upload_to_s3(source_path, destination_filename, client=None, user_details=None):
     """
-    Upload a file to Amazon S3.
+    Upload a file to Amazon S3.  Large files are uploaded in parallel parts, and the upload is skipped if the same file
+    was already uploaded to the destination.
     :param source_path: The local file path.
     :param destination_filename: The path you want to store the file on on S3.
     :param client: An S3 client, optional.
@@ -39,41 +129,98 @@ def upload_to_s3(source_path, destination_filename, client=None, user_details=No
     if not os.path.isfile(source_path):
         raise Exception("The file path given to upload to S3:\n {0} \n Does not exist.".format(source_path))
 
-    from audit_logging.file_logging import logging_open
+    # The checksum is tagged on the object, so that a file which is uploaded again (e.g. by a retried task) or
+    # downloaded for a rezip can be recognized without transferring it.  The local file is only hashed up front when
+    # an object of the same size already exists, otherwise the checksum is computed while the upload reads the file.
+    size = os.path.getsize(source_path)
+    checksum = get_object_checksum(client, destination_filename, size)
+    if checksum and checksum == get_file_checksum(source_path):
+        logger.info(f"{destination_filename} is already on S3, skipping the upload.")
+    else:
+        from audit_logging.file_logging import logging_open
 
-    with logging_open(source_path, "rb", user_details=user_details) as asset_file:
-        client.upload_fileobj(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=destination_filename, Fileobj=asset_file)
+        with logging_open(source_path, "rb", user_details=user_details) as asset_file:
+            reader = ChecksumReader(asset_file)
+            client.upload_fileobj(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=destination_filename,
+                Fileobj=reader,
+                Config=get_transfer_config(),
+            )
+        checksum = reader.hexdigest(size)
+        if checksum:
+            try:
+                client.put_object_tagging(
+                    Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                    Key=destination_filename,
+                    Tagging={"TagSet": [{"Key": "sha256", "Value": checksum}]},
+                )
+            except ClientError as ce:
+                logger.warning(f"Could not tag {destination_filename} with its checksum: {ce}")
 
     return client.generate_presigned_url(
         "get_object", Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": destination_filename},
     ).split("?")[0]
 
 
+def download_from_s3(key, destination_path, size, client=None):
+    """
+    Downloads an object from S3 in parallel parts, unless the same file is already at the destination.
+    :param key: The key of an object in the AWS_STORAGE_BUCKET_NAME bucket.
+    :param destination_path: The local file path.
+    :param size: The size of the object.
+    :param client: An S3 client, optional.
+    :return: The local file path.
+    """
+    if not client:
+        client = get_s3_client()
+
+    # Only files of the same size are worth checksumming.
+    if os.path.isfile(destination_path) and os.path.getsize(destination_path) == size:
+        checksum = get_object_checksum(client, key, size)
+        if checksum and checksum == get_file_checksum(destination_path):
+            logger.info(f"{destination_path} is already downloaded, skipping the download.")
+            return destination_path
+
+    client.download_file(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Filename=destination_path, Config=get_transfer_config()
+    )
+    return destination_path
+
+
 def download_folder_from_s3(folder_to_download: str):
     """
-    Downloads a folder from S3 into the EXPORT_STAGING_ROOT.
+    Downloads a folder from S3 into the EXPORT_STAGING_ROOT, AWS_S3_DOWNLOAD_CONCURRENCY files at a time.
     :param folder_to_download: The folder path on S3 you want to download.
     """
-    resource = get_s3_resource()
-    bucket = resource.Bucket(settings.AWS_STORAGE_BUCKET_NAME)
+    client = get_s3_client()
+    paginator = client.get_paginator("list_objects_v2")
+
+    with futures.ThreadPoolExecutor(max_workers=getattr(settings, "AWS_S3_DOWNLOAD_CONCURRENCY", 4)) as executor:
+        downloads = []
+        for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=folder_to_download):
+            for item in page.get("Contents", []):
+                key = item["Key"]
 
-    for object in bucket.objects.filter(Prefix=folder_to_download):
+                if key == folder_to_download:
+                    os.makedirs(os.path.dirname(key), exist_ok=True)
+                    continue
 
-        if object.key == folder_to_download:
-            os.makedirs(os.path.dirname(object.key), exist_ok=True)
-            continue
+                # We don't want or need the original zip file, since we're creating a new one.
+                file_extension = pathlib.PurePosixPath(key).suffix
+                if file_extension == ".zip":
+                    continue
 
-        # We don't want or need the original zip file, since we're creating a new one.
-        file_extension = pathlib.PurePosixPath(object.key).suffix
-        if file_extension == ".zip":
-            continue
+                directory = os.path.dirname(key)
+                destination_directory = os.path.join(settings.EXPORT_STAGING_ROOT.rstrip("\/"), directory)
+                os.makedirs(destination_directory, exist_ok=True)
 
-        directory = os.path.dirname(object.key)
-        destination_directory = os.path.join(settings.EXPORT_STAGING_ROOT.rstrip("\/"), directory)
-        os.makedirs(destination_directory, exist_ok=True)
+                destination_path = os.path.join(settings.EXPORT_STAGING_ROOT.rstrip("\/"), key)
+                downloads.append(executor.submit(download_from_s3, key, destination_path, item["Size"], client=client))
 
-        destination_path = os.path.join(settings.EXPORT_STAGING_ROOT.rstrip("\/"), object.key)
-        bucket.download_file(object.key, destination_path)
+        # Raise any errors from the downloads.
+        for download in futures.as_completed(downloads):
+            download.result()
 
 
 def delete_from_s3(run_uid=None, download_url=None, client=None):
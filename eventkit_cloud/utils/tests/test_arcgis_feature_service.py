@@ -0,0 +1,104 @@
+import json
+
+import requests_mock
+from django.test import TestCase
+
+from eventkit_cloud.utils.arcgis_feature_service import ArcGISFeatureService, EsriJsonError, EsriJsonParser
+
+
+class TestEsriJsonParser(TestCase):
+    def setUp(self):
+        self.response = {
+            "objectIdFieldName": "OBJECTID",
+            "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}, {"name": "name"}],
+            "exceededTransferLimit": True,
+            "features": [
+                {"attributes": {"OBJECTID": index, "name": "é" * index}, "geometry": {"x": 1.5, "y": 2}}
+                for index in range(20)
+            ],
+            "count": 12345,
+        }
+        self.data = json.dumps(self.response, ensure_ascii=False).encode()
+
+    def test_feed(self):
+        # Use small chunk sizes to split values (and multibyte characters) between chunks.
+        for chunk_size in [1, 7, len(self.data)]:
+            features = []
+            parser = EsriJsonParser(feature_handler=features.append)
+            for index in range(0, len(self.data), chunk_size):
+                parser.feed(self.data[index : index + chunk_size])
+            parser.close()
+
+            self.assertEqual(self.response["features"], features)
+            self.assertEqual(len(self.response["features"]), parser.feature_count)
+            self.assertEqual(12345, parser.metadata["count"])
+            self.assertTrue(parser.metadata["exceededTransferLimit"])
+            self.assertNotIn("features", parser.metadata)
+
+    def test_empty_features(self):
+        parser = EsriJsonParser()
+        parser.feed(b'{"features": []}')
+        parser.close()
+        self.assertEqual(0, parser.feature_count)
+
+    def test_invalid_responses(self):
+        invalid_responses = [
+            b'{"error": {"code": 400, "message": "Invalid query"}}',
+            b'{"fields": []}',
+            b'{"features": [{"attributes": {}}',
+            b"<html>Not Found</html>",
+        ]
+        for invalid_response in invalid_responses:
+            parser = EsriJsonParser()
+            with self.assertRaises(EsriJsonError):
+                parser.feed(invalid_response)
+                parser.close()
+
+
+@requests_mock.Mocker()
+class TestArcGISFeatureService(TestCase):
+    def setUp(self):
+        self.service_url = "https://abc.gov/arcgis/rest/services/x/FeatureServer/0"
+        self.query_url = f"{self.service_url}/query?where=objectid=objectid&outfields=*&f=json&geometry=1,2,3,4"
+        self.metadata = {
+            "maxRecordCount": 1000,
+            "advancedQueryCapabilities": {"supportsPagination": True},
+            "fields": [{"name": "FID", "type": "esriFieldTypeOID"}],
+        }
+
+    def test_get_pages(self, requests_mocker):
+        requests_mocker.get(f"{self.service_url}?f=json", json=self.metadata)
+        requests_mocker.get(f"{self.query_url}&returnCountOnly=true", json={"count": 2500})
+        feature_service = ArcGISFeatureService(self.query_url)
+
+        pages = feature_service.get_pages(self.query_url, "/stage/chunk0.json")
+
+        expected_pages = [
+            (f"{self.query_url}&resultOffset=0&resultRecordCount=1000&orderByFields=FID", "/stage/chunk0-0.json"),
+            (f"{self.query_url}&resultOffset=1000&resultRecordCount=1000&orderByFields=FID", "/stage/chunk0-1.json"),
+            (f"{self.query_url}&resultOffset=2000&resultRecordCount=1000&orderByFields=FID", "/stage/chunk0-2.json"),
+        ]
+        self.assertEqual(expected_pages, pages)
+
+        # The metadata is only requested once.
+        feature_service.get_pages(self.query_url, "/stage/chunk1.json")
+        metadata_requests = [
+            request for request in requests_mocker.request_history if "returnCountOnly" not in request.url
+        ]
+        self.assertEqual(1, len(metadata_requests))
+
+    def test_get_pages_under_max_record_count(self, requests_mocker):
+        requests_mocker.get(f"{self.service_url}?f=json", json=self.metadata)
+        requests_mocker.get(f"{self.query_url}&returnCountOnly=true", json={"count": 10})
+        feature_service = ArcGISFeatureService(self.query_url)
+        self.assertEqual(
+            [(self.query_url, "/stage/chunk0.json")], feature_service.get_pages(self.query_url, "/stage/chunk0.json")
+        )
+
+    def test_get_pages_without_pagination(self, requests_mocker):
+        requests_mocker.get(f"{self.service_url}?f=json", status_code=500)
+        feature_service = ArcGISFeatureService(self.query_url)
+        self.assertFalse(feature_service.supports_pagination)
+        self.assertEqual(
+            [(self.query_url, "/stage/chunk0.json")], feature_service.get_pages(self.query_url, "/stage/chunk0.json")
+        )
@@ -2,11 +2,12 @@
 import doctest
 import logging
 import os
+import tempfile
 from unittest.mock import Mock, patch, call, MagicMock, ANY
 from uuid import uuid4
 
 from django.test import TestCase
-from osgeo import gdal, ogr
+from osgeo import gdal
 
 from eventkit_cloud.utils import gdalutils
 from eventkit_cloud.utils.gdalutils import (
@@ -22,6 +23,8 @@ from eventkit_cloud.utils.gdalutils import (
     progress_callback,
     polygonize,
     get_chunked_bbox,
+    DatasetInfo,
+    inspect_dataset,
 )
 
 logger = logging.getLogger(__name__)
@@ -40,18 +43,16 @@ class TestGdalUtils(TestCase):
         self.addCleanup(self.task_process_patcher.stop)
         self.task_uid = uuid4()
 
-    @patch("eventkit_cloud.utils.gdalutils.os.path.isfile")
-    @patch("eventkit_cloud.utils.gdalutils.open_dataset")
-    def test_get_meta(self, open_dataset_mock, isfile):
+    @patch("eventkit_cloud.utils.gdalutils.open_dataset_ex")
+    def test_get_meta(self, open_dataset_ex_mock):
         dataset_path = "/path/to/dataset"
-        isfile.return_value = True
-        self.task_process.return_value = Mock(exitcode=0)
 
-        mock_open_dataset = Mock(spec=gdal.Dataset)
+        mock_open_dataset = Mock()
         mock_open_dataset.RasterCount = 0
-        open_dataset_mock.return_value = mock_open_dataset
+        mock_open_dataset.GetLayerCount.return_value = 0
+        open_dataset_ex_mock.return_value = mock_open_dataset
         mock_open_dataset.GetDriver.return_value.ShortName = "gtiff"
-        expected_meta = {"driver": "gtiff", "is_raster": True, "nodata": None}
+        expected_meta = {"driver": "gtiff", "is_raster": False, "nodata": None}
         returned_meta = get_meta(dataset_path)
         self.assertEqual(expected_meta, returned_meta)
 
@@ -61,18 +62,38 @@ class TestGdalUtils(TestCase):
         returned_meta = get_meta(dataset_path)
         self.assertEqual(expected_meta, returned_meta)
 
-        mock_open_dataset = Mock(spec=ogr.DataSource)
-        open_dataset_mock.return_value = mock_open_dataset
-        mock_open_dataset.GetDriver.return_value.GetName.return_value = "gpkg"
-        expected_meta = {"driver": "gpkg", "is_raster": False, "nodata": None}
-        returned_meta = get_meta(dataset_path)
+        # Vector data is preferred when is_raster is False.
+        mock_open_dataset.GetLayerCount.return_value = 1
+        mock_open_dataset.GetDriver.return_value.ShortName = "gpkg"
+        expected_meta = {"driver": "gpkg", "is_raster": False, "nodata": -32768.0}
+        returned_meta = get_meta(dataset_path, is_raster=False)
         self.assertEqual(expected_meta, returned_meta)
+        self.assertEqual(gdal.OF_VECTOR, open_dataset_ex_mock.call_args[0][1])
 
-        open_dataset_mock.return_value = None
+        open_dataset_ex_mock.return_value = None
         expected_meta = {"driver": None, "is_raster": None, "nodata": None}
         returned_meta = get_meta(dataset_path)
         self.assertEqual(expected_meta, returned_meta)
 
+    @patch("eventkit_cloud.utils.gdalutils.read_dataset_info")
+    def test_inspect_dataset(self, mock_read_dataset_info):
+        mock_read_dataset_info.return_value = DatasetInfo("GTiff", True, None, 1, [])
+        with tempfile.NamedTemporaryFile() as dataset:
+            self.assertEqual(mock_read_dataset_info.return_value, inspect_dataset(dataset.name))
+            self.assertEqual(mock_read_dataset_info.return_value, inspect_dataset(dataset.name))
+            mock_read_dataset_info.assert_called_once_with(dataset.name, True)
+
+            # Changed files are inspected again.
+            dataset.write(b"data")
+            dataset.flush()
+            inspect_dataset(dataset.name)
+            self.assertEqual(2, mock_read_dataset_info.call_count)
+
+        # Datasets which aren't files are always inspected.
+        inspect_dataset("PG:dbname=gis")
+        inspect_dataset("PG:dbname=gis")
+        self.assertEqual(4, mock_read_dataset_info.call_count)
+
     def test_is_envelope(self):
         envelope_gj = """{"type": "MultiPolygon",
             "coordinates": [ [
@@ -424,9 +445,19 @@ class TestGdalUtils(TestCase):
         example_user_data = {"task_uid": task_uid, "subtask_percentage": subtask_percentage}
         progress_callback(example_percentage, example_message, example_user_data)
         mock_update_progress.assert_called_once_with(
-            task_uid, progress=10, subtask_percentage=subtask_percentage, msg=example_message
+            task_uid,
+            progress=10,
+            subtask_percentage=subtask_percentage,
+            subtask_start=0,
+            eta=None,
+            msg=example_message,
         )
 
+        # Small changes in progress are aggregated instead of written.
+        mock_update_progress.reset_mock()
+        progress_callback(0.11, example_message, example_user_data)
+        mock_update_progress.assert_not_called()
+
     @patch("eventkit_cloud.utils.gdalutils.get_dataset_names")
     @patch("eventkit_cloud.utils.gdalutils.gdal")
     def test_convert_raster(self, mock_gdal, mock_get_dataset_names):
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from django.test import TestCase
+
+from eventkit_cloud.utils import generic
+from eventkit_cloud.utils.generic import get_file_timestamp, has_zipfile_internals, link_file, write_zip_files
+
+
+class TestGeneric(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.source_file = os.path.join(self.temp_dir, "source")
+        with open(self.source_file, "w") as source_file:
+            source_file.write("data")
+        self.output_file = os.path.join(self.temp_dir, "output")
+
+    @patch("eventkit_cloud.utils.generic.os.path.getmtime")
+    def test_get_file_timestamp(self, mock_getmtime):
+        mock_getmtime.return_value = 1529327399
+        self.assertEqual("2018-06-18T13:09:59Z", get_file_timestamp("/path/to/planet.pbf"))
+
+    def test_link_file(self):
+        # Existing files are replaced.
+        with open(self.output_file, "w") as output_file:
+            output_file.write("old data")
+        self.assertEqual(self.output_file, link_file(self.source_file, self.output_file))
+        self.assertTrue(os.path.samefile(self.source_file, self.output_file))
+        self.assertEqual(2, os.stat(self.source_file).st_nlink)
+
+        # Removing the source leaves the link intact.
+        os.remove(self.source_file)
+        with open(self.output_file) as output_file:
+            self.assertEqual("data", output_file.read())
+        self.assertEqual(["output"], os.listdir(self.temp_dir))
+
+    @patch("eventkit_cloud.utils.generic.os.link")
+    def test_link_file_across_devices(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, "Invalid cross-device link")
+        self.assertEqual(self.output_file, link_file(self.source_file, self.output_file))
+        self.assertFalse(os.path.samefile(self.source_file, self.output_file))
+        with open(self.output_file) as output_file:
+            self.assertEqual("data", output_file.read())
+
+        mock_link.side_effect = OSError(errno.ENOENT, "No such file or directory")
+        with self.assertRaises(OSError):
+            link_file(os.path.join(self.temp_dir, "missing"), self.output_file)
+
+    def test_write_zip_files(self):
+        text_file = os.path.join(self.temp_dir, "text.txt")
+        with open(text_file, "w") as f:
+            f.write("data " * 1024 * 1024)
+        random_file = os.path.join(self.temp_dir, "random.gpkg")
+        with open(random_file, "wb") as f:
+            f.write(os.urandom(2 * 1024 * 1024))
+        zip_file = os.path.join(self.temp_dir, "source.zip")
+        shutil.copy(text_file, zip_file)
+        archive_file = os.path.join(self.temp_dir, "archive.zip")
+        files = [(text_file, "data/text.txt"), (random_file, "data/random.gpkg"), (zip_file, "source.zip")]
+
+        written = []
+        with ZipFile(archive_file, "a", compression=ZIP_DEFLATED, allowZip64=True) as zipfile:
+            zipfile.write(self.source_file, arcname="first.txt")
+            write_zip_files(zipfile, files, max_workers=2, callback=written.append)
+            zipfile.write(self.source_file, arcname="last.txt")
+        self.assertEqual([arcname for _, arcname in files], written)
+
+        with ZipFile(archive_file) as zipfile:
+            self.assertIsNone(zipfile.testzip())
+            self.assertEqual(
+                ["first.txt", "data/text.txt", "data/random.gpkg", "source.zip", "last.txt"], zipfile.namelist()
+            )
+            # Incompressible and already compressed files are stored.
+            self.assertEqual(
+                [ZIP_DEFLATED, ZIP_DEFLATED, ZIP_STORED, ZIP_STORED, ZIP_DEFLATED],
+                [info.compress_type for info in zipfile.infolist()],
+            )
+            for file_path, arcname in files:
+                with open(file_path, "rb") as f:
+                    self.assertEqual(f.read(), zipfile.read(arcname))
+
+    def test_write_zip_files_in_flight(self):
+        files = []
+        for index in range(10):
+            file_path = os.path.join(self.temp_dir, f"file{index}.txt")
+            with open(file_path, "w") as f:
+                f.write("data" * index)
+            files.append((file_path, f"file{index}.txt"))
+
+        # At most max_workers files are compressed ahead of the one which is being written.
+        compressed = []
+        written = []
+        in_flight = []
+
+        def compress_zip_member(*args, **kwargs):
+            compressed.append(args[1])
+            return generic_compress_zip_member(*args, **kwargs)
+
+        def callback(arcname):
+            written.append(arcname)
+            in_flight.append(len(compressed) - len(written))
+
+        generic_compress_zip_member = generic.compress_zip_member
+        archive_file = os.path.join(self.temp_dir, "archive.zip")
+        with patch("eventkit_cloud.utils.generic.compress_zip_member", side_effect=compress_zip_member):
+            with ZipFile(archive_file, "w", compression=ZIP_DEFLATED) as zipfile:
+                write_zip_files(zipfile, files, max_workers=2, callback=callback)
+        self.assertLessEqual(max(in_flight), 2)
+        with ZipFile(archive_file) as zipfile:
+            self.assertEqual([arcname for _, arcname in files], zipfile.namelist())
+
+    def test_zipfile_internals(self):
+        # write_zip_member uses private ZipFile attributes, this fails if a Python upgrade removes them.
+        with ZipFile(os.path.join(self.temp_dir, "archive.zip"), "w") as zipfile:
+            self.assertTrue(has_zipfile_internals(zipfile))
+
+        # Without them the files are compressed one at a time by ZipFile.
+        archive_file = os.path.join(self.temp_dir, "fallback.zip")
+        with patch("eventkit_cloud.utils.generic.has_zipfile_internals", return_value=False):
+            with ZipFile(archive_file, "w", compression=ZIP_DEFLATED) as zipfile:
+                write_zip_files(zipfile, [(self.source_file, "source.txt")])
+        with ZipFile(archive_file) as zipfile:
+            self.assertEqual(b"data", zipfile.read("source.txt"))
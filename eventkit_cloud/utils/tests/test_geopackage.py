@@ -2,6 +2,9 @@
 import doctest
 import logging
 import os
+import shutil
+import sqlite3
+import tempfile
 from unittest.mock import Mock, patch, call
 from uuid import uuid4
 
@@ -26,6 +29,7 @@ from eventkit_cloud.utils.geopackage import (
     create_metadata_tables,
     create_extension_table,
     add_file_metadata,
+    merge_tile_tables,
 )
 
 logger = logging.getLogger(__name__)
@@ -313,3 +317,41 @@ class TestGeopackage(TransactionTestCase):
         add_file_metadata(gpkg, metadata)
         mock_sqlite3.connect().__enter__().execute.assert_called()
         mock_create_metadata_tables.assert_called_once_with(gpkg)
+
+    def test_merge_tile_tables(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir, ignore_errors=True)
+
+        def create_gpkg(gpkg, tiles):
+            with sqlite3.connect(gpkg) as conn:
+                conn.execute("CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY, data_type TEXT);")
+                conn.execute("INSERT INTO gpkg_contents VALUES ('my-layer', 'tiles');")
+                conn.execute(
+                    "CREATE TABLE gpkg_tile_matrix (table_name TEXT, zoom_level INTEGER, matrix_width INTEGER, "
+                    "PRIMARY KEY (table_name, zoom_level));"
+                )
+                conn.execute(
+                    'CREATE TABLE "my-layer" (id INTEGER PRIMARY KEY AUTOINCREMENT, zoom_level INTEGER, tile_column '
+                    "INTEGER, tile_row INTEGER, tile_data BLOB, UNIQUE (zoom_level, tile_column, tile_row));"
+                )
+                for tile in tiles:
+                    conn.execute(
+                        'INSERT INTO "my-layer" (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?);',
+                        tile,
+                    )
+                    conn.execute("INSERT OR IGNORE INTO gpkg_tile_matrix VALUES ('my-layer', ?, 1);", (tile[0],))
+
+        target_gpkg = os.path.join(tempdir, "target.gpkg")
+        source_gpkg = os.path.join(tempdir, "source.gpkg")
+        create_gpkg(target_gpkg, [(0, 0, 0, b"target"), (1, 0, 0, b"target")])
+        create_gpkg(source_gpkg, [(1, 0, 0, b"source"), (2, 1, 1, b"source")])
+
+        merge_tile_tables(source_gpkg, target_gpkg)
+
+        with sqlite3.connect(target_gpkg) as conn:
+            tiles = conn.execute(
+                'SELECT zoom_level, tile_column, tile_row, tile_data FROM "my-layer" ORDER BY zoom_level;'
+            ).fetchall()
+            zoom_levels = conn.execute("SELECT zoom_level FROM gpkg_tile_matrix ORDER BY zoom_level;").fetchall()
+        self.assertEqual([(0, 0, 0, b"target"), (1, 0, 0, b"source"), (2, 1, 1, b"source")], tiles)
+        self.assertEqual([(0,), (1,), (2,)], zoom_levels)
@@ -7,9 +7,11 @@ from eventkit_cloud.utils.mapproxy import mapproxy_config_keys_index
 
 
 class TestHelpers(TestCase):
+    @patch("eventkit_cloud.utils.helpers.invalidate_mapproxy_apps")
     @patch("eventkit_cloud.utils.helpers.cache")
-    def test_clear_mapproxy_config_cache(self, cache_mock):
+    def test_clear_mapproxy_config_cache(self, cache_mock, mock_invalidate_mapproxy_apps):
         mapproxy_config_keys = cache_mock.get_or_set.return_value = {"key-a", "key-b"}
         clear_mapproxy_config_cache()
         cache_mock.get_or_set.assert_called_with(mapproxy_config_keys_index, set())
         cache_mock.delete_many.assert_called_with(list(mapproxy_config_keys))
+        mock_invalidate_mapproxy_apps.assert_called_once()
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
 import logging
-from unittest.mock import Mock, patch, MagicMock
+import os
+import shutil
+import tempfile
+from unittest.mock import ANY, Mock, patch, MagicMock
 from uuid import uuid4
 
 import yaml as real_yaml
 from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
 from django.test import TransactionTestCase
 from mapproxy.config.config import load_default_config
+from mapproxy.grid import tile_grid
 
 from eventkit_cloud.jobs.models import DataProvider
 from eventkit_cloud.tasks.enumerations import TaskState
 from eventkit_cloud.utils.mapproxy import (
     MapproxyGeopackage,
+    add_shared_tile_store,
     get_conf_dict,
     get_cache_template,
     CustomLogger,
@@ -20,6 +26,10 @@ from eventkit_cloud.utils.mapproxy import (
     get_footprint_layer_name,
     get_mapproxy_metadata_url,
     get_custom_exp_backoff,
+    create_mapproxy_app,
+    invalidate_mapproxy_apps,
+    seed_tile_cache,
+    get_sub_region_seeds,
 )
 
 logger = logging.getLogger(__name__)
@@ -56,7 +66,7 @@ class TestGeopackage(TransactionTestCase):
         mock_set_gpkg_contents_bounds,
         patch_https,
     ):
-        with self.settings(SSL_VERIFICATION=True):
+        with self.settings(SSL_VERIFICATION=True, TILE_STORE_DIR="/var/lib/eventkit/tile_store"):
             gpkgfile = "/var/lib/eventkit/test.gpkg"
             config = (
                 "layers:\r\n - name: default\r\n   title: imagery\r\n   sources: [default]\r\n\r\nsources:\r\n  "
@@ -106,26 +116,108 @@ class TestGeopackage(TransactionTestCase):
             cache_template.assert_called_once_with(
                 ["imagery"], [grids for grids in json_config.get("grids")], gpkgfile, table_name="imagery"
             )
+            # Tiles are seeded through the provider's shared tile store.
             json_config["caches"] = {
                 "default": {
-                    "sources": ["default"],
+                    "sources": ["shared_tile_store"],
                     "cache": {"type": "geopackage", "filename": "/var/lib/eventkit/test.gpkg"},
                     "grids": ["default"],
-                }
+                },
+                "shared_tile_store": {
+                    "sources": ["default"],
+                    "cache": {"type": "file"},
+                    "cache_dir": ANY,
+                    "grids": ["default"],
+                },
             }
             json_config["services"] = ["demo"]
 
             patch_https.assert_called_once_with(cert_info=None)
             load_config.assert_called_once_with(mapproxy_config, config_dict=json_config)
+            cache_dir = load_config.call_args[1]["config_dict"]["caches"]["shared_tile_store"]["cache_dir"]
+            self.assertTrue(cache_dir.startswith("/var/lib/eventkit/tile_store/imagery/"))
             remove_zoom_levels.assert_called_once_with(gpkgfile)
             mock_set_gpkg_contents_bounds.assert_called_once_with(gpkgfile, "imagery", bbox)
             seed_template.assert_called_once_with(
                 bbox=bbox, coverage_file=None, level_from=0, level_to=10, projection=None
             )
+
+            # Sub-regions are forked from the task's thread instead of through a TaskProcess.
+            self.task_process.reset_mock()
+            with patch.object(w2g, "get_sub_regions", return_value=[({}, 1), ({}, 1)]), patch.object(
+                w2g, "seed_sub_regions"
+            ) as mock_seed_sub_regions:
+                w2g.convert()
+            mock_seed_sub_regions.assert_called_once_with([({}, 1), ({}, 1)], ANY, ANY)
+            self.task_process.assert_not_called()
+
             self.task_process.side_effect = Exception()
             with self.assertRaises(Exception):
                 w2g.convert()
 
+    @patch("eventkit_cloud.utils.mapproxy.close_caches")
+    @patch("eventkit_cloud.utils.mapproxy.connections")
+    @patch("eventkit_cloud.utils.mapproxy.merge_tile_tables")
+    def test_seed_sub_regions(self, mock_merge_tile_tables, mock_connections, mock_close_caches):
+        stage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stage_dir)
+        gpkgfile = os.path.join(stage_dir, "test.gpkg")
+        w2g = MapproxyGeopackage(gpkgfile=gpkgfile, bbox=[-2, -2, 2, 2], task_uid=self.task_uid)
+        progress_logger = Mock()
+
+        def seed_sub_region(mapproxy_geopackage, sub_region_gpkgfile, seed_dict, concurrency, progress, index):
+            # This runs in a forked process, which can only report back through files and the shared progress.
+            if seed_dict.get("fail"):
+                raise Exception("Seeding failed.")
+            with open(sub_region_gpkgfile, "w") as f:
+                f.write(f"{os.getpid()} {concurrency}")
+            progress[index] = 1
+
+        sub_regions = [({"seeds": {"seed": {}}}, 10), ({"seeds": {"seed": {}}}, 30)]
+        with patch.object(MapproxyGeopackage, "seed_sub_region", seed_sub_region):
+            merged = []
+            mock_merge_tile_tables.side_effect = lambda source, destination: merged.append(open(source).read())
+            self.assertEqual(gpkgfile, w2g.seed_sub_regions(sub_regions, {"concurrency": 4}, progress_logger))
+
+            # Each sub-region is seeded by a separate process, with part of the concurrency.
+            with open(gpkgfile) as f:
+                pids = [f.read().split()[0], merged[0].split()[0]]
+            self.assertNotIn(str(os.getpid()), pids)
+            self.assertEqual(2, len(set(pids)))
+            self.assertEqual("2", merged[0].split()[1])
+            mock_merge_tile_tables.assert_called_once_with(os.path.join(stage_dir, "test-1.gpkg"), gpkgfile)
+            self.assertFalse(os.path.exists(os.path.join(stage_dir, "test-1.gpkg")))
+            # The connections of this thread are closed before forking.
+            mock_connections.close_all.assert_called()
+            mock_close_caches.assert_called()
+            progress_logger.log_step.assert_called()
+
+            mock_merge_tile_tables.reset_mock()
+            sub_regions[1][0]["fail"] = True
+            with self.assertRaisesRegex(Exception, "sub-regions \\[1\\]"):
+                w2g.seed_sub_regions(sub_regions, {"concurrency": 4}, progress_logger)
+            mock_merge_tile_tables.assert_not_called()
+
+    def test_use_tile_store(self):
+        w2g = MapproxyGeopackage(gpkgfile="/test.gpkg", bbox=[-2, -2, 2, 2], name="imagery", task_uid=self.task_uid)
+        with self.settings(TILE_STORE_DIR="/var/lib/eventkit/tile_store"):
+            with patch("eventkit_cloud.jobs.models.RegionalPolicy") as mock_regional_policy:
+                mock_regional_policy.objects.filter.return_value.exists.return_value = False
+                self.assertTrue(w2g.use_tile_store())
+
+                # AOIs within a regional policy are seeded from the upstream service.
+                mock_regional_policy.objects.filter.return_value.exists.return_value = True
+                self.assertFalse(w2g.use_tile_store())
+
+                # Reprojected exports are seeded from the input geopackage.
+                mock_regional_policy.objects.filter.return_value.exists.return_value = False
+                w2g.projection = 3857
+                self.assertFalse(w2g.use_tile_store())
+
+        with self.settings(TILE_STORE_DIR=""):
+            w2g.projection = None
+            self.assertFalse(w2g.use_tile_store())
+
 
 class TestHelpers(TransactionTestCase):
     def get_cache_template(self):
@@ -199,6 +291,163 @@ class TestHelpers(TransactionTestCase):
         mock_get_cached_model.assert_called_once_with(model=DataProvider, prop="slug", value=slug)
         self.assertEquals(returned_conf, expected_config)
 
+    @patch("eventkit_cloud.utils.mapproxy.auth_requests")
+    @patch("eventkit_cloud.utils.mapproxy.MapProxyApp")
+    @patch("eventkit_cloud.utils.mapproxy.ProxyConfiguration")
+    @patch("eventkit_cloud.utils.mapproxy.load_config")
+    @patch("eventkit_cloud.utils.mapproxy.add_restricted_regions_to_config")
+    @patch("eventkit_cloud.utils.mapproxy.get_conf_dict")
+    def test_create_mapproxy_app(
+        self,
+        mock_get_conf_dict,
+        mock_add_restricted_regions,
+        mock_load_config,
+        mock_proxy_configuration,
+        mock_mapproxy_app,
+        mock_auth_requests,
+    ):
+        slug = "slug"
+        conf_dict = {"sources": {"default": {}}, "cert_info": {"cert_path": "/path"}, "cred_var": "CRED"}
+        mock_get_conf_dict.return_value = conf_dict
+        mock_add_restricted_regions.side_effect = lambda base_config, config, *args: (base_config, config)
+        test_cache = LocMemCache("test_create_mapproxy_app", {})
+
+        with patch("eventkit_cloud.utils.mapproxy.cache", test_cache):
+            invalidate_mapproxy_apps()
+            app = create_mapproxy_app(slug)
+            # The configured app is reused, but the provider's certs are still patched in for each request.
+            self.assertIs(app, create_mapproxy_app(slug))
+            mock_proxy_configuration.assert_called_once()
+            mock_mapproxy_app.assert_called_once()
+            mock_auth_requests.patch_https.assert_called_with(cert_info=conf_dict["cert_info"])
+            self.assertEqual(2, mock_auth_requests.patch_https.call_count)
+            mock_auth_requests.patch_mapproxy_opener_cache.assert_called_with(slug=slug, cred_var="CRED")
+
+            # Invalidating the apps (e.g. when a provider or region is saved) rebuilds them.
+            invalidate_mapproxy_apps()
+            self.assertIsNot(app, create_mapproxy_app(slug))
+            self.assertEqual(2, mock_mapproxy_app.call_count)
+
+            # Apps are also rebuilt once their configuration leaves the cache.
+            test_cache.clear()
+            create_mapproxy_app(slug)
+            self.assertEqual(3, mock_mapproxy_app.call_count)
+
+    @patch("eventkit_cloud.utils.mapproxy.connections")
+    @patch("eventkit_cloud.utils.mapproxy.auth_requests")
+    @patch("eventkit_cloud.utils.mapproxy.seeder")
+    @patch("eventkit_cloud.utils.mapproxy.SeedingConfiguration")
+    @patch("eventkit_cloud.utils.mapproxy.ProxyConfiguration")
+    @patch("eventkit_cloud.utils.mapproxy.get_mapproxy_app_config")
+    @patch("eventkit_cloud.utils.mapproxy.get_conf_dict")
+    def test_seed_tile_cache(
+        self,
+        mock_get_conf_dict,
+        mock_get_mapproxy_app_config,
+        mock_proxy_configuration,
+        mock_seeding_configuration,
+        mock_seeder,
+        mock_auth_requests,
+        mock_connections,
+    ):
+        slug = "slug"
+        mock_get_conf_dict.return_value = {"sources": {"default": {}}, "concurrency": 3}
+        with patch("eventkit_cloud.utils.mapproxy.cache", LocMemCache("test_seed_tile_cache", {})):
+            seed_tile_cache(slug, [([-180, -90, 180, 90], 0, 4), ([1, 2, 3, 4], 5, 12)])
+
+        expected_seed_dict = {
+            "coverages": {
+                "coverage-0": {"srs": "EPSG:4326", "bbox": [-180, -90, 180, 90]},
+                "coverage-1": {"srs": "EPSG:4326", "bbox": [1, 2, 3, 4]},
+            },
+            "seeds": {
+                "seed-0": {"caches": [slug], "coverages": ["coverage-0"], "levels": {"from": 0, "to": 4}},
+                "seed-1": {"caches": [slug], "coverages": ["coverage-1"], "levels": {"from": 5, "to": 12}},
+            },
+        }
+        mock_get_mapproxy_app_config.assert_called_once_with(slug, mock_get_conf_dict.return_value)
+        mock_seeding_configuration.assert_called_once_with(
+            expected_seed_dict, mapproxy_conf=mock_proxy_configuration.return_value
+        )
+        mock_seeding_configuration.return_value.seeds.assert_called_once_with(["seed-0", "seed-1"])
+        self.assertEqual(3, mock_seeder.seed.call_args[1]["concurrency"])
+        mock_auth_requests.patch_https.assert_called_once_with(cert_info=None)
+        mock_connections.close_all.assert_called_once()
+
+    def test_add_shared_tile_store(self):
+        def get_cache_dir(url):
+            conf_dict = {
+                "sources": {"imagery": {"type": "tile", "url": url, "grid": "default"}},
+                "grids": {"default": {"srs": "EPSG:4326", "tile_size": [256, 256], "origin": "nw"}},
+                "caches": {"default": {"sources": ["imagery"], "grids": ["default"], "cache": {"type": "geopackage"}}},
+            }
+            with self.settings(TILE_STORE_DIR="/tile_store"):
+                add_shared_tile_store(conf_dict, "imagery")
+            self.assertEqual(["shared_tile_store"], conf_dict["caches"]["default"]["sources"])
+            return conf_dict["caches"]["shared_tile_store"]["cache_dir"]
+
+        cache_dir = get_cache_dir("http://tiles/%(z)s/%(x)s/%(y)s.png")
+        self.assertTrue(cache_dir.startswith("/tile_store/imagery/"))
+        self.assertEqual(cache_dir, get_cache_dir("http://tiles/%(z)s/%(x)s/%(y)s.png"))
+        # Tiles from a different source aren't mixed with the old ones.
+        self.assertNotEqual(cache_dir, get_cache_dir("http://other-tiles/%(z)s/%(x)s/%(y)s.png"))
+
+    def test_get_sub_region_seeds(self):
+        grid = tile_grid(4326, origin="nw")
+        # Small areas aren't split.
+        self.assertEqual([], get_sub_region_seeds([-0.01, -0.01, 0.01, 0.01], 0, 3, 4, grid))
+        self.assertEqual([], get_sub_region_seeds([-20, -20, 20, 20], 0, 10, 1, grid))
+
+        sub_regions = get_sub_region_seeds(
+            [-20, -20, 20, 20], 0, 10, 4, grid, meta_size=[4, 4], coverage_file="/path/to/selection.geojson"
+        )
+        self.assertEqual(4, len(sub_regions))
+        seed_dicts = [seed_dict for seed_dict, _ in sub_regions]
+
+        # The levels which are too small to split are only seeded in the first sub-region.
+        self.assertEqual({"from": 8, "to": 10}, seed_dicts[0]["seeds"]["seed-0"]["levels"])
+        self.assertEqual({"from": 0, "to": 7}, seed_dicts[0]["seeds"]["seed-1"]["levels"])
+        for seed_dict in seed_dicts[1:]:
+            self.assertEqual(["seed-0"], list(seed_dict["seeds"].keys()))
+            self.assertEqual({"from": 8, "to": 10}, seed_dict["seeds"]["seed-0"]["levels"])
+
+        # The strips cover the whole bbox, are snapped to the 5.625 degree meta tiles of level 8, and are intersected
+        # with the selection.
+        strips = [seed_dict["coverages"]["geom-0"]["intersection"][0]["bbox"] for seed_dict in seed_dicts]
+        self.assertEqual(
+            [[-20, -20, -11.25, 20], [-11.25, -20, 0, 20], [0, -20, 11.25, 20], [11.25, -20, 20, 20]], strips
+        )
+        self.assertEqual(
+            "/path/to/selection.geojson", seed_dicts[1]["coverages"]["geom-0"]["intersection"][1]["datasource"]
+        )
+        self.assertGreater(sub_regions[0][1], sub_regions[1][1])
+
+        # The strips are in the SRS of the grid.
+        sub_regions = get_sub_region_seeds([-20, -20, 20, 20], 0, 10, 2, tile_grid(3857, origin="nw"))
+        self.assertEqual(2, len(sub_regions))
+        self.assertEqual("EPSG:3857", sub_regions[0][0]["coverages"]["geom-0"]["srs"])
+        self.assertAlmostEqual(0, sub_regions[1][0]["coverages"]["geom-0"]["bbox"][0], places=3)
+
+    @patch("eventkit_cloud.utils.mapproxy.get_sub_region_seeds")
+    def test_get_sub_regions(self, mock_get_sub_region_seeds):
+        w2g = MapproxyGeopackage(gpkgfile="/test.gpkg", bbox=[-2, -2, 2, 2], name="imagery", task_uid=self.task_uid)
+        mapproxy_configuration = MagicMock()
+        mapproxy_configuration.globals.get_value.return_value = [4, 4]
+
+        # A provider with a concurrency of one isn't split.
+        self.assertEqual([], w2g.get_sub_regions({"concurrency": 1, "processes": 4}, mapproxy_configuration))
+        mock_get_sub_region_seeds.assert_not_called()
+
+        # There are never more processes than the provider's concurrency.
+        for conf_dict, expected_processes in [
+            ({"concurrency": 4}, 4),
+            ({"concurrency": 4, "processes": 2}, 2),
+            ({"concurrency": 2, "processes": 8}, 2),
+        ]:
+            w2g.get_sub_regions(conf_dict, mapproxy_configuration)
+            self.assertEqual(expected_processes, mock_get_sub_region_seeds.call_args[0][3])
+        self.assertEqual([4, 4], mock_get_sub_region_seeds.call_args[1]["meta_size"])
+
     def test_get_footprint_layer_name(self):
         example_slug = "test"
         expected_value = f"{example_slug}-footprint"
@@ -251,7 +500,14 @@ class TestLogger(TransactionTestCase):
         mock_progress = MagicMock()
         mock_progress.progress = test_progress
         custom_logger.log_step(mock_progress)
-        mock_update_progress.assert_called_with(test_task_uid, progress=test_progress * 100, eta=custom_logger.eta)
+        mock_update_progress.assert_called_with(
+            test_task_uid,
+            progress=test_progress * 100,
+            subtask_percentage=100.0,
+            subtask_start=0,
+            eta=custom_logger.eta,
+            msg=None,
+        )
 
         with self.assertRaises(Exception):
             mock_get_cache_value.return_value = TaskState.CANCELED.value
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.test import TestCase
+
+from eventkit_cloud.utils.osm_extract_cache import OSMExtractCache
+
+
+class TestOSMExtractCache(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.source_file = os.path.join(self.cache_dir, "source")
+        with open(self.source_file, "w") as source_file:
+            source_file.write("data")
+        self.output_file = os.path.join(self.cache_dir, "output")
+
+    def get_cache(self, query="query", timestamp="2020-01-01T00:00:00Z"):
+        return OSMExtractCache("osm", query, timestamp, cache_dir=self.cache_dir)
+
+    @patch("eventkit_cloud.utils.osm_extract_cache.clip_pbf_file")
+    def test_pbf(self, mock_clip_pbf_file):
+        extract_cache = self.get_cache()
+        self.assertIsNone(extract_cache.get_pbf([0, 0, 1, 1], self.output_file))
+
+        extract_cache.add_pbf([0, 0, 2, 2], self.source_file)
+        extract_cache.add_pbf([0, 0, 1, 1], self.source_file)
+
+        # The same bbox is copied.
+        self.assertEqual(self.output_file, extract_cache.get_pbf([0, 0, 1, 1], self.output_file))
+        with open(self.output_file) as output_file:
+            self.assertEqual("data", output_file.read())
+        mock_clip_pbf_file.assert_not_called()
+
+        # The smallest enclosing extract is clipped.
+        self.assertEqual(self.output_file, extract_cache.get_pbf([0.5, 0.5, 1, 1], self.output_file))
+        entries = {path: metadata for metadata, path in extract_cache.get_entries("pbf", extract_cache.query_hash)}
+        clipped_file, bbox, output_file = mock_clip_pbf_file.call_args[0]
+        self.assertEqual([0, 0, 1, 1], entries[clipped_file]["bbox"])
+        self.assertEqual(([0.5, 0.5, 1, 1], self.output_file), (bbox, output_file))
+
+        # Extracts aren't used for larger areas or other queries.
+        self.assertIsNone(extract_cache.get_pbf([0, 0, 3, 3], self.output_file))
+        self.assertIsNone(self.get_cache(query="other query").get_pbf([0, 0, 1, 1], self.output_file))
+
+        # Outdated extracts are removed.
+        self.assertIsNone(self.get_cache(timestamp="2020-01-02T00:00:00Z").get_pbf([0, 0, 1, 1], self.output_file))
+        self.assertEqual([], os.listdir(os.path.join(self.cache_dir, "osm")))
+
+    def test_gpkg(self):
+        extract_cache = self.get_cache()
+        geometry = GEOSGeometry(Polygon.from_bbox((0, 0, 1, 1)), srid=4326)
+        self.assertIsNone(extract_cache.get_gpkg(geometry, "config", self.output_file))
+
+        extract_cache.add_gpkg(geometry, "config", self.source_file)
+
+        self.assertEqual(self.output_file, extract_cache.get_gpkg(geometry, "config", self.output_file))
+        self.assertIsNone(extract_cache.get_gpkg(geometry, "other config", self.output_file))
+        other_geometry = GEOSGeometry(Polygon.from_bbox((0, 0, 0.5, 0.5)), srid=4326)
+        self.assertIsNone(extract_cache.get_gpkg(other_geometry, "config", self.output_file))
+
+    def test_disabled(self):
+        extract_cache = self.get_cache(timestamp=None)
+        self.assertFalse(extract_cache.enabled)
+        self.assertIsNone(extract_cache.add_pbf([0, 0, 1, 1], self.source_file))
+        self.assertIsNone(extract_cache.get_pbf([0, 0, 1, 1], self.output_file))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, "osm")))
@@ -101,3 +101,69 @@ class TestOverpass(TestCase):
         self.assertEqual(data, expected)
         f.close()
         os.remove(out)
+
+    @patch("eventkit_cloud.utils.overpass.OSMToPBF")
+    @patch("django.db.connection.close")
+    @patch("eventkit_cloud.tasks.models.ExportTaskRecord")
+    @patch("requests.Session.post")
+    def test_run_query_to_pbf(self, mock_post, export_task, mock_close, mock_osm_to_pbf):
+        export_task.objects.get.return_value = Mock(progress=0, estimated_finish=None)
+        op = Overpass(stage_dir=self.path + "/files/", task_uid=1, bbox=self.bbox, job_name="testjob", slug="testslug")
+        pbf_filename = self.path + "/files/query.pbf"
+        sample_data = [b"<osm>", b"some data</osm>"]
+        mock_response = Mock(headers={"content-length": 20})
+        mock_response.iter_content.return_value = sample_data
+        mock_post.return_value = mock_response
+        streamed_data = []
+        mock_osm_to_pbf.return_value.convert_stream.side_effect = lambda chunks, **kwargs: streamed_data.extend(chunks)
+
+        op.run_query(pbf_filename=pbf_filename)
+
+        mock_osm_to_pbf.assert_called_once_with(pbffile=pbf_filename, task_uid=1)
+        self.assertEqual(sample_data, streamed_data)
+        mock_response.close.assert_called_once()
+        self.assertFalse(os.path.exists(self.path + "/files/query.osm"))
+
+    @patch("eventkit_cloud.utils.overpass.get_chunked_bbox")
+    def test_get_partitions(self, mock_get_chunked_bbox):
+        overpass = Overpass(stage_dir=self.path + "/files/", bbox=self.bbox, job_name="testjob")
+        self.assertEqual([self.bbox], overpass.get_partitions())
+        mock_get_chunked_bbox.assert_not_called()
+
+        bbox = [-10.0, 5.0, -7.5, 6.5]
+        mock_get_chunked_bbox.return_value = [(-10.0, 5.5, -9.0, 6.5), (-8.0, 4.5, -7.0, 5.5), (-7.5, 4.5, -7.0, 5.5)]
+        config = yaml.dump({"partition_size": 1})
+        overpass = Overpass(stage_dir=self.path + "/files/", bbox=bbox, job_name="testjob", config=config)
+        self.assertEqual([[-10.0, 5.5, -9.0, 6.5], [-8.0, 5.0, -7.5, 5.5]], overpass.get_partitions())
+        mock_get_chunked_bbox.assert_called_once_with(bbox, size=(768, 512))
+
+        with self.settings(OVERPASS_PARTITION_SIZE=0):
+            overpass = Overpass(stage_dir=self.path + "/files/", bbox=bbox, job_name="testjob")
+        self.assertEqual([bbox], overpass.get_partitions())
+
+    @patch("eventkit_cloud.utils.overpass.os")
+    @patch("eventkit_cloud.utils.overpass.merge_pbf_files")
+    @patch("eventkit_cloud.utils.overpass.OSMToPBF")
+    @patch("eventkit_cloud.tasks.helpers.update_progress")
+    def test_run_partitioned_query(self, mock_update_progress, mock_osm_to_pbf, mock_merge_pbf_files, mock_os):
+        mock_os.path.splitext.side_effect = os.path.splitext
+        mock_os.path.isfile.side_effect = lambda path: path == "/stage/query_1.pbf"
+        mock_merge_pbf_files.return_value = "/stage/query.pbf"
+        partitions = [[-10.0, 5.0, -9.0, 6.0], [-9.0, 5.0, -8.0, 6.0]]
+        config = yaml.dump({"concurrency": 2})
+        op = Overpass(stage_dir="/stage", task_uid=1, bbox=[-10.0, 5.0, -8.0, 6.0], job_name="testjob", config=config)
+
+        with patch.object(Overpass, "get_partitions", return_value=partitions), patch.object(
+            Overpass, "get_query_data"
+        ) as mock_get_query_data:
+            pbf_filepath = op.run_query(pbf_filename="/stage/query.pbf")
+
+        self.assertEqual("/stage/query.pbf", pbf_filepath)
+        # The second partition was queried by a previous attempt, so only the first one is queried.
+        mock_get_query_data.assert_called_once()
+        self.assertIn("relation(5.0,-10.0,6.0,-9.0)", mock_get_query_data.call_args[1]["query"])
+        mock_osm_to_pbf.assert_called_once_with(pbffile="/stage/query_0.pbf.part", task_uid=1)
+        mock_os.replace.assert_called_once_with("/stage/query_0.pbf.part", "/stage/query_0.pbf")
+        mock_merge_pbf_files.assert_called_once_with(
+            ["/stage/query_0.pbf", "/stage/query_1.pbf"], "/stage/query.pbf", task_uid=1
+        )
@@ -5,7 +5,7 @@ from uuid import uuid4
 
 from django.test import TransactionTestCase
 
-from eventkit_cloud.utils.pbf import OSMToPBF
+from eventkit_cloud.utils.pbf import OSMToPBF, clip_pbf_file, merge_pbf_files
 
 logger = logging.getLogger(__name__)
 
@@ -36,3 +36,61 @@ class TestOSMToPBF(TransactionTestCase):
         self.task_process.return_value = Mock(exitcode=1)
         with self.assertRaises(Exception):
             o2p.convert()
+
+    def test_convert_stream(self):
+        pbffile = "/path/to/sample.pbf"
+        osm_chunks = [b"<osm>", b"</osm>"]
+        self.task_process.return_value = Mock(exitcode=0)
+        o2p = OSMToPBF(pbffile=pbffile, task_uid=self.task_uid)
+        with patch("audit_logging.file_logging.logging_open") as mock_logging_open:
+            out = o2p.convert_stream(osm_chunks)
+            mock_logging_open.assert_called_once_with(pbffile, "wb", user_details=None)
+            self.task_process().stream_process.assert_called_once_with(
+                ["osmconvert", "-", "--out-pbf"],
+                input_chunks=osm_chunks,
+                output=mock_logging_open.return_value.__enter__.return_value,
+            )
+            self.assertEqual(out, pbffile)
+
+            self.task_process.return_value = Mock(exitcode=1)
+            with self.assertRaises(Exception):
+                o2p.convert_stream(osm_chunks)
+
+        with self.assertRaises(ValueError):
+            OSMToPBF(task_uid=self.task_uid)
+
+    def test_merge_pbf_files(self):
+        self.task_process.return_value = Mock(exitcode=0)
+        out = merge_pbf_files(["/path/to/a.pbf", "/path/to/b.pbf"], "/path/to/out.pbf", task_uid=self.task_uid)
+        self.task_process().start_process.assert_called_once_with(
+            ["osmconvert", "/path/to/a.pbf", "/path/to/b.pbf", "--out-pbf", "-o=/path/to/out.pbf"],
+            stderr=-1,
+            stdout=-1,
+        )
+        self.assertEqual("/path/to/out.pbf", out)
+
+        self.task_process.return_value = Mock(exitcode=1)
+        with self.assertRaises(Exception):
+            merge_pbf_files(["/path/to/a.pbf", "/path/to/b.pbf"], "/path/to/out.pbf")
+
+    def test_clip_pbf_file(self):
+        self.task_process.return_value = Mock(exitcode=0)
+        out = clip_pbf_file("/path/to/planet.pbf", [-1, -2, 1, 2], "/path/to/out.pbf", task_uid=self.task_uid)
+        self.task_process().start_process.assert_called_once_with(
+            [
+                "osmconvert",
+                "/path/to/planet.pbf",
+                "-b=-1,-2,1,2",
+                "--complete-ways",
+                "--complete-multipolygons",
+                "--out-pbf",
+                "-o=/path/to/out.pbf",
+            ],
+            stderr=-1,
+            stdout=-1,
+        )
+        self.assertEqual("/path/to/out.pbf", out)
+
+        self.task_process.return_value = Mock(exitcode=1)
+        with self.assertRaises(Exception):
+            clip_pbf_file("/path/to/planet.pbf", [-1, -2, 1, 2], "/path/to/out.pbf")
@@ -1,11 +1,20 @@
 import os
-from unittest.mock import patch, mock_open, Mock, MagicMock
+import shutil
+import tempfile
+from unittest.mock import patch, ANY, Mock, MagicMock
 
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.test import TestCase
 from django.test.utils import override_settings
 
-from eventkit_cloud.utils.s3 import delete_from_s3, upload_to_s3, get_presigned_url
+from eventkit_cloud.utils.s3 import (
+    delete_from_s3,
+    download_folder_from_s3,
+    get_file_checksum,
+    get_presigned_url,
+    upload_to_s3,
+)
 
 
 @override_settings(AWS_STORAGE_BUCKET_NAME="test-bucket")
@@ -21,20 +30,90 @@ class TestS3Util(TestCase):
         self._asset_path = os.path.join(settings.EXPORT_DOWNLOAD_ROOT, self._uuid, self._filename)
         self._path = "%s/%s" % (self._uuid, self._filename)
 
-    @patch("eventkit_cloud.utils.s3.os.path.isfile")
+    @patch("eventkit_cloud.utils.s3.get_file_checksum")
     @patch("eventkit_cloud.utils.s3.get_s3_client")
-    def test_upload_to_s3(self, mock_get_s3_client, mock_isfile):
+    def test_upload_to_s3(self, mock_get_s3_client, mock_get_file_checksum):
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        example_filename = os.path.join(staging_root, self._filename)
+        with open(example_filename, "wb") as f:
+            f.write(b"data" * 1024)
+        checksum = get_file_checksum(example_filename)
+        mock_get_file_checksum.return_value = checksum
+
+        def upload_fileobj(Fileobj=None, **kwargs):
+            # Reading part of the file again (e.g. a retried part) doesn't change the checksum.
+            Fileobj.read(1000)
+            Fileobj.seek(500)
+            while Fileobj.read(1000):
+                pass
+
         mock_client = MagicMock()
         mock_get_s3_client.return_value = mock_client
-        example_filename = os.path.join(settings.EXPORT_STAGING_ROOT, self._uuid, self._filename)
+        mock_client.upload_fileobj.side_effect = upload_fileobj
+        mock_client.head_object.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
         expected_download_path = f"{self._uuid}/{self._filename}"
-        with patch("audit_logging.file_logging.logging_open", mock_open(read_data="test"), create=True):
+        with patch("audit_logging.file_logging.logging_open", create=True) as mock_logging_open:
+            mock_logging_open.side_effect = lambda path, mode, user_details=None: open(path, mode)
+            upload_to_s3(example_filename, expected_download_path)
+
+            # New files are only read by the upload.
+            mock_get_file_checksum.assert_not_called()
+            mock_client.upload_fileobj.assert_called_once()
+            _, kwargs = mock_client.upload_fileobj.call_args
+            self.assertEqual(settings.AWS_S3_MAX_CONCURRENCY, kwargs["Config"].max_concurrency)
+            mock_client.put_object_tagging.assert_called_once_with(
+                Bucket="test-bucket",
+                Key=expected_download_path,
+                Tagging={"TagSet": [{"Key": "sha256", "Value": checksum}]},
+            )
+            mock_client.generate_presigned_url.assert_called_once_with(
+                "get_object", Params={"Bucket": "test-bucket", "Key": expected_download_path}
+            )
+
+            # Objects of a different size are replaced without hashing the file.
+            mock_client.head_object.side_effect = None
+            mock_client.head_object.return_value = {"ContentLength": 10}
+            upload_to_s3(example_filename, expected_download_path)
+            mock_get_file_checksum.assert_not_called()
+            self.assertEqual(2, mock_client.upload_fileobj.call_count)
+
+            # The same file isn't uploaded again.
+            mock_client.head_object.return_value = {"ContentLength": 4096}
+            mock_client.get_object_tagging.return_value = {"TagSet": [{"Key": "sha256", "Value": checksum}]}
             upload_to_s3(example_filename, expected_download_path)
+            mock_get_file_checksum.assert_called_once_with(example_filename)
+            self.assertEqual(2, mock_client.upload_fileobj.call_count)
 
-        mock_client.upload_fileobj.assert_called_once()
-        mock_isfile.assert_called_once_with(example_filename)
-        mock_client.generate_presigned_url.assert_called_once_with(
-            "get_object", Params={"Bucket": "test-bucket", "Key": expected_download_path}
+    @patch("eventkit_cloud.utils.s3.get_s3_client")
+    def test_download_folder_from_s3(self, mock_get_s3_client):
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        existing_file = os.path.join(staging_root, "run", "osm", "existing.gpkg")
+        os.makedirs(os.path.dirname(existing_file))
+        with open(existing_file, "w") as f:
+            f.write("data")
+
+        mock_client = MagicMock()
+        mock_get_s3_client.return_value = mock_client
+        mock_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "run/osm/new.gpkg", "Size": 4}, {"Key": "run/run.zip", "Size": 4}]},
+            {"Contents": [{"Key": "run/osm/existing.gpkg", "Size": 4}]},
+        ]
+        mock_client.head_object.return_value = {"ContentLength": 4}
+        mock_client.get_object_tagging.return_value = {
+            "TagSet": [{"Key": "sha256", "Value": get_file_checksum(existing_file)}]
+        }
+
+        with self.settings(EXPORT_STAGING_ROOT=staging_root):
+            download_folder_from_s3("run")
+
+        # Only the new file is downloaded, the zip file is skipped and the existing file has the same checksum.
+        mock_client.download_file.assert_called_once_with(
+            Bucket="test-bucket",
+            Key="run/osm/new.gpkg",
+            Filename=os.path.join(staging_root, "run/osm/new.gpkg"),
+            Config=ANY,
         )
 
     @patch("eventkit_cloud.utils.s3.get_s3_client")
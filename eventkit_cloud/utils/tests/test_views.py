@@ -0,0 +1,76 @@
+import logging
+from unittest.mock import patch, Mock, MagicMock
+
+from django.test import TestCase, RequestFactory
+
+from eventkit_cloud.utils.views import map
+
+logger = logging.getLogger(__name__)
+
+
+class TestViews(TestCase):
+    def setUp(self):
+        self.request_factory = RequestFactory()
+        self.environs = []
+        self.body = MagicMock()
+        self.body.__iter__.return_value = iter([b"tile", b"data"])
+
+        def tile_app(environ, start_response):
+            self.environs.append(environ)
+            headers = [("Content-Type", "image/png"), ("ETag", '"abc"')]
+            start_response("200 OK", headers + [("Last-Modified", "Wed, 21 Oct 2020 07:28:00 GMT")])
+            return self.body
+
+        self.tile_app = tile_app
+
+    @patch("eventkit_cloud.utils.views.create_mapproxy_app")
+    def test_map(self, mock_create_mapproxy_app):
+        mock_create_mapproxy_app.return_value = Mock(app=self.tile_app)
+        request = self.request_factory.get("/map/slug/wmts/slug/default/0/0/0.png")
+
+        response = map(request, "slug", "/wmts/slug/default/0/0/0.png")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"tiledata", b"".join(response.streaming_content))
+        self.assertEqual("image/png", response["Content-Type"])
+        self.assertEqual("/map/slug", self.environs[0]["SCRIPT_NAME"])
+        self.assertEqual("/wmts/slug/default/0/0/0.png", self.environs[0]["PATH_INFO"])
+
+    @patch("eventkit_cloud.utils.views.create_mapproxy_app")
+    def test_map_not_modified(self, mock_create_mapproxy_app):
+        mock_create_mapproxy_app.return_value = Mock(app=self.tile_app)
+        conditional_headers = [
+            {"HTTP_IF_NONE_MATCH": '"xyz", "abc"'},
+            {"HTTP_IF_NONE_MATCH": 'W/"abc"'},
+            {"HTTP_IF_MODIFIED_SINCE": "Wed, 21 Oct 2020 07:28:00 GMT"},
+        ]
+        for headers in conditional_headers:
+            self.body.close.reset_mock()
+            request = self.request_factory.get("/map/slug/wmts/slug/default/0/0/0.png", **headers)
+
+            response = map(request, "slug", "/wmts/slug/default/0/0/0.png")
+
+            self.assertEqual(304, response.status_code)
+            self.assertEqual('"abc"', response["ETag"])
+            self.body.close.assert_called_once()
+
+        request = self.request_factory.get("/map/slug/wmts/slug/default/0/0/0.png", HTTP_IF_NONE_MATCH='"xyz"')
+        self.assertEqual(200, map(request, "slug", "/wmts/slug/default/0/0/0.png").status_code)
+
+    @patch("eventkit_cloud.utils.views.get_map_query")
+    @patch("eventkit_cloud.utils.views.get_cached_model")
+    @patch("eventkit_cloud.utils.views.create_mapproxy_app")
+    def test_map_get_feature_info(self, mock_create_mapproxy_app, mock_get_cached_model, mock_get_map_query):
+        mock_create_mapproxy_app.return_value = Mock(app=self.tile_app)
+        mock_get_cached_model.return_value = Mock(metadata={"type": "arcgis"})
+        mock_get_map_query.return_value.return_value.get_geojson.side_effect = lambda response: response
+        request = self.request_factory.get("/map/slug/service", {"REQUEST": "GetFeatureInfo"})
+
+        response = map(request, "slug", "/service")
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(b"tiledata", response.content)
+        self.assertEqual("8", response["Content-length"])
+        mock_get_map_query.assert_called_once_with("arcgis")
+        self.body.close.assert_called_once()
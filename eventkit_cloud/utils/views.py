@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 """UI view definitions."""
 from logging import getLogger
+from typing import Callable, Iterable, List, Tuple
 from urllib.parse import parse_qs
 
 from django.http.request import HttpRequest
-from django.http.response import HttpResponse
+from django.http.response import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
 
 from eventkit_cloud.core.helpers import get_cached_model
 from eventkit_cloud.tasks.models import DataProvider
@@ -14,9 +17,31 @@ from eventkit_cloud.utils.mapproxy import create_mapproxy_app
 logger = getLogger(__file__)
 
 
+def call_wsgi_app(app: Callable, environ: dict) -> Tuple[int, List[Tuple[str, str]], Iterable[bytes]]:
+    """
+    Calls a WSGI app without reading the response body.
+    :param app: The WSGI app.
+    :param environ: The WSGI environ for the request.
+    :return: A tuple of the status code, the headers, and the (unread) response body.
+    """
+    response_start = {}
+    written = []
+
+    def start_response(status, headers, exc_info=None):
+        response_start["status"] = int(status.split(" ", 1)[0])
+        response_start["headers"] = headers
+        return written.append
+
+    body = app(environ, start_response)
+    if written:
+        body = written + list(body)
+    return response_start["status"], response_start["headers"], body
+
+
 def map(request: HttpRequest, slug: str, path: str) -> HttpResponse:
     """
     Makes a proxy request to mapproxy used to get map tiles.
+    The request environ is passed straight to the MapProxy app, and the response is streamed back to the client.
     :param request: The httprequest.
     :param slug: A string matching the slug of a DataProvider.
     :param path: The rest of the url context (i.e. path to the tile some_service/0/0/0.png).
@@ -24,14 +49,17 @@ def map(request: HttpRequest, slug: str, path: str) -> HttpResponse:
     """
     mapproxy_app = create_mapproxy_app(slug, request.user)
     params = parse_qs(request.META["QUERY_STRING"])
-    script_name = f"/map/{slug}"
-    mp_response = mapproxy_app.get(
-        path, params, request.headers, extra_environ=dict(SCRIPT_NAME=script_name), expect_errors=True
-    )
-    response = HttpResponse(mp_response.body, status=mp_response.status_int)
-    for header, value in mp_response.headers.items():
-        response[header] = value
+    environ = dict(request.META, SCRIPT_NAME=f"/map/{slug}", PATH_INFO=path)
+    status, headers, body = call_wsgi_app(mapproxy_app.app, environ)
+
     if params.get("REQUEST") == ["GetFeatureInfo"]:
+        try:
+            response = HttpResponse(b"".join(body), status=status)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        for header, value in headers:
+            response[header] = value
         provider = get_cached_model(DataProvider, "slug", slug)
         if response.status_code in [200, 202]:
             try:
@@ -47,5 +75,23 @@ def map(request: HttpRequest, slug: str, path: str) -> HttpResponse:
             else:
                 response.content = "No data is available for this service."
 
-    response["Content-length"] = len(response.content)
+        response["Content-length"] = len(response.content)
+        return response
+
+    response = StreamingHttpResponse(body, status=status)
+    for header, value in headers:
+        response[header] = value
+
+    # MapProxy only matches the exact ETag, so let clients and proxies revalidate with any of the conditional headers.
+    if response.status_code == 200 and (response.has_header("ETag") or response.has_header("Last-Modified")):
+        conditional_response = get_conditional_response(
+            request,
+            etag=response.get("ETag"),
+            last_modified=parse_http_date_safe(response.get("Last-Modified")),
+            response=response,
+        )
+        if conditional_response is not response:
+            if hasattr(body, "close"):
+                body.close()
+            return conditional_response
     return response
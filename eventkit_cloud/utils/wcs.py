@@ -166,7 +166,10 @@ class WCSConverter(object):
 
         geotiffs = []
         session = get_or_update_session(
-            cert_info=self.config.get("cert_info"), slug=self.slug, headers=self.config.get("headers")
+            cert_info=self.config.get("cert_info"),
+            slug=self.slug,
+            headers=self.config.get("headers"),
+            pool_size=self.config.get("concurrency"),
         )
         for idx, coverage in enumerate(coverages):
             params["COVERAGE"] = coverage